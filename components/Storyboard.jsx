@@ -69,6 +69,7 @@ const Storyboard = ({
         actions.updatePage({
           page_index: inpaintTarget.page_index,
           image_url: result.data.imageUrl,
+          variants: result.data.variants || null,
           edit_prompt: prompt,
           edit_strength: strength,
           last_edited: new Date().toISOString()
@@ -256,7 +257,7 @@ const PageCard = ({
           // 已生成图片
           <>
             <img
-              src={page.image_url}
+              src={page.variants?.thumb || page.image_url}
               alt={`第${pageIndex}页`}
               className="w-full h-full object-cover"
             />
@@ -35,7 +35,7 @@ export default async function handler(req, res) {
       frameKeys: req.body?.frame ? Object.keys(req.body.frame) : []
     });
 
-    const { prompt, frame, chineseDescription, style, config } = req.body;
+    const { prompt, frame, chineseDescription, style, config, use_cache } = req.body;
     const actualPrompt = prompt || frame?.prompt || frame?.jimengPrompt;
 
     console.log(`📝 [API代理-${requestId}] 提取的数据:`, {
@@ -68,6 +68,9 @@ export default async function handler(req, res) {
       prompt: actualPrompt,
       frame: frame
     };
+    if (use_cache !== undefined) {
+      requestData.use_cache = use_cache;
+    }
 
     console.log(`📤 [API代理-${requestId}] 发送到Python后端:`, {
       url: `${PYTHON_BACKEND_URL}/api/generate-image`,
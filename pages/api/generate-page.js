@@ -132,7 +132,8 @@ export default async function handler(req, res) {
       success: true,
       data: {
         pageIndex,
-        image_url: result.data.imageUrl
+        image_url: result.data.imageUrl,
+        variants: result.data.variants || null
       }
     });
 
@@ -332,6 +332,7 @@ function IDEWorkspace() {
         actions.updatePage({
           page_index: pageIndex,
           image_url: result.data.image_url,
+          variants: result.data.variants,
           status: 'ready'
         });
         console.log(`✅ [IDE] 第 ${pageIndex} 页生成成功`);
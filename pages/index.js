@@ -652,7 +652,9 @@ export default function Home() {
         body: JSON.stringify({
           frame: targetFrame,
           prompt: targetFrame.prompt || targetFrame.jimengPrompt,
-          config: currentConfig
+          config: currentConfig,
+          // 重新生成需要新图片，跳过后端结果缓存
+          use_cache: false
         }),
         signal: controller.signal
       });
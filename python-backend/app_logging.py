@@ -0,0 +1,240 @@
+"""
+结构化日志模块
+生成链路原先每次轮询都 print(json.dumps(query_resp, indent=2))，响应中带 binary_data_base64 时
+会在事件循环线程上格式化并写出数MB的base64，一张图最多轮询上百次。
+
+本模块基于标准库 logging 提供：
+- 日志级别：完整的提交参数和上游响应只在 DEBUG 级别输出
+- 字段脱敏截断：结构化字段（extra={"fields": {...}}）中的 binary_data_base64 只记录条数和长度，
+  过长的字符串截断，格式化开销与响应大小无关
+- 轮询采样：带 poll 序号的日志只输出前几次和之后每隔N次，警告及以上级别不采样
+- 异步写出：调用方只把日志记录放入有界队列，格式化和写出在后台线程中完成；队列满时丢弃并计数
+- 关联追踪：json 格式附带当前请求ID和 trace_id / span_id（见 tracing）
+
+通过环境变量配置：
+- LOG_LEVEL: 日志级别（默认INFO）
+- LOG_FORMAT: text（默认，消息后附带字段）或 json（每行一个JSON对象）
+- LOG_FIELD_MAX_LENGTH: 字段中单个字符串的最大输出长度（默认200）
+- LOG_POLL_SAMPLE_FIRST: 每个任务完整输出的前几次轮询日志（默认3）
+- LOG_POLL_SAMPLE_EVERY: 之后每隔多少次轮询输出一次（默认10）
+- LOG_QUEUE_SIZE: 待写出日志的队列长度（默认10000）
+"""
+
+import os
+import sys
+import json
+import queue
+import time
+import logging
+import logging.handlers
+from typing import Any, Optional
+
+from tracing import current_span, get_request_id
+
+LOGGER_NAME = "scripttoframe"
+
+# 只记录摘要的二进制字段
+BINARY_FIELDS = {"binary_data_base64"}
+
+
+def redact(value: Any, max_length: int = 200, depth: int = 0) -> Any:
+    """
+    复制一份可安全输出的字段值：二进制字段替换为摘要，过长字符串截断
+    只遍历结构，不复制或扫描大字符串本身
+    """
+    if depth > 6:
+        return "<...>"
+    if isinstance(value, dict):
+        redacted = {}
+        for key, item in value.items():
+            if key in BINARY_FIELDS and isinstance(item, (list, tuple)):
+                redacted[key] = f"<{len(item)} items, {sum(len(x) for x in item if isinstance(x, str))} chars base64>"
+            elif key in BINARY_FIELDS and isinstance(item, str):
+                redacted[key] = f"<{len(item)} chars base64>"
+            else:
+                redacted[key] = redact(item, max_length, depth + 1)
+        return redacted
+    if isinstance(value, (list, tuple)):
+        items = [redact(item, max_length, depth + 1) for item in value[:20]]
+        if len(value) > 20:
+            items.append(f"<+{len(value) - 20} items>")
+        return items
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str):
+        if len(value) > max_length:
+            return f"{value[:max_length]}...<+{len(value) - max_length} chars>"
+        return value
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return redact(str(value), max_length, depth + 1)
+
+
+class StructuredFormatter(logging.Formatter):
+    """输出消息和脱敏后的结构化字段（在写出线程中执行）"""
+
+    def __init__(self, fmt: str = "text", max_length: int = 200):
+        super().__init__()
+        self.fmt = fmt
+        self.max_length = max_length
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        fields = getattr(record, "fields", None)
+        fields = redact(fields, self.max_length) if fields else None
+
+        if self.fmt == "json":
+            entry = {
+                "ts": round(record.created, 3),
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": message,
+            }
+            if getattr(record, "request_id", None):
+                entry["request_id"] = record.request_id
+            if getattr(record, "trace_id", None):
+                entry["trace_id"] = record.trace_id
+                entry["span_id"] = record.span_id
+            if getattr(record, "poll", None) is not None:
+                entry["poll"] = record.poll
+            if fields:
+                entry.update(fields)
+            if record.exc_text:
+                entry["exc"] = record.exc_text
+            return json.dumps(entry, ensure_ascii=False, default=str)
+
+        if fields:
+            message = f"{message} {json.dumps(fields, ensure_ascii=False, default=str)}"
+        if record.exc_text:
+            message = f"{message}\n{record.exc_text}"
+        return message
+
+
+class PollSampleFilter(logging.Filter):
+    """轮询日志采样：只放行前 first 次和之后每隔 every 次"""
+
+    def __init__(self, first: int = 3, every: int = 10):
+        super().__init__()
+        self.first = first
+        self.every = every
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        poll = getattr(record, "poll", None)
+        if poll is None or record.levelno >= logging.WARNING:
+            return True
+        if poll <= self.first or (self.every > 0 and poll % self.every == 0):
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class _BoundedQueueHandler(logging.handlers.QueueHandler):
+    """放入有界队列，队列满时丢弃而不是阻塞事件循环"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 异常堆栈在调用线程中格式化（traceback对象不能跨线程保留），其余格式化交给写出线程
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        # 请求ID和span保存在调用方协程的上下文中，写出线程取不到，放入队列前记录
+        span = current_span()
+        record.request_id = get_request_id()
+        record.trace_id = span.trace_id if span else None
+        record.span_id = span.span_id if span else None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """日志管线：logger → 采样 → 有界队列 → 后台线程格式化写出"""
+
+    def __init__(self, level: str = "INFO", fmt: str = "text", max_length: int = 200,
+                 poll_first: int = 3, poll_every: int = 10, queue_size: int = 10000):
+        self.level = level.upper()
+        self.fmt = fmt
+        self.max_length = max_length
+
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._sampler = PollSampleFilter(poll_first, poll_every)
+        self._queue_handler = _BoundedQueueHandler(self._queue)
+        self._queue_handler.addFilter(self._sampler)
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(StructuredFormatter(fmt, max_length))
+        self._listener = logging.handlers.QueueListener(self._queue, stream_handler)
+
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.logger.setLevel(getattr(logging, self.level, logging.INFO))
+        self.logger.handlers = [self._queue_handler]
+        # 不交给root logger，避免与 uvicorn 的日志配置重复输出
+        self.logger.propagate = False
+
+        self._listener.start()
+        self._started_at = time.time()
+
+    def stop(self):
+        """写出队列中剩余的日志并停止后台线程"""
+        self._listener.stop()
+
+    def get_stats(self) -> dict:
+        """获取日志管线状态"""
+        return {
+            "level": self.level,
+            "format": self.fmt,
+            "field_max_length": self.max_length,
+            "queued": self._queue.qsize(),
+            "dropped": self._queue_handler.dropped,
+            "poll_sampled_out": self._sampler.sampled_out,
+        }
+
+
+# ============ 工厂函数 ============
+
+_pipeline_instance: Optional[LogPipeline] = None
+
+def get_log_pipeline() -> LogPipeline:
+    """
+    获取日志管线实例（单例模式）
+    通过环境变量 LOG_LEVEL / LOG_FORMAT / LOG_FIELD_MAX_LENGTH / LOG_POLL_SAMPLE_FIRST /
+    LOG_POLL_SAMPLE_EVERY / LOG_QUEUE_SIZE 配置
+    """
+    global _pipeline_instance
+
+    if _pipeline_instance is not None:
+        return _pipeline_instance
+
+    _pipeline_instance = LogPipeline(
+        level=os.getenv('LOG_LEVEL', 'INFO'),
+        fmt=os.getenv('LOG_FORMAT', 'text').lower(),
+        max_length=int(os.getenv('LOG_FIELD_MAX_LENGTH', 200)),
+        poll_first=int(os.getenv('LOG_POLL_SAMPLE_FIRST', 3)),
+        poll_every=int(os.getenv('LOG_POLL_SAMPLE_EVERY', 10)),
+        queue_size=int(os.getenv('LOG_QUEUE_SIZE', 10000))
+    )
+    return _pipeline_instance
+
+
+def get_logger(name: str = "") -> logging.Logger:
+    """获取结构化日志记录器（首次调用时启动日志管线）"""
+    get_log_pipeline()
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+def shutdown_logging():
+    """写出剩余日志并重置日志管线"""
+    global _pipeline_instance
+    if _pipeline_instance is not None:
+        _pipeline_instance.stop()
+        _pipeline_instance = None
@@ -0,0 +1,267 @@
+"""
+音频编码模块
+TTS输出的是 16bit 单声道 PCM，直接保存为WAV体积很大。
+本模块在独立的进程池中把PCM编码为压缩格式（MP3 / Opus / AAC），编码过程不占用事件循环；
+压缩格式通过 ffmpeg 编码，未安装 ffmpeg 时自动回退为WAV。
+
+编码结果先写入同目录下的唯一临时文件，完成后原子替换目标文件，读取方不会看到写了一半的文件，
+同一目标的并发编码也不会互相覆盖临时文件。
+编码进程以 spawn 方式启动：服务中已有线程运行时 fork 会复制其持有的锁，子进程可能卡死。
+
+默认输出格式为WAV，与之前的文件扩展名和前端播放方式保持一致；压缩格式需通过 AUDIO_OUTPUT_FORMAT
+或请求的 output_format 显式开启。切换格式后同一页面的新文件扩展名不同（如 page_1.mp3），
+新文件保存成功后删除同名的其他格式文件（如此前生成的 page_1.wav），不留下过期的音频。
+
+通过环境变量配置：
+- AUDIO_OUTPUT_FORMAT: 默认输出格式 wav / mp3 / opus / aac（默认wav，请求中可单独指定）
+- AUDIO_BITRATE: 压缩格式的目标码率（默认32k）
+- AUDIO_ENCODER_WORKERS: 编码进程数（默认2）
+- FFMPEG_PATH: ffmpeg 可执行文件路径（默认从PATH中查找）
+"""
+
+import os
+import asyncio
+import multiprocessing
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+from app_logging import get_logger
+
+AUDIO_FORMAT_WAV = "wav"
+AUDIO_FORMAT_MP3 = "mp3"
+AUDIO_FORMAT_OPUS = "opus"
+AUDIO_FORMAT_AAC = "aac"
+
+# PCM参数（TTS服务固定输出 16bit 单声道）
+SAMPLE_WIDTH = 2
+CHANNELS = 1
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    """输出格式定义"""
+    extension: str
+    mime_type: str
+    ffmpeg_args: Tuple[str, ...] = ()
+
+
+AUDIO_FORMATS = {
+    AUDIO_FORMAT_WAV: AudioFormat(".wav", "audio/wav"),
+    AUDIO_FORMAT_MP3: AudioFormat(".mp3", "audio/mpeg", ("-c:a", "libmp3lame", "-f", "mp3")),
+    AUDIO_FORMAT_OPUS: AudioFormat(".opus", "audio/ogg", ("-c:a", "libopus", "-application", "voip", "-f", "ogg")),
+    AUDIO_FORMAT_AAC: AudioFormat(".m4a", "audio/mp4", ("-c:a", "aac", "-movflags", "+faststart", "-f", "mp4")),
+}
+
+
+class AudioEncodingError(RuntimeError):
+    """音频编码失败"""
+    pass
+
+
+def _write_wav(path: str, pcm_data: bytes, sample_rate: int):
+    import wave
+
+    with wave.open(path, 'wb') as wav_file:
+        wav_file.setnchannels(CHANNELS)
+        wav_file.setsampwidth(SAMPLE_WIDTH)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm_data)
+
+
+def encode_pcm_file(pcm_data: bytes, sample_rate: int, audio_format: str, bitrate: str,
+                    output_path: str, ffmpeg_path: Optional[str] = None) -> int:
+    """
+    把PCM数据编码后写入文件（在编码进程中执行）
+
+    Returns:
+        int: 输出文件字节数
+    """
+    spec = AUDIO_FORMATS[audio_format]
+    directory, name = os.path.split(output_path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory or None)
+    os.close(fd)
+
+    try:
+        if audio_format == AUDIO_FORMAT_WAV:
+            _write_wav(tmp_path, pcm_data, sample_rate)
+        else:
+            command = [
+                ffmpeg_path or "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                "-f", "s16le", "-ar", str(sample_rate), "-ac", str(CHANNELS), "-i", "pipe:0",
+                *spec.ffmpeg_args, "-b:a", bitrate, tmp_path,
+            ]
+            result = subprocess.run(command, input=pcm_data, capture_output=True)
+            if result.returncode != 0:
+                raise AudioEncodingError(
+                    f"ffmpeg编码失败 ({audio_format}): {result.stderr.decode('utf-8', 'replace').strip()[:500]}"
+                )
+        # mkstemp 创建的文件只有属主可读，静态文件服务需要可读权限
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return os.path.getsize(output_path)
+
+
+class AudioEncoder:
+    """进程池音频编码器"""
+
+    def __init__(self, default_format: str = AUDIO_FORMAT_WAV, bitrate: str = "32k",
+                 max_workers: int = 2, ffmpeg_path: Optional[str] = None):
+        self.bitrate = bitrate
+        self.max_workers = max_workers
+        self.ffmpeg_path = ffmpeg_path or shutil.which("ffmpeg")
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+        if self.ffmpeg_path is None:
+            print(f"⚠️ [AudioEncoder] 未找到 ffmpeg，压缩格式将回退为WAV")
+
+        self.default_format = AUDIO_FORMAT_WAV
+        try:
+            self.default_format = self.resolve_format(default_format)
+        except ValueError as e:
+            print(f"⚠️ [AudioEncoder] {e}，使用WAV")
+
+        # 统计数据
+        self._encoded = 0
+        self._failed = 0
+        self._total_time = 0.0
+        self._input_bytes = 0
+        self._output_bytes = 0
+
+        print(f"🎚️ [AudioEncoder] 初始化，默认格式: {self.default_format}，码率: {bitrate}，编码进程: {max_workers}")
+
+    def resolve_format(self, audio_format: Optional[str] = None) -> str:
+        """
+        规范化输出格式，未指定时使用默认格式
+
+        Raises:
+            ValueError: 不支持的格式
+        """
+        if not audio_format:
+            return self.default_format
+        audio_format = audio_format.lower().lstrip(".")
+        if audio_format == "m4a":
+            audio_format = AUDIO_FORMAT_AAC
+        if audio_format not in AUDIO_FORMATS:
+            raise ValueError(f"不支持的音频格式: {audio_format}，可选: {', '.join(AUDIO_FORMATS)}")
+        if audio_format != AUDIO_FORMAT_WAV and self.ffmpeg_path is None:
+            return AUDIO_FORMAT_WAV
+        return audio_format
+
+    def extension(self, audio_format: Optional[str] = None) -> str:
+        return AUDIO_FORMATS[self.resolve_format(audio_format)].extension
+
+    async def encode(self, pcm_data: bytes, sample_rate: int, output_path: Path,
+                     audio_format: Optional[str] = None) -> dict:
+        """
+        编码PCM数据并写入 output_path
+
+        Returns:
+            dict: 格式、MIME类型、时长（秒）、平均码率（kbps）、文件大小
+        """
+        audio_format = self.resolve_format(audio_format)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+
+        start_time = time.time()
+        loop = asyncio.get_running_loop()
+        try:
+            size = await loop.run_in_executor(
+                self._pool, encode_pcm_file,
+                pcm_data, sample_rate, audio_format, self.bitrate, str(output_path), self.ffmpeg_path
+            )
+        except Exception:
+            self._failed += 1
+            raise
+
+        self._remove_other_formats(Path(output_path), audio_format)
+
+        self._encoded += 1
+        self._total_time += time.time() - start_time
+        self._input_bytes += len(pcm_data)
+        self._output_bytes += size
+
+        duration = len(pcm_data) / (sample_rate * SAMPLE_WIDTH * CHANNELS) if sample_rate else 0.0
+        return {
+            "format": audio_format,
+            "mimeType": AUDIO_FORMATS[audio_format].mime_type,
+            "duration": round(duration, 3),
+            "bitrate": round(size * 8 / duration / 1000) if duration else 0,
+            "size": size,
+        }
+
+    def _remove_other_formats(self, output_path: Path, audio_format: str):
+        """删除同一文件名的其他格式文件（切换输出格式后重新生成时的旧文件）"""
+        # 编码进程也会导入本模块，日志记录器在主进程中使用时才获取
+        logger = get_logger("audio_encoder")
+        for name, spec in AUDIO_FORMATS.items():
+            if name == audio_format:
+                continue
+            stale = output_path.with_suffix(spec.extension)
+            try:
+                stale.unlink()
+                logger.info(f"🧹 [AudioEncoder] 删除旧格式文件: {stale}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"⚠️ [AudioEncoder] 删除旧格式文件失败: {stale}: {e}")
+
+    def get_stats(self) -> dict:
+        """获取编码器状态"""
+        return {
+            "default_format": self.default_format,
+            "bitrate": self.bitrate,
+            "ffmpeg_available": self.ffmpeg_path is not None,
+            "encoded": self._encoded,
+            "failed": self._failed,
+            "avg_encode_time": round(self._total_time / self._encoded, 3) if self._encoded else 0.0,
+            "compression_ratio": round(self._input_bytes / self._output_bytes, 2) if self._output_bytes else 0.0,
+        }
+
+    def shutdown(self):
+        """关闭编码进程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# ============ 工厂函数 ============
+
+_encoder_instance: Optional[AudioEncoder] = None
+
+def get_audio_encoder() -> AudioEncoder:
+    """
+    获取音频编码器实例（单例模式）
+    通过环境变量 AUDIO_OUTPUT_FORMAT / AUDIO_BITRATE / AUDIO_ENCODER_WORKERS / FFMPEG_PATH 配置
+    """
+    global _encoder_instance
+
+    if _encoder_instance is not None:
+        return _encoder_instance
+
+    _encoder_instance = AudioEncoder(
+        default_format=os.getenv('AUDIO_OUTPUT_FORMAT', AUDIO_FORMAT_WAV),
+        bitrate=os.getenv('AUDIO_BITRATE', '32k'),
+        max_workers=int(os.getenv('AUDIO_ENCODER_WORKERS', 2)),
+        ffmpeg_path=os.getenv('FFMPEG_PATH')
+    )
+    return _encoder_instance
+
+
+def shutdown_audio_encoder():
+    """关闭并重置音频编码器实例"""
+    global _encoder_instance
+    if _encoder_instance is not None:
+        _encoder_instance.shutdown()
+        _encoder_instance = None
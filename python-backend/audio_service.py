@@ -10,13 +10,69 @@ import json
 import time
 import hashlib
 from abc import ABC, abstractmethod
-from typing import Optional, Tuple
+from typing import AsyncIterator, Optional, Tuple
 from pathlib import Path
 
+from audio_encoder import get_audio_encoder
+from tts_connection_pool import TTSConnectionPool
+from metrics import TTS_IN_FLIGHT, TTS_REALTIME_FACTOR, TTS_TTFB
+from tracing import log_tag, start_span, traced
+from app_logging import get_logger
+
+logger = get_logger("audio_service")
+
 # 音频Provider类型
 AUDIO_WEBSOCKET_TTS = "websocket_tts"
 AUDIO_VOLCENGINE_TTS = "volcengine_tts"
 
+# TTS文本发送模式
+TEXT_CHUNK_PHRASE = "phrase"  # 按标点切分为短语发送
+TEXT_CHUNK_CHAR = "char"      # 逐字符发送（兼容模式）
+
+# 默认短语边界标点
+DEFAULT_CHUNK_BOUNDARIES = "，。！？；：、,.!?;:\n"
+
+
+def make_streaming_wav_header(sample_rate: int, channels: int = 1, sample_width: int = 2) -> bytes:
+    """
+    生成流式WAV文件头
+    总长度未知，RIFF/data 长度字段填最大值，播放器会一直读到连接结束
+    """
+    import struct
+
+    byte_rate = sample_rate * channels * sample_width
+    block_align = channels * sample_width
+    return (
+        b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate, block_align, sample_width * 8)
+        + b"data" + struct.pack("<I", 0xFFFFFFFF)
+    )
+
+
+def split_text_chunks(text: str, max_chunk_size: int = 20,
+                      boundaries: str = DEFAULT_CHUNK_BOUNDARIES) -> list:
+    """
+    将文本切分为短语块：遇到边界标点后切分，无标点的长段落按 max_chunk_size 切分
+
+    Args:
+        text: 要切分的文本
+        max_chunk_size: 单块最大字符数
+        boundaries: 作为切分点的标点字符
+
+    Returns:
+        list: 文本块列表，拼接后与原文本一致
+    """
+    chunks = []
+    current = []
+    for char in text:
+        current.append(char)
+        if char in boundaries or len(current) >= max_chunk_size:
+            chunks.append("".join(current))
+            current = []
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
 class AudioProvider(ABC):
     """音频生成Provider抽象基类"""
 
@@ -40,7 +96,8 @@ class AudioProvider(ABC):
     @abstractmethod
     async def synthesize_and_save(self, text: str, filename: str, folder: str = "",
                                   speaker_id: str = "child", speed_factor: str = "1.0",
-                                  pitch_factor: str = "1.0") -> Tuple[str, str]:
+                                  pitch_factor: str = "1.0",
+                                  output_format: Optional[str] = None) -> Tuple[str, str, dict]:
         """
         合成音频并保存
 
@@ -51,12 +108,34 @@ class AudioProvider(ABC):
             speaker_id: 说话人ID
             speed_factor: 语速因子
             pitch_factor: 音调因子
+            output_format: 输出格式 wav / mp3 / opus / aac，默认由 AUDIO_OUTPUT_FORMAT 决定
 
         Returns:
-            Tuple[local_path, public_url]: 本地路径和访问URL
+            Tuple[local_path, public_url, metadata]: 本地路径、访问URL和音频信息（格式、时长、码率等）
         """
         pass
 
+    def stream_and_save(self, text: str, filename: str = None, folder: str = "",
+                        speaker_id: str = "child", speed_factor: str = "1.0",
+                        pitch_factor: str = "1.0",
+                        output_format: Optional[str] = None) -> Tuple[str, AsyncIterator[bytes]]:
+        """
+        边合成边产出PCM数据块，合成完成后在后台编码并保存文件
+
+        Returns:
+            Tuple[public_url, chunks]: 文件访问URL和PCM数据块迭代器；
+            迭代在文件保存成功后才正常结束（URL此后可用），合成或保存失败时抛出异常
+        """
+        raise NotImplementedError(f"{type(self).__name__} 不支持流式合成")
+
+    async def close(self):
+        """释放Provider持有的连接等资源"""
+        pass
+
+    def get_stats(self) -> dict:
+        """获取Provider运行状态（用于健康检查）"""
+        return {}
+
     def _generate_filename(self, prefix: str = "audio") -> str:
         """生成唯一文件名"""
         timestamp = int(time.time() * 1000)
@@ -83,79 +162,136 @@ class WebSocketTTSProvider(AudioProvider):
         # 确保目录存在
         self.base_path.mkdir(parents=True, exist_ok=True)
 
+        # 文本发送方式
+        self.text_chunk_mode = os.getenv('TTS_TEXT_CHUNK_MODE', TEXT_CHUNK_PHRASE).lower()
+        self.text_chunk_size = int(os.getenv('TTS_TEXT_CHUNK_SIZE', 20))
+        self.text_chunk_boundaries = os.getenv('TTS_TEXT_CHUNK_BOUNDARIES', DEFAULT_CHUNK_BOUNDARIES)
+
+        # 流式合成的后台保存任务（保持引用，避免被回收）
+        self._background_tasks = set()
+
+        # WebSocket连接池（连接在会话结束后复用）
+        self.connection_pool = TTSConnectionPool(
+            self.server_url,
+            max_size=int(os.getenv('TTS_WS_POOL_SIZE', 4)),
+            idle_timeout=float(os.getenv('TTS_WS_IDLE_TIMEOUT', 60)),
+            max_connections=int(os.getenv('TTS_WS_MAX_CONNECTIONS', 32)),
+            acquire_timeout=float(os.getenv('TTS_WS_ACQUIRE_TIMEOUT', 30))
+        )
+        # 单次接收消息的超时：半关闭的连接不会报错，只会一直收不到数据
+        self.recv_timeout = float(os.getenv('TTS_WS_RECV_TIMEOUT', 30))
+
         print(f"🔊 [WebSocketTTS] 初始化")
         print(f"   服务地址: {self.server_url}")
         print(f"   存储路径: {self.base_path}")
+        print(f"   连接池大小: {self.connection_pool.max_size} (最大连接数: {self.connection_pool.max_connections})")
+        print(f"   文本发送: {self.text_chunk_mode} (块大小: {self.text_chunk_size})")
 
     async def synthesize(self, text: str, speaker_id: str = "child",
                         speed_factor: str = "1.0", pitch_factor: str = "1.0") -> bytes:
         """合成音频，返回PCM数据"""
+        # 收到的PCM帧原样保存，结束后一次性拼接，不逐个采样转换
+        audio_chunks = []
+        async for chunk in self.synthesize_stream(text, speaker_id, speed_factor, pitch_factor):
+            audio_chunks.append(chunk)
+        return b"".join(audio_chunks)
+
+    async def synthesize_stream(self, text: str, speaker_id: str = "child",
+                                speed_factor: str = "1.0", pitch_factor: str = "1.0") -> AsyncIterator[bytes]:
+        """合成音频，边接收边产出PCM数据块"""
         try:
-            import websockets
-            import numpy as np
+            from websockets.exceptions import ConnectionClosed
         except ImportError:
-            raise RuntimeError("请安装依赖: pip install websockets numpy")
-
-        audio_data = []
+            raise RuntimeError("请安装依赖: pip install websockets")
 
-        async with websockets.connect(self.server_url) as websocket:
-            # 1. 初始化会话
-            init_message = {
-                "type": "init_session",
-                "speaker_id": speaker_id,
-                "speed_factor": speed_factor,
-                "pitch_factor": pitch_factor
-            }
-            await websocket.send(json.dumps(init_message))
-
-            # 等待初始化响应
-            response = await websocket.recv()
-            response_data = json.loads(response)
-            print(f"🔊 [WebSocketTTS] 会话初始化: {response_data.get('message')}")
-
-            # 2. 逐字符发送文本
-            for char in text:
-                text_message = {
-                    "type": "text",
-                    "text": char
-                }
-                await websocket.send(json.dumps(text_message))
-
-            # 3. 发送结束信号
-            end_message = {"type": "end"}
-            await websocket.send(json.dumps(end_message))
-
-            # 4. 接收音频数据
+        start_time = time.time()
+        received = 0
+        TTS_IN_FLIGHT.inc()
+        try:
+            retried = False
             while True:
-                message = await websocket.recv()
-
-                if isinstance(message, bytes):
-                    # PCM音频数据
-                    audio_array = np.frombuffer(message, dtype=np.int16)
-                    audio_data.extend(audio_array)
-                else:
-                    response_data = json.loads(message)
-                    if response_data.get("type") == "audio":
-                        self.sample_rate = response_data.get("sample_rate", 16000)
-                    elif response_data.get("type") == "end_response":
-                        break
-
-        # 转换为bytes
-        audio_array = np.array(audio_data, dtype=np.int16)
-        return audio_array.tobytes()
-
-    async def synthesize_and_save(self, text: str, filename: str = None, folder: str = "",
-                                  speaker_id: str = "child", speed_factor: str = "1.0",
-                                  pitch_factor: str = "1.0") -> Tuple[str, str]:
-        """合成音频并保存为WAV文件"""
-        import wave
-        import numpy as np
+                reused = False
+                started = False
+                try:
+                    # 会话中的异常在连接池内传播，出错的连接被关闭而不是归还
+                    async with self.connection_pool.connection(fresh=retried) as (websocket, reused):
+                        async for chunk in self._run_session(websocket, text, speaker_id, speed_factor, pitch_factor):
+                            if not started and not received:
+                                TTS_TTFB.observe(time.time() - start_time)
+                            started = True
+                            received += len(chunk)
+                            yield chunk
+                    break
+                except (ConnectionClosed, asyncio.TimeoutError):
+                    # 复用的连接可能已被服务端关闭或半关闭，尚未产出数据时换一条新连接重试一次
+                    if not reused or started or retried:
+                        raise
+                    retried = True
+                    logger.info(f"🔄 [WebSocketTTS] 复用连接已断开或无响应，重新连接...")
+        finally:
+            TTS_IN_FLIGHT.dec()
+
+        # 实时率：合成耗时 / 音频时长（16bit单声道PCM）
+        duration = received / (self.sample_rate * 2)
+        if duration > 0:
+            TTS_REALTIME_FACTOR.observe((time.time() - start_time) / duration)
+
+    async def _run_session(self, websocket, text: str, speaker_id: str,
+                           speed_factor: str, pitch_factor: str) -> AsyncIterator[bytes]:
+        """在一条连接上完成一次合成会话，逐个产出收到的PCM帧"""
+        # 1. 初始化会话
+        init_message = {
+            "type": "init_session",
+            "speaker_id": speaker_id,
+            "speed_factor": speed_factor,
+            "pitch_factor": pitch_factor
+        }
+        await websocket.send(json.dumps(init_message))
+
+        # 等待初始化响应
+        response = await asyncio.wait_for(websocket.recv(), timeout=self.recv_timeout)
+        response_data = json.loads(response)
+        logger.info(f"🔊 [{log_tag('WebSocketTTS')}] 会话初始化: {response_data.get('message')}")
+
+        # 2. 发送文本（短语模式按标点切块发送，字符模式逐字符发送）
+        if self.text_chunk_mode == TEXT_CHUNK_CHAR:
+            chunks = text
+        else:
+            chunks = split_text_chunks(text, self.text_chunk_size, self.text_chunk_boundaries)
 
+        for chunk in chunks:
+            text_message = {
+                "type": "text",
+                "text": chunk
+            }
+            await websocket.send(json.dumps(text_message))
+
+        # 3. 发送结束信号
+        end_message = {"type": "end"}
+        await websocket.send(json.dumps(end_message))
+
+        # 4. 接收音频数据
+        while True:
+            message = await asyncio.wait_for(websocket.recv(), timeout=self.recv_timeout)
+
+            if isinstance(message, bytes):
+                # PCM音频数据（16bit单声道）
+                yield message
+            else:
+                response_data = json.loads(message)
+                if response_data.get("type") == "audio":
+                    self.sample_rate = response_data.get("sample_rate", 16000)
+                elif response_data.get("type") == "end_response":
+                    break
+
+    def _resolve_output(self, filename: str = None, folder: str = "",
+                        extension: str = ".wav") -> Tuple[Path, str]:
+        """构建音频文件的保存路径和访问URL"""
         # 生成文件名
         if not filename:
             filename = self._generate_filename()
-        if not filename.endswith('.wav'):
-            filename = f"{filename}.wav"
+        if not filename.endswith(extension):
+            filename = f"{filename}{extension}"
 
         # 构建完整路径
         if folder:
@@ -167,30 +303,98 @@ class WebSocketTTSProvider(AudioProvider):
             file_path = self.base_path / filename
             url_path = f"{self.base_url}/{filename}"
 
+        return file_path, url_path
+
+    @traced("tts.synthesize_and_save")
+    async def synthesize_and_save(self, text: str, filename: str = None, folder: str = "",
+                                  speaker_id: str = "child", speed_factor: str = "1.0",
+                                  pitch_factor: str = "1.0",
+                                  output_format: Optional[str] = None) -> Tuple[str, str, dict]:
+        """合成音频，编码为指定格式后保存"""
+        encoder = get_audio_encoder()
+        output_format = encoder.resolve_format(output_format)
+        file_path, url_path = self._resolve_output(filename, folder, encoder.extension(output_format))
+
         # 合成音频
-        print(f"🔊 [WebSocketTTS] 开始合成: {text[:30]}...")
+        logger.info(f"🔊 [{log_tag('WebSocketTTS')}] 开始合成: {text[:30]}...")
         start_time = time.time()
 
-        pcm_data = await self.synthesize(text, speaker_id, speed_factor, pitch_factor)
+        with start_span("tts.synthesize", text_length=len(text), speaker_id=speaker_id):
+            pcm_data = await self.synthesize(text, speaker_id, speed_factor, pitch_factor)
 
-        # 保存为WAV文件
-        audio_array = np.frombuffer(pcm_data, dtype=np.int16)
-        with wave.open(str(file_path), 'wb') as wav_file:
-            wav_file.setnchannels(1)
-            wav_file.setsampwidth(2)
-            wav_file.setframerate(self.sample_rate)
-            wav_file.writeframes(audio_array.tobytes())
+        # 在编码进程池中编码并保存
+        with start_span("audio.encode", format=output_format, pcm_bytes=len(pcm_data)):
+            metadata = await encoder.encode(pcm_data, self.sample_rate, file_path, output_format)
 
         elapsed = time.time() - start_time
-        duration = len(audio_array) / self.sample_rate
 
-        print(f"✅ [WebSocketTTS] 合成完成")
-        print(f"   文本长度: {len(text)} 字符")
-        print(f"   音频时长: {duration:.2f} 秒")
-        print(f"   处理耗时: {elapsed:.2f} 秒")
-        print(f"   保存路径: {file_path}")
+        logger.info(f"✅ [{log_tag('WebSocketTTS')}] 合成完成", extra={"fields": {
+            "text_length": len(text),
+            "duration": round(metadata['duration'], 2),
+            "format": f"{metadata['format']} ({metadata['bitrate']} kbps, {metadata['size']} 字节)",
+            "elapsed": round(elapsed, 2),
+            "path": str(file_path)
+        }})
+
+        return str(file_path), url_path, metadata
+
+    def stream_and_save(self, text: str, filename: str = None, folder: str = "",
+                        speaker_id: str = "child", speed_factor: str = "1.0",
+                        pitch_factor: str = "1.0",
+                        output_format: Optional[str] = None) -> Tuple[str, AsyncIterator[bytes]]:
+        """
+        边合成边转发PCM数据块，合成完成后在后台编码并保存文件
+        客户端中途断开不影响合成和保存
+
+        数据块迭代在文件保存成功后才正常结束；合成或保存失败时迭代抛出该异常，
+        调用方据此中断响应，返回的URL只在迭代正常结束后可用
+        """
+        encoder = get_audio_encoder()
+        output_format = encoder.resolve_format(output_format)
+        file_path, url_path = self._resolve_output(filename, folder, encoder.extension(output_format))
+        relay_queue: asyncio.Queue = asyncio.Queue()
+
+        async def produce():
+            start_time = time.time()
+            audio_chunks = []
+            try:
+                with start_span("tts.synthesize", text_length=len(text), speaker_id=speaker_id, stream=True):
+                    async for chunk in self.synthesize_stream(text, speaker_id, speed_factor, pitch_factor):
+                        if not audio_chunks:
+                            logger.info(f"🔊 [{log_tag('WebSocketTTS')}] 首个音频块到达: {time.time() - start_time:.2f} 秒")
+                        audio_chunks.append(chunk)
+                        relay_queue.put_nowait(chunk)
+
+                pcm_data = b"".join(audio_chunks)
+                with start_span("audio.encode", format=output_format, pcm_bytes=len(pcm_data)):
+                    await encoder.encode(pcm_data, self.sample_rate, file_path, output_format)
+                logger.info(f"✅ [{log_tag('WebSocketTTS')}] 流式合成完成并保存: {file_path} ({time.time() - start_time:.2f} 秒)")
+                relay_queue.put_nowait(None)
+            except Exception as e:
+                logger.error(f"❌ [{log_tag('WebSocketTTS')}] 流式合成失败，未保存 {file_path}: {e}")
+                relay_queue.put_nowait(e)
+
+        task = asyncio.create_task(produce())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+        async def relay():
+            while True:
+                chunk = await relay_queue.get()
+                if chunk is None:
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+
+        return url_path, relay()
+
+    async def close(self):
+        """关闭连接池中的空闲连接"""
+        await self.connection_pool.close_all()
 
-        return str(file_path), url_path
+    def get_stats(self) -> dict:
+        return {"connection_pool": self.connection_pool.get_stats()}
 
 
 class VolcengineTTSProvider(AudioProvider):
@@ -217,7 +421,8 @@ class VolcengineTTSProvider(AudioProvider):
 
     async def synthesize_and_save(self, text: str, filename: str = None, folder: str = "",
                                   speaker_id: str = "child", speed_factor: str = "1.0",
-                                  pitch_factor: str = "1.0") -> Tuple[str, str]:
+                                  pitch_factor: str = "1.0",
+                                  output_format: Optional[str] = None) -> Tuple[str, str, dict]:
         raise NotImplementedError("火山引擎TTS Provider待实现")
 
 
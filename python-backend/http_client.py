@@ -0,0 +1,42 @@
+"""
+共享HTTP客户端模块
+下载上游结果、读取图生图原图等出站请求共用一个带连接池的 httpx.AsyncClient，
+避免每次请求新建客户端、重新进行DNS解析和TLS握手。
+
+通过环境变量配置：
+- HTTP_MAX_CONNECTIONS: 连接池最大连接数（默认20）
+- HTTP_TIMEOUT: 请求超时秒数（默认60）
+"""
+
+import os
+
+_client_instance = None
+
+def get_http_client():
+    """
+    获取共享的HTTP客户端（单例模式，首次调用时创建）
+    通过环境变量 HTTP_MAX_CONNECTIONS / HTTP_TIMEOUT 配置
+    """
+    global _client_instance
+
+    if _client_instance is not None:
+        return _client_instance
+
+    import httpx
+
+    max_connections = int(os.getenv('HTTP_MAX_CONNECTIONS', 20))
+    _client_instance = httpx.AsyncClient(
+        timeout=float(os.getenv('HTTP_TIMEOUT', 60)),
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    )
+    print(f"🌐 [HTTPClient] 初始化，最大连接数: {max_connections}")
+    return _client_instance
+
+
+async def close_http_client():
+    """关闭并重置共享的HTTP客户端"""
+    global _client_instance
+    if _client_instance is not None:
+        await _client_instance.aclose()
+        _client_instance = None
@@ -0,0 +1,177 @@
+"""
+图片衍生尺寸生成模块
+分镜页和角色图只以原始分辨率（1920x1080 PNG）保存，分镜网格等缩略视图也要加载完整大图。
+本模块在原图保存后，于独立进程池中生成多个缩小尺寸的 WebP 衍生图（如缩略图、预览图），
+保存到同一存储目录，文件名为 {原文件名}_{尺寸名}.webp。依赖 Pillow（可选），未安装时不生成。
+
+通过环境变量配置：
+- IMAGE_DERIVATIVES_ENABLED: 是否启用（默认true）
+- IMAGE_DERIVATIVE_SIZES: 尺寸名与长边像素，逗号分隔（默认 thumb:320,preview:960）
+- IMAGE_DERIVATIVE_QUALITY: WebP质量（默认80）
+- IMAGE_DERIVATIVE_WORKERS: 生成进程数（默认2）
+"""
+
+import os
+import asyncio
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Union
+
+from image_storage import ImageData, ImageStorageProvider
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+DEFAULT_DERIVATIVE_SIZES = "thumb:320,preview:960"
+
+
+def parse_derivative_sizes(spec: str) -> Dict[str, int]:
+    """解析 "thumb:320,preview:960" 格式的尺寸配置"""
+    sizes = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, side = item.partition(":")
+        sizes[name.strip()] = int(side)
+    return sizes
+
+
+def render_derivatives(source: Union[bytes, str], sizes: Dict[str, int], quality: int) -> Dict[str, bytes]:
+    """
+    生成各尺寸的WebP衍生图（在生成进程中执行）
+
+    Args:
+        source: 原图字节，或本地文件路径（避免跨进程传递大块数据）
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    results = {}
+    with Image.open(source) as image:
+        image.load()
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        # 从大到小依次缩放，每次都基于上一级结果，减少重采样计算量
+        current = image
+        for name, side in sorted(sizes.items(), key=lambda item: -item[1]):
+            if max(current.size) > side:
+                current = current.copy()
+                current.thumbnail((side, side), Image.LANCZOS)
+            output = io.BytesIO()
+            current.save(output, format="WEBP", quality=quality, method=4)
+            results[name] = output.getvalue()
+    return results
+
+
+class ImageDerivativeGenerator:
+    """进程池衍生图生成器"""
+
+    def __init__(self, sizes: Dict[str, int], quality: int = 80, max_workers: int = 2):
+        self.sizes = sizes
+        self.quality = quality
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+        # 统计数据
+        self._generated = 0
+        self._failed = 0
+        self._total_time = 0.0
+
+        print(f"🖼️ [ImageDerivatives] 初始化，尺寸: {sizes}，WebP质量: {quality}，生成进程: {max_workers}")
+
+    async def create(self, source: Union[bytes, str], storage: ImageStorageProvider,
+                     filename: str, folder: str = "") -> Dict[str, str]:
+        """
+        生成衍生图并保存到存储
+
+        Args:
+            source: 原图字节或本地文件路径
+            filename: 原图文件名（不含扩展名），衍生图命名为 {filename}_{尺寸名}.webp
+
+        Returns:
+            Dict[尺寸名, 访问URL]
+        """
+        if self._pool is None:
+            # 使用spawn启动生成进程：fork会把日志、上传等线程持有的锁复制到子进程中
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+
+        start_time = time.time()
+        loop = asyncio.get_running_loop()
+        try:
+            rendered = await loop.run_in_executor(self._pool, render_derivatives, source, self.sizes, self.quality)
+            saved = await asyncio.gather(*[
+                storage.save_image(ImageData(data, "image/webp"), filename=f"{filename}_{name}", folder=folder)
+                for name, data in rendered.items()
+            ])
+        except Exception:
+            self._failed += 1
+            raise
+
+        self._generated += 1
+        self._total_time += time.time() - start_time
+        return {name: public_url for name, (_, public_url) in zip(rendered, saved)}
+
+    def get_stats(self) -> dict:
+        """获取生成器状态"""
+        return {
+            "sizes": self.sizes,
+            "generated": self._generated,
+            "failed": self._failed,
+            "avg_generate_time": round(self._total_time / self._generated, 3) if self._generated else 0.0,
+        }
+
+    def shutdown(self):
+        """关闭生成进程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# ============ 工厂函数 ============
+
+_generator_instance: Optional[ImageDerivativeGenerator] = None
+_generator_checked = False
+
+def get_derivative_generator() -> Optional[ImageDerivativeGenerator]:
+    """
+    获取衍生图生成器实例（单例模式）
+    IMAGE_DERIVATIVES_ENABLED=false、未配置尺寸或未安装 Pillow 时返回None
+    """
+    global _generator_instance, _generator_checked
+
+    if _generator_checked:
+        return _generator_instance
+    _generator_checked = True
+
+    if os.getenv('IMAGE_DERIVATIVES_ENABLED', 'true').lower() != 'true':
+        return None
+    if not PIL_AVAILABLE:
+        print(f"⚠️ [ImageDerivatives] 未安装 Pillow，不生成缩略图 (pip install Pillow)")
+        return None
+
+    sizes = parse_derivative_sizes(os.getenv('IMAGE_DERIVATIVE_SIZES', DEFAULT_DERIVATIVE_SIZES))
+    if not sizes:
+        return None
+
+    _generator_instance = ImageDerivativeGenerator(
+        sizes=sizes,
+        quality=int(os.getenv('IMAGE_DERIVATIVE_QUALITY', 80)),
+        max_workers=int(os.getenv('IMAGE_DERIVATIVE_WORKERS', 2))
+    )
+    return _generator_instance
+
+
+def shutdown_derivative_generator():
+    """关闭并重置衍生图生成器实例"""
+    global _generator_instance, _generator_checked
+    if _generator_instance is not None:
+        _generator_instance.shutdown()
+    _generator_instance = None
+    _generator_checked = False
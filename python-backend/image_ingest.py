@@ -0,0 +1,159 @@
+"""
+上游结果转存模块
+即梦在 return_url=True 时返回的是有时效的临时URL，直接交给前端会在过期后失效，
+后续图生图编辑也需要再次下载。本模块把上游结果URL下载后直接流式写入当前存储Provider：
+- 使用共享的带连接池的HTTP客户端（见 http_client），避免每次下载重新建立TLS连接
+- 同时进行的下载数受 IMAGE_INGEST_CONCURRENCY 限制
+- 响应体按块转发给存储，不在内存中缓冲完整图片
+
+通过环境变量配置：
+- IMAGE_INGEST_CONCURRENCY: 最大并行下载数（默认8）
+- IMAGE_INGEST_TIMEOUT: 单次下载超时秒数（默认60）
+- IMAGE_INGEST_MAX_BYTES: 单张图片最大字节数（默认50MB）
+"""
+
+import os
+import asyncio
+import mimetypes
+import time
+from typing import AsyncIterator, Optional, Tuple
+from urllib.parse import urlparse
+
+from http_client import get_http_client
+from image_storage import ImageStorageProvider
+from tracing import traced
+
+# 下载时每块的字节数
+INGEST_CHUNK_SIZE = 256 * 1024
+
+
+class ImageIngestError(RuntimeError):
+    """上游结果下载或转存失败"""
+    pass
+
+
+def guess_image_mime_type(url: str, content_type: Optional[str]) -> str:
+    """优先使用响应的 Content-Type，其次根据URL扩展名推断，默认png"""
+    if content_type:
+        mime_type = content_type.split(';')[0].strip().lower()
+        if mime_type.startswith('image/'):
+            return mime_type
+    guessed, _ = mimetypes.guess_type(urlparse(url).path)
+    if guessed and guessed.startswith('image/'):
+        return guessed
+    return "image/png"
+
+
+class ImageIngestor:
+    """上游结果URL转存器"""
+
+    def __init__(self, max_concurrency: int = 8, timeout: float = 60.0, max_bytes: int = 50 * 1024 * 1024):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        # 统计数据
+        self._active = 0
+        self._waiting = 0
+        self._ingested = 0
+        self._failed = 0
+        self._bytes = 0
+        self._total_time = 0.0
+
+        print(f"📥 [ImageIngestor] 初始化，最大并行下载: {max_concurrency}，超时: {timeout}s")
+
+    @traced("image.download")
+    async def ingest(self, url: str, storage: ImageStorageProvider,
+                     filename: str = None, folder: str = "") -> Tuple[str, str]:
+        """
+        下载上游结果并流式写入存储
+
+        Returns:
+            Tuple[local_path, public_url]: 存储返回的路径和访问URL
+
+        Raises:
+            ImageIngestError: 下载失败、响应异常或超过大小限制
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._active += 1
+        start_time = time.time()
+        try:
+            import httpx
+            try:
+                async with get_http_client().stream("GET", url, timeout=self.timeout) as resp:
+                    resp.raise_for_status()
+                    mime_type = guess_image_mime_type(url, resp.headers.get("content-type"))
+                    received = 0
+
+                    async def chunks() -> AsyncIterator[bytes]:
+                        nonlocal received
+                        async for chunk in resp.aiter_bytes(INGEST_CHUNK_SIZE):
+                            received += len(chunk)
+                            if received > self.max_bytes:
+                                raise ImageIngestError(f"上游图片超过大小限制 ({self.max_bytes} bytes)")
+                            yield chunk
+
+                    local_path, public_url = await storage.save_stream(chunks(), filename, folder, mime_type)
+            except httpx.HTTPError as e:
+                raise ImageIngestError(f"下载上游结果失败: {e}") from e
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+
+        self._ingested += 1
+        self._bytes += received
+        self._total_time += time.time() - start_time
+        return local_path, public_url
+
+    def get_stats(self) -> dict:
+        """获取转存器状态"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self._active,
+            "waiting": self._waiting,
+            "ingested": self._ingested,
+            "failed": self._failed,
+            "bytes": self._bytes,
+            "avg_ingest_time": round(self._total_time / self._ingested, 3) if self._ingested else 0.0,
+        }
+
+
+# ============ 工厂函数 ============
+
+_ingestor_instance: Optional[ImageIngestor] = None
+
+def get_image_ingestor() -> ImageIngestor:
+    """
+    获取转存器实例（单例模式）
+    通过环境变量 IMAGE_INGEST_CONCURRENCY / IMAGE_INGEST_TIMEOUT / IMAGE_INGEST_MAX_BYTES 配置
+    """
+    global _ingestor_instance
+
+    if _ingestor_instance is not None:
+        return _ingestor_instance
+
+    _ingestor_instance = ImageIngestor(
+        max_concurrency=int(os.getenv('IMAGE_INGEST_CONCURRENCY', 8)),
+        timeout=float(os.getenv('IMAGE_INGEST_TIMEOUT', 60)),
+        max_bytes=int(os.getenv('IMAGE_INGEST_MAX_BYTES', 50 * 1024 * 1024))
+    )
+    return _ingestor_instance
+
+
+def reset_image_ingestor():
+    """重置转存器实例"""
+    global _ingestor_instance
+    _ingestor_instance = None
@@ -0,0 +1,125 @@
+"""
+图生图原图预处理模块
+分镜页原图为 1920x1080 PNG，原样作为 binary_data_base64 提交时请求体可达数MB，
+拖慢 cv_sync2async_submit_task 的上传和上游处理。本模块在提交前：
+- 把长边缩放到 EDIT_IMAGE_MAX_SIDE（模型的有效输入分辨率）以内
+- 重新编码为 JPEG（EDIT_IMAGE_QUALITY），有透明通道时先铺白底
+尺寸和体积都在限制内的原图不做处理。依赖 Pillow（可选），未安装时原样提交。
+
+通过环境变量配置：
+- EDIT_IMAGE_PREPROCESS: 是否启用（默认true）
+- EDIT_IMAGE_MAX_SIDE: 长边最大像素（默认1536）
+- EDIT_IMAGE_MAX_BYTES: 不做处理的最大字节数（默认1MB）
+- EDIT_IMAGE_QUALITY: JPEG质量（默认90）
+"""
+
+import os
+import io
+import threading
+from typing import Optional
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+
+class ImagePreprocessor:
+    """图生图原图缩放与重新编码"""
+
+    def __init__(self, max_side: int = 1536, max_bytes: int = 1024 * 1024, quality: int = 90):
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+        self.quality = quality
+
+        # 在线程中调用，统计数据加锁更新
+        self._lock = threading.Lock()
+        self._processed = 0
+        self._skipped = 0
+        self._input_bytes = 0
+        self._output_bytes = 0
+
+        print(f"🪄 [ImagePreprocessor] 初始化，长边上限: {max_side}px，JPEG质量: {quality}")
+
+    def process(self, data: bytes) -> bytes:
+        """缩放并重新编码，无需处理或处理后反而更大时返回原数据（CPU密集，应在线程中调用）"""
+        with Image.open(io.BytesIO(data)) as image:
+            if max(image.size) <= self.max_side and len(data) <= self.max_bytes:
+                self._record(len(data), None)
+                return data
+
+            image.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=self.quality, optimize=True)
+
+        result = output.getvalue()
+        if len(result) >= len(data):
+            self._record(len(data), None)
+            return data
+        self._record(len(data), len(result))
+        return result
+
+    def _record(self, input_size: int, output_size: Optional[int]):
+        with self._lock:
+            if output_size is None:
+                self._skipped += 1
+                return
+            self._processed += 1
+            self._input_bytes += input_size
+            self._output_bytes += output_size
+
+    def get_stats(self) -> dict:
+        """获取预处理统计"""
+        return {
+            "max_side": self.max_side,
+            "processed": self._processed,
+            "skipped": self._skipped,
+            "saved_bytes": self._input_bytes - self._output_bytes,
+            "compression_ratio": round(self._input_bytes / self._output_bytes, 2) if self._output_bytes else 0.0,
+        }
+
+
+# ============ 工厂函数 ============
+
+_preprocessor_instance: Optional[ImagePreprocessor] = None
+_preprocessor_checked = False
+
+def get_image_preprocessor() -> Optional[ImagePreprocessor]:
+    """
+    获取预处理器实例（单例模式）
+    EDIT_IMAGE_PREPROCESS=false 或未安装 Pillow 时返回None
+    """
+    global _preprocessor_instance, _preprocessor_checked
+
+    if _preprocessor_checked:
+        return _preprocessor_instance
+    _preprocessor_checked = True
+
+    if os.getenv('EDIT_IMAGE_PREPROCESS', 'true').lower() != 'true':
+        return None
+    if not PIL_AVAILABLE:
+        print(f"⚠️ [ImagePreprocessor] 未安装 Pillow，图生图原图将原样提交 (pip install Pillow)")
+        return None
+
+    _preprocessor_instance = ImagePreprocessor(
+        max_side=int(os.getenv('EDIT_IMAGE_MAX_SIDE', 1536)),
+        max_bytes=int(os.getenv('EDIT_IMAGE_MAX_BYTES', 1024 * 1024)),
+        quality=int(os.getenv('EDIT_IMAGE_QUALITY', 90))
+    )
+    return _preprocessor_instance
+
+
+def reset_image_preprocessor():
+    """重置预处理器实例"""
+    global _preprocessor_instance, _preprocessor_checked
+    _preprocessor_instance = None
+    _preprocessor_checked = False
@@ -5,13 +5,23 @@
 """
 
 import os
+import asyncio
 import base64
+import tempfile
 import time
 import hashlib
 from abc import ABC, abstractmethod
-from typing import Optional, Tuple
+from typing import AsyncIterator, Iterable, Optional, Tuple, Union
 from pathlib import Path
 
+from tos_uploader import TOSUploader, create_tos_uploader
+from metrics import timed_storage_write
+from source_image_cache import invalidate_source_image
+from tracing import log_tag, start_span, traced
+from app_logging import get_logger
+
+logger = get_logger("image_storage")
+
 # 存储Provider类型
 STORAGE_LOCAL = "local"
 STORAGE_VOLCENGINE_TOS = "volcengine_tos"
@@ -19,16 +29,129 @@ STORAGE_ALIYUN_OSS = "aliyun_oss"
 STORAGE_TENCENT_COS = "tencent_cos"
 
 
+def mime_to_extension(mime_type: str) -> str:
+    """根据MIME类型获取文件扩展名"""
+    ext = mime_type.split(';')[0].strip().split('/')[-1]
+    return 'jpg' if ext == 'jpeg' else ext
+
+
+class ImageData:
+    """
+    后端内部传递的图片数据：原始字节 + MIME类型
+    由base64构造时延迟解码，且只解码一次；解码后释放base64字符串
+    """
+
+    __slots__ = ("mime_type", "_data", "_base64")
+
+    def __init__(self, data: bytes = None, mime_type: str = "image/png", base64_data: str = None):
+        if data is None and base64_data is None:
+            raise ValueError("图片数据为空")
+        self.mime_type = mime_type
+        self._data = data
+        self._base64 = base64_data if data is None else None
+
+    @classmethod
+    def from_base64(cls, base64_data: str, mime_type: str = "image/png") -> "ImageData":
+        return cls(mime_type=mime_type, base64_data=base64_data)
+
+    @classmethod
+    def from_data_url(cls, data_url: str) -> "ImageData":
+        """解析 data:image/png;base64,xxx 格式"""
+        try:
+            header, data = data_url.split(',', 1)
+            mime_type = header.split(':')[1].split(';')[0]
+        except (ValueError, IndexError):
+            raise ValueError("无效的data URL格式")
+        return cls.from_base64(data, mime_type or "image/png")
+
+    @property
+    def extension(self) -> str:
+        return mime_to_extension(self.mime_type)
+
+    @property
+    def data(self) -> bytes:
+        """原始字节（首次访问时解码）"""
+        if self._data is None:
+            self._data = base64.b64decode(self._base64)
+            self._base64 = None
+        return self._data
+
+    async def load(self) -> bytes:
+        """在线程中解码，避免大图解码阻塞事件循环"""
+        if self._data is None:
+            with start_span("image.decode", base64_length=len(self._base64)):
+                await asyncio.to_thread(lambda: self.data)
+        return self._data
+
+    def to_base64(self) -> str:
+        if self._base64 is not None:
+            return self._base64
+        return base64.b64encode(self._data).decode('ascii')
+
+    def to_data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.to_base64()}"
+
+
+def atomic_write(file_path: Path, chunks: Iterable[bytes]) -> int:
+    """
+    先写入同目录下的临时文件，完成后原子重命名为目标文件
+    静态服务和并发读取方不会看到写了一半的文件
+
+    Returns:
+        int: 写入的字节数
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=file_path.parent, prefix=f".{file_path.name}.", suffix=".tmp")
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+        # mkstemp 创建的文件权限为600，改为普通文件权限以便静态服务读取
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size
+
+
+async def atomic_write_stream(file_path: Path, chunks: AsyncIterator[bytes]) -> int:
+    """
+    流式版本的 atomic_write：边接收边写入临时文件（写入在线程中执行），完成后原子重命名
+
+    Returns:
+        int: 写入的字节数
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=file_path.parent, prefix=f".{file_path.name}.", suffix=".tmp")
+    f = os.fdopen(fd, 'wb')
+    size = 0
+    try:
+        async for chunk in chunks:
+            await asyncio.to_thread(f.write, chunk)
+            size += len(chunk)
+        await asyncio.to_thread(f.close)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        f.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size
+
+
 class ImageStorageProvider(ABC):
     """图片存储Provider抽象基类"""
 
     @abstractmethod
-    async def save_image(self, image_data: str, filename: str, folder: str = "") -> Tuple[str, str]:
+    async def save_image(self, image_data: Union[ImageData, str], filename: str, folder: str = "") -> Tuple[str, str]:
         """
         保存图片
 
         Args:
-            image_data: base64编码的图片数据 或 data:image/png;base64,xxx 格式
+            image_data: ImageData，或 base64编码的图片数据 / data:image/png;base64,xxx 格式
             filename: 文件名（不含路径）
             folder: 子文件夹名
 
@@ -37,6 +160,21 @@ class ImageStorageProvider(ABC):
         """
         pass
 
+    async def save_stream(self, chunks: AsyncIterator[bytes], filename: str = None, folder: str = "",
+                          mime_type: str = "image/png") -> Tuple[str, str]:
+        """
+        保存以数据块流形式到达的图片（如下载中的上游结果）
+
+        默认实现接收完整内容后调用 save_image，支持流式写入的Provider应覆盖此方法
+
+        Returns:
+            Tuple[local_path, public_url]: 本地路径和公网URL
+        """
+        data = bytearray()
+        async for chunk in chunks:
+            data += chunk
+        return await self.save_image(ImageData(bytes(data), mime_type), filename, folder)
+
     @abstractmethod
     def get_public_url(self, filename: str, folder: str = "") -> str:
         """获取图片的公网访问URL"""
@@ -47,20 +185,22 @@ class ImageStorageProvider(ABC):
         """返回的URL是否可被外部服务（如即梦API）访问"""
         pass
 
-    def _extract_base64(self, image_data: str) -> Tuple[str, str]:
-        """从data URL或纯base64中提取数据"""
+    def close(self):
+        """释放Provider持有的线程池、连接等资源"""
+        pass
+
+    def get_stats(self) -> dict:
+        """获取Provider运行状态（用于健康检查）"""
+        return {}
+
+    def _to_image(self, image_data: Union[ImageData, str]) -> ImageData:
+        """兼容data URL或纯base64输入"""
+        if isinstance(image_data, ImageData):
+            return image_data
         if image_data.startswith('data:'):
-            # data:image/png;base64,xxxxx
-            header, data = image_data.split(',', 1)
-            # 提取图片格式
-            mime_type = header.split(':')[1].split(';')[0]
-            ext = mime_type.split('/')[1]
-            if ext == 'jpeg':
-                ext = 'jpg'
-            return data, ext
-        else:
-            # 纯base64，假设是png
-            return image_data, 'png'
+            return ImageData.from_data_url(image_data)
+        # 纯base64，假设是png
+        return ImageData.from_base64(image_data)
 
     def _generate_filename(self, prefix: str = "img") -> str:
         """生成唯一文件名"""
@@ -94,11 +234,8 @@ class LocalStorageProvider(ImageStorageProvider):
         self.base_path.mkdir(parents=True, exist_ok=True)
         print(f"📁 [LocalStorage] 初始化，存储路径: {self.base_path}")
 
-    async def save_image(self, image_data: str, filename: str = None, folder: str = "") -> Tuple[str, str]:
-        """保存图片到本地"""
-        # 提取base64数据
-        base64_data, ext = self._extract_base64(image_data)
-
+    def _resolve_path(self, filename: Optional[str], folder: str, ext: str) -> Tuple[Path, str]:
+        """构建文件的本地路径和访问URL"""
         # 生成文件名
         if not filename:
             filename = self._generate_filename()
@@ -109,18 +246,34 @@ class LocalStorageProvider(ImageStorageProvider):
         if folder:
             save_dir = self.base_path / folder
             save_dir.mkdir(parents=True, exist_ok=True)
-            file_path = save_dir / filename
-            url_path = f"{self.base_url}/{folder}/{filename}"
-        else:
-            file_path = self.base_path / filename
-            url_path = f"{self.base_url}/{filename}"
+            return save_dir / filename, f"{self.base_url}/{folder}/{filename}"
+        return self.base_path / filename, f"{self.base_url}/{filename}"
 
-        # 解码并保存
-        image_bytes = base64.b64decode(base64_data)
-        with open(file_path, 'wb') as f:
-            f.write(image_bytes)
+    @traced("storage.save_image")
+    @timed_storage_write("save_image")
+    async def save_image(self, image_data: Union[ImageData, str], filename: str = None, folder: str = "") -> Tuple[str, str]:
+        """保存图片到本地"""
+        image = self._to_image(image_data)
+        file_path, url_path = self._resolve_path(filename, folder, image.extension)
 
-        print(f"💾 [LocalStorage] 保存成功: {file_path} ({len(image_bytes)} bytes)")
+        # 在线程中解码并写入临时文件，完成后原子替换，不阻塞事件循环
+        image_bytes = await image.load()
+        size = await asyncio.to_thread(atomic_write, file_path, (image_bytes,))
+
+        logger.info(f"💾 [{log_tag('LocalStorage')}] 保存成功: {file_path} ({size} bytes)")
+
+        return str(file_path), url_path
+
+    @traced("storage.save_stream")
+    @timed_storage_write("save_stream")
+    async def save_stream(self, chunks: AsyncIterator[bytes], filename: str = None, folder: str = "",
+                          mime_type: str = "image/png") -> Tuple[str, str]:
+        """边接收边写入本地临时文件，完成后原子替换"""
+        file_path, url_path = self._resolve_path(filename, folder, mime_to_extension(mime_type))
+
+        size = await atomic_write_stream(file_path, chunks)
+
+        logger.info(f"💾 [{log_tag('LocalStorage')}] 流式保存成功: {file_path} ({size} bytes)")
 
         return str(file_path), url_path
 
@@ -157,6 +310,7 @@ class VolcengineTOSProvider(ImageStorageProvider):
         self.public_domain = os.getenv('TOS_PUBLIC_DOMAIN', f"{self.bucket}.{self.endpoint}")
 
         self._client = None
+        self._uploader = None
 
         if self._is_configured():
             print(f"☁️ [VolcengineTOS] 初始化，Bucket: {self.bucket}")
@@ -171,54 +325,78 @@ class VolcengineTOSProvider(ImageStorageProvider):
         if not self._client:
             try:
                 import tos
+                # 重试由上传器统一处理，SDK自身不再重试；连接池大小与上传线程数一致
                 self._client = tos.TosClientV2(
                     ak=self.access_key,
                     sk=self.secret_key,
                     endpoint=self.endpoint,
-                    region=self.region
+                    region=self.region,
+                    max_retry_count=0,
+                    max_connections=int(os.getenv('TOS_UPLOAD_WORKERS', 8))
                 )
             except ImportError:
                 raise RuntimeError("请安装TOS SDK: pip install tos")
         return self._client
 
-    async def save_image(self, image_data: str, filename: str = None, folder: str = "") -> Tuple[str, str]:
+    def _get_uploader(self) -> TOSUploader:
+        """延迟初始化上传器（线程池 + 分片并行上传 + 重试）"""
+        if not self._uploader:
+            self._uploader = create_tos_uploader(self._get_client(), self.bucket)
+        return self._uploader
+
+    @traced("storage.save_image")
+    @timed_storage_write("save_image")
+    async def save_image(self, image_data: Union[ImageData, str], filename: str = None, folder: str = "") -> Tuple[str, str]:
         """上传图片到TOS"""
         if not self._is_configured():
             raise RuntimeError("TOS未配置，请设置环境变量")
 
-        # 提取base64数据
-        base64_data, ext = self._extract_base64(image_data)
+        image = self._to_image(image_data)
+        object_key = self._object_key(filename, folder, image.extension)
 
-        # 生成文件名
-        if not filename:
-            filename = self._generate_filename()
-        if not filename.endswith(f'.{ext}'):
-            filename = f"{filename}.{ext}"
+        # 解码图片
+        image_bytes = await image.load()
 
-        # 构建对象Key
-        if folder:
-            object_key = f"{folder}/{filename}"
-        else:
-            object_key = filename
+        # 在上传线程池中上传到TOS，不阻塞事件循环
+        await self._get_uploader().upload(object_key, image_bytes, content_type=image.mime_type)
 
-        # 解码图片
-        image_bytes = base64.b64decode(base64_data)
+        # 构建公网URL；同一对象被覆盖，清除图生图原图缓存中的旧图
+        public_url = f"https://{self.public_domain}/{object_key}"
+        invalidate_source_image(public_url)
 
-        # 上传到TOS
-        client = self._get_client()
-        client.put_object(
-            bucket=self.bucket,
-            key=object_key,
-            content=image_bytes
-        )
+        logger.info(f"☁️ [{log_tag('VolcengineTOS')}] 上传成功: {object_key} -> {public_url}")
 
-        # 构建公网URL
+        return object_key, public_url
+
+    @traced("storage.save_stream")
+    @timed_storage_write("save_stream")
+    async def save_stream(self, chunks: AsyncIterator[bytes], filename: str = None, folder: str = "",
+                          mime_type: str = "image/png") -> Tuple[str, str]:
+        """边接收边上传到TOS（大对象按分片上传）"""
+        if not self._is_configured():
+            raise RuntimeError("TOS未配置，请设置环境变量")
+
+        object_key = self._object_key(filename, folder, mime_to_extension(mime_type))
+        size = await self._get_uploader().upload_stream(object_key, chunks, content_type=mime_type)
         public_url = f"https://{self.public_domain}/{object_key}"
+        invalidate_source_image(public_url)
 
-        print(f"☁️ [VolcengineTOS] 上传成功: {object_key} -> {public_url}")
+        logger.info(f"☁️ [{log_tag('VolcengineTOS')}] 流式上传成功: {object_key} ({size} bytes) -> {public_url}")
 
         return object_key, public_url
 
+    def _object_key(self, filename: Optional[str], folder: str, ext: str) -> str:
+        """构建对象Key"""
+        # 生成文件名
+        if not filename:
+            filename = self._generate_filename()
+        if not filename.endswith(f'.{ext}'):
+            filename = f"{filename}.{ext}"
+
+        if folder:
+            return f"{folder}/{filename}"
+        return filename
+
     def get_public_url(self, filename: str, folder: str = "") -> str:
         """获取公网URL"""
         if folder:
@@ -231,6 +409,14 @@ class VolcengineTOSProvider(ImageStorageProvider):
         """TOS URL可被外部访问"""
         return True
 
+    def close(self):
+        if self._uploader:
+            self._uploader.shutdown()
+            self._uploader = None
+
+    def get_stats(self) -> dict:
+        return {"uploader": self._uploader.get_stats() if self._uploader else None}
+
 
 class AliyunOSSProvider(ImageStorageProvider):
     """
@@ -257,7 +443,7 @@ class AliyunOSSProvider(ImageStorageProvider):
     def _is_configured(self) -> bool:
         return all([self.access_key_id, self.access_key_secret, self.endpoint, self.bucket])
 
-    async def save_image(self, image_data: str, filename: str = None, folder: str = "") -> Tuple[str, str]:
+    async def save_image(self, image_data: Union[ImageData, str], filename: str = None, folder: str = "") -> Tuple[str, str]:
         """上传图片到OSS（待实现）"""
         raise NotImplementedError("阿里云OSS Provider待实现，请安装oss2并完成代码")
 
@@ -295,7 +481,7 @@ class TencentCOSProvider(ImageStorageProvider):
     def _is_configured(self) -> bool:
         return all([self.secret_id, self.secret_key, self.region, self.bucket])
 
-    async def save_image(self, image_data: str, filename: str = None, folder: str = "") -> Tuple[str, str]:
+    async def save_image(self, image_data: Union[ImageData, str], filename: str = None, folder: str = "") -> Tuple[str, str]:
         """上传图片到COS（待实现）"""
         raise NotImplementedError("腾讯云COS Provider待实现")
 
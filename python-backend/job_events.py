@@ -0,0 +1,173 @@
+"""
+任务事件推送模块
+前端原先只能在 /api/generate-image 等长请求返回时才得知结果。本模块把后台任务（见 job_queue）
+的每次状态变化作为事件广播给所有订阅者，前端通过一个SSE连接即可跟踪整本书的生成进度。
+
+事件类型：
+- queued: 任务已创建
+- submitted: 已提交到上游（文生图/图生图附带 taskId）
+- polling: 上游任务查询中（附带轮询次数）
+- upstream_done: 上游任务完成，正在保存结果
+- stored: 结果已保存（附带与同步接口相同的 data）
+- failed: 任务失败（附带 error）
+
+每个事件带递增的 id（服务重启后仍递增），并在内存中保留最近 JOB_EVENT_HISTORY 条，
+客户端断线重连时携带 Last-Event-ID 即可补齐错过的事件。
+polling 事件只推送给在线的订阅者，不进入历史：批量生成时轮询事件数量远多于其他事件，
+会把任务的结束事件挤出历史。按 job_ids 订阅时，历史中已没有结束事件的已结束任务
+从任务库（见 job_queue）读取结果补发一个带 snapshot 标记的 stored / failed 事件，订阅者不会一直等待。
+
+通过环境变量配置：
+- JOB_EVENT_HISTORY: 保留的历史事件数（默认1000）
+- JOB_EVENT_QUEUE_SIZE: 每个订阅者的缓冲事件数，消费过慢超出时断开连接（默认1000）
+"""
+
+import os
+import asyncio
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Optional, Set
+
+# 结束事件：任务不会再有后续事件
+TERMINAL_EVENTS = {"stored", "failed"}
+# 只推送给在线订阅者、不保留历史的事件
+TRANSIENT_EVENTS = {"polling"}
+
+
+class _Subscriber:
+    """一个事件订阅者（一个SSE连接）"""
+
+    def __init__(self, queue_size: int, job_ids: Optional[Set[str]]):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.job_ids = job_ids
+        self.overflowed = False
+
+    def accepts(self, event: dict) -> bool:
+        return self.job_ids is None or event["jobId"] in self.job_ids
+
+
+class JobEventBus:
+    """任务事件广播"""
+
+    def __init__(self, history_size: int = 1000, queue_size: int = 1000):
+        self.history_size = history_size
+        self.queue_size = queue_size
+
+        self._history: Deque[dict] = deque(maxlen=history_size)
+        self._subscribers: Set[_Subscriber] = set()
+        # 以启动时的毫秒时间戳为起点，服务重启后事件id仍然递增
+        self._last_id = int(time.time() * 1000)
+
+        # 统计数据
+        self._published = 0
+        self._dropped_subscribers = 0
+
+        print(f"📣 [JobEventBus] 初始化，历史事件: {history_size}，订阅缓冲: {queue_size}")
+
+    def publish(self, event_type: str, job_id: str, kind: str, **data):
+        """发布一个任务事件"""
+        self._last_id += 1
+        event = {
+            "id": self._last_id,
+            "type": event_type,
+            "jobId": job_id,
+            "kind": kind,
+            "timestamp": time.time(),
+            **data
+        }
+        if event_type not in TRANSIENT_EVENTS:
+            self._history.append(event)
+        self._published += 1
+
+        for subscriber in list(self._subscribers):
+            if not subscriber.accepts(event):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # 消费过慢：断开该订阅者，客户端可携带 Last-Event-ID 重连补齐
+                subscriber.overflowed = True
+                self._subscribers.discard(subscriber)
+                self._dropped_subscribers += 1
+
+    async def subscribe(self, job_ids: Optional[Set[str]] = None, last_event_id: Optional[int] = None,
+                        keepalive: float = 15.0,
+                        terminal_lookup: Optional[Callable[[str], Optional[dict]]] = None
+                        ) -> AsyncIterator[Optional[dict]]:
+        """
+        订阅事件
+
+        Args:
+            job_ids: 只接收这些任务的事件；None 表示所有任务
+            last_event_id: 从该事件之后开始补发历史事件；指定了 job_ids 时默认补发这些任务的全部历史事件
+            keepalive: 无事件时每隔该秒数产出一次None，用于发送心跳
+            terminal_lookup: 查询已结束任务的结束事件 terminal_lookup(job_id)，未结束时返回None；
+                             用于补发已不在历史中的结束事件
+
+        Yields:
+            事件字典，或心跳时为None
+        """
+        subscriber = _Subscriber(self.queue_size, job_ids)
+        if last_event_id is None and job_ids is not None:
+            last_event_id = 0
+        if last_event_id is not None:
+            missed = [event for event in self._history
+                      if event["id"] > last_event_id and subscriber.accepts(event)]
+            if job_ids is not None and terminal_lookup is not None:
+                missed.extend(self._terminal_snapshots(job_ids, terminal_lookup))
+            for event in missed[-self.queue_size:]:
+                subscriber.queue.put_nowait(event)
+        # 补发与注册之间没有 await，不会漏掉期间发布的事件
+        self._subscribers.add(subscriber)
+
+        try:
+            while True:
+                if subscriber.overflowed and subscriber.queue.empty():
+                    return
+                try:
+                    yield await asyncio.wait_for(subscriber.queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._subscribers.discard(subscriber)
+
+    def _terminal_snapshots(self, job_ids: Set[str], terminal_lookup: Callable[[str], Optional[dict]]):
+        """历史中已没有结束事件的任务，从任务库读取结束状态"""
+        finished = {event["jobId"] for event in self._history
+                    if event["type"] in TERMINAL_EVENTS and event["jobId"] in job_ids}
+        snapshots = []
+        for job_id in sorted(job_ids - finished):
+            event = terminal_lookup(job_id)
+            if event is not None:
+                snapshots.append({"id": self._last_id, **event, "snapshot": True})
+        return snapshots
+
+    def get_stats(self) -> dict:
+        """获取事件推送状态"""
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self._published,
+            "last_event_id": self._last_id,
+            "dropped_subscribers": self._dropped_subscribers,
+        }
+
+
+# ============ 工厂函数 ============
+
+_bus_instance: Optional[JobEventBus] = None
+
+def get_job_event_bus() -> JobEventBus:
+    """
+    获取任务事件广播实例（单例模式）
+    通过环境变量 JOB_EVENT_HISTORY / JOB_EVENT_QUEUE_SIZE 配置
+    """
+    global _bus_instance
+
+    if _bus_instance is not None:
+        return _bus_instance
+
+    _bus_instance = JobEventBus(
+        history_size=int(os.getenv('JOB_EVENT_HISTORY', 1000)),
+        queue_size=int(os.getenv('JOB_EVENT_QUEUE_SIZE', 1000))
+    )
+    return _bus_instance
@@ -0,0 +1,309 @@
+"""
+持久化任务队列模块
+/api/generate-image 和 /api/edit-image 同步等待提交和轮询全过程（最长 POLL_TIMEOUT 秒），
+服务重启时所有进行中的请求都会丢失，而即梦仍会完成这些任务并计费。
+
+本模块把生成请求作为任务（job）持久化到SQLite：
+- 提交后立即返回 job_id，实际工作在后台协程中执行，通过状态/结果接口查询
+- 获得上游 task_id 后立即写入数据库
+- 服务重启时恢复未完成的任务：已有 task_id 的直接继续轮询，不重新提交
+- 每次状态变化都通过 job_events 广播，前端可通过SSE订阅
+
+任务状态：queued → submitted → upstream_done → succeeded，任一步骤出错则为 failed
+
+SQLite读写是同步的磁盘IO，JobManager / JobContext 在线程中执行（asyncio.to_thread），磁盘慢时不阻塞事件循环
+
+通过环境变量配置：
+- JOB_STORE_PATH: SQLite文件路径（默认 python-backend/data/jobs.db）
+- JOB_RETENTION: 已结束任务的保留秒数（默认7天）
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import asyncio
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from job_events import get_job_event_bus
+from app_logging import get_logger
+
+logger = get_logger("job_queue")
+
+FINISHED_STATUSES = ("succeeded", "failed")
+_FINISHED_PLACEHOLDERS = ", ".join("?" * len(FINISHED_STATUSES))
+
+
+class JobStore:
+    """基于SQLite的任务状态存储"""
+
+    def __init__(self, db_path: str, retention: float = 7 * 24 * 3600):
+        self.db_path = Path(db_path)
+        self.retention = retention
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                request TEXT NOT NULL,
+                req_key TEXT,
+                task_id TEXT,
+                submitted_at REAL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+        self._conn.commit()
+
+    def create(self, kind: str, request: dict) -> str:
+        """新建任务，返回 job_id"""
+        job_id = f"job_{uuid.uuid4().hex}"
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, kind, status, request, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(request, ensure_ascii=False), now, now)
+            )
+            # 顺便清理过期的已结束任务
+            self._conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({_FINISHED_PLACEHOLDERS}) AND updated_at < ?",
+                (*FINISHED_STATUSES, now - self.retention)
+            )
+            self._conn.commit()
+        return job_id
+
+    def update(self, job_id: str, **fields):
+        """更新任务字段（status / req_key / task_id / submitted_at / result / error）"""
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False)
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """查询任务，不存在时返回None"""
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+            row = cursor.fetchone()
+            columns = [column[0] for column in cursor.description]
+        return self._to_job(columns, row) if row else None
+
+    def list_unfinished(self) -> List[dict]:
+        """列出所有未结束的任务（按创建时间排序）"""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT * FROM jobs WHERE status NOT IN ({_FINISHED_PLACEHOLDERS}) ORDER BY created_at",
+                FINISHED_STATUSES
+            )
+            rows = cursor.fetchall()
+            columns = [column[0] for column in cursor.description]
+        return [self._to_job(columns, row) for row in rows]
+
+    def count_by_status(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    @staticmethod
+    def _to_job(columns: List[str], row: tuple) -> dict:
+        job = dict(zip(columns, row))
+        job["request"] = json.loads(job["request"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass
+class JobContext:
+    """传给任务执行函数的上下文，用于记录上游任务ID和状态变化"""
+    job_id: str
+    kind: str
+    store: JobStore
+    task_id: Optional[str] = None
+    submitted_at: Optional[float] = None
+
+    def publish(self, event_type: str, **data):
+        get_job_event_bus().publish(event_type, self.job_id, self.kind, **data)
+
+    async def mark_submitted(self, task_id: Optional[str] = None, req_key: Optional[str] = None):
+        """
+        已提交到上游：立即持久化 task_id，重启后据此继续轮询
+        没有上游任务ID的任务（如音频合成）重启后重新执行
+        """
+        self.task_id = task_id
+        self.submitted_at = time.time()
+        await asyncio.to_thread(self.store.update, self.job_id, status="submitted", task_id=task_id,
+                                req_key=req_key, submitted_at=self.submitted_at)
+        self.publish("submitted", taskId=task_id)
+
+    def mark_polling(self, poll_index: int):
+        """发起了一次上游查询（只推送事件，不写数据库）"""
+        self.publish("polling", taskId=self.task_id, poll=poll_index)
+
+    async def mark_upstream_done(self):
+        """上游任务已完成，正在保存结果"""
+        await asyncio.to_thread(self.store.update, self.job_id, status="upstream_done")
+        self.publish("upstream_done", taskId=self.task_id)
+
+
+# 任务执行函数：runner(request, context) 返回结果数据
+JobRunner = Callable[[dict, JobContext], Awaitable[dict]]
+
+
+class JobManager:
+    """任务调度：创建任务、在后台执行、服务重启后恢复"""
+
+    def __init__(self, store: JobStore):
+        self.store = store
+        self._runners: Dict[str, JobRunner] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+        # 统计数据
+        self._submitted = 0
+        self._resumed = 0
+        self._succeeded = 0
+        self._failed = 0
+
+        print(f"📋 [JobManager] 初始化，路径: {store.db_path}")
+
+    def register(self, kind: str, runner: JobRunner):
+        """注册某类任务的执行函数"""
+        self._runners[kind] = runner
+
+    async def submit(self, kind: str, request: dict) -> str:
+        """创建任务并在后台执行，立即返回 job_id"""
+        if kind not in self._runners:
+            raise ValueError(f"未知的任务类型: {kind}")
+        job_id = await asyncio.to_thread(self.store.create, kind, request)
+        self._submitted += 1
+        context = JobContext(job_id=job_id, kind=kind, store=self.store)
+        context.publish("queued")
+        self._start(context, request)
+        return job_id
+
+    async def resume(self) -> int:
+        """恢复上次运行时未结束的任务，返回恢复的数量"""
+        jobs = await asyncio.to_thread(self.store.list_unfinished)
+        for job in jobs:
+            if job["kind"] not in self._runners:
+                await asyncio.to_thread(self.store.update, job["job_id"], status="failed",
+                                        error=f"未知的任务类型: {job['kind']}")
+                continue
+            context = JobContext(job_id=job["job_id"], kind=job["kind"], store=self.store,
+                                 task_id=job["task_id"], submitted_at=job["submitted_at"])
+            self._start(context, job["request"])
+            self._resumed += 1
+            print(f"♻️ [JobManager] 恢复任务 {job['job_id']}，状态: {job['status']}，task_id: {job['task_id']}")
+        return len(jobs)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def terminal_events(self, job_ids: Set[str]) -> Dict[str, dict]:
+        """批量查询已结束任务的结束事件 {job_id: 事件}（在线程中读取任务库）"""
+        def lookup():
+            events = {job_id: self.terminal_event(job_id) for job_id in job_ids}
+            return {job_id: event for job_id, event in events.items() if event is not None}
+        return await asyncio.to_thread(lookup)
+
+    def terminal_event(self, job_id: str) -> Optional[dict]:
+        """已结束任务的结束事件（stored / failed，字段与广播的事件相同），未结束或不存在时返回None"""
+        job = self.store.get(job_id)
+        if job is None or job["status"] not in FINISHED_STATUSES:
+            return None
+        event = {"jobId": job_id, "kind": job["kind"], "timestamp": job["updated_at"]}
+        if job["status"] == "succeeded":
+            return {"type": "stored", **event, "data": job["result"]}
+        return {"type": "failed", **event, "error": job["error"]}
+
+    def _start(self, context: JobContext, request: dict):
+        task = asyncio.create_task(self._run(context, request))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, context: JobContext, request: dict):
+        runner = self._runners[context.kind]
+        try:
+            result = await runner(request, context)
+        except Exception as e:
+            # HTTPException 的信息在 detail 中
+            error = getattr(e, "detail", None) or str(e)
+            await asyncio.to_thread(self.store.update, context.job_id, status="failed", error=str(error))
+            context.publish("failed", error=str(error))
+            self._failed += 1
+            logger.error(f"❌ [JobManager] 任务 {context.job_id} 失败: {error}")
+            return
+        await asyncio.to_thread(self.store.update, context.job_id, status="succeeded", result=result)
+        context.publish("stored", data=result)
+        self._succeeded += 1
+
+    @property
+    def running(self) -> int:
+        """后台执行中的任务数"""
+        return len(self._tasks)
+
+    def get_stats(self) -> dict:
+        """获取任务统计（查询任务库，异步代码中应在线程中调用）"""
+        return {
+            "running": self.running,
+            "submitted": self._submitted,
+            "resumed": self._resumed,
+            "succeeded": self._succeeded,
+            "failed": self._failed,
+            "by_status": self.store.count_by_status(),
+        }
+
+    def shutdown(self):
+        """取消后台执行的任务（状态保留在数据库中，下次启动时恢复）"""
+        for task in list(self._tasks):
+            task.cancel()
+        self._tasks.clear()
+        self.store.close()
+        print(f"📋 [JobManager] 已关闭")
+
+
+# ============ 工厂函数 ============
+
+_manager_instance: Optional[JobManager] = None
+
+def get_job_manager() -> JobManager:
+    """
+    获取任务调度实例（单例模式）
+    通过环境变量 JOB_STORE_PATH / JOB_RETENTION 配置
+    """
+    global _manager_instance
+
+    if _manager_instance is not None:
+        return _manager_instance
+
+    default_path = Path(__file__).parent / "data" / "jobs.db"
+    store = JobStore(
+        db_path=os.getenv('JOB_STORE_PATH', str(default_path)),
+        retention=float(os.getenv('JOB_RETENTION', 7 * 24 * 3600))
+    )
+    _manager_instance = JobManager(store)
+    return _manager_instance
+
+
+def shutdown_job_manager():
+    """停止并重置任务调度实例"""
+    global _manager_instance
+    if _manager_instance is not None:
+        _manager_instance.shutdown()
+        _manager_instance = None
@@ -7,9 +7,11 @@ import os
 import json
 import asyncio
 import time
-from typing import Optional
-from fastapi import FastAPI, HTTPException
+from typing import List, Optional, Union
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from dotenv import load_dotenv
@@ -19,10 +21,74 @@ from pathlib import Path
 load_dotenv()
 
 # 导入图片存储模块
-from image_storage import get_storage_provider
+from image_storage import get_storage_provider, ImageData
 
 # 导入音频服务模块
-from audio_service import get_audio_provider
+from audio_service import get_audio_provider, make_streaming_wav_header
+
+# 导入上游结果转存（下载即梦结果URL并流式写入存储）
+from image_ingest import get_image_ingestor
+
+# 导入图生图原图缓存
+from source_image_cache import get_source_image_cache, SourceImageError
+
+# 导入图生图原图预处理（缩放 + 重新编码，依赖可选的Pillow）
+from image_preprocess import get_image_preprocessor
+
+# 导入衍生图生成器（进程池中生成缩略图/预览图）
+from image_derivatives import get_derivative_generator, shutdown_derivative_generator
+
+# 导入共享HTTP客户端
+from http_client import close_http_client
+
+# 导入音频编码器（进程池中编码为MP3/Opus/AAC）
+from audio_encoder import get_audio_encoder, shutdown_audio_encoder
+
+# 导入SDK调用执行器（同步SDK调用放到线程池中执行）
+from sdk_executor import get_sdk_executor, shutdown_sdk_executor
+
+# 导入火山引擎视觉服务客户端池
+from visual_client_pool import (
+    get_visual_client_pool, get_visual_client_pool_stats, reset_visual_client_pool, VisualCredentialsError
+)
+
+# 导入任务轮询调度器（自适应间隔集中轮询所有未完成任务）
+from poll_scheduler import get_poll_scheduler, shutdown_poll_scheduler, PollTimeoutError
+
+# 导入上游限流器（并发名额 + 提交QPS）
+from rate_limiter import (
+    get_upstream_limiter, BacklogFullError, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BULK
+)
+
+# 导入生成结果缓存
+from result_cache import get_result_cache, reset_result_cache, make_cache_key
+
+# 导入上游调用重试策略（按错误分类分别重试提交和查询）
+from upstream_retry import get_retry_policy, classify_response, classify_exception, ERROR_HTTP_STATUS
+
+# 导入持久化任务队列（异步提交、状态查询、重启后恢复轮询）
+from job_queue import get_job_manager, shutdown_job_manager, JobContext
+from job_events import get_job_event_bus
+
+# 导入请求合并（相同请求并发时只执行一次）
+from single_flight import get_single_flight, get_single_flight_stats, make_request_key
+
+# 导入结构化日志（生成链路的提交/轮询日志：分级、脱敏截断、轮询采样、后台线程写出）
+from app_logging import get_logger, get_log_pipeline, shutdown_logging, redact
+
+# 导入监控指标（/metrics，Prometheus文本格式）
+from metrics import (
+    render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE, SUBMIT_LATENCY, IMAGE_GENERATION_LATENCY,
+    UPSTREAM_IN_FLIGHT, UPSTREAM_WAITING, POLL_OUTSTANDING, JOBS_RUNNING, SINGLE_FLIGHT_IN_FLIGHT
+)
+
+# 导入请求追踪（不重复的请求ID、各阶段span、本地JSONL导出）
+from tracing import (
+    new_request_id, get_request_id, start_span, set_span_attributes, traced,
+    get_span_exporter, shutdown_span_exporter
+)
+
+logger = get_logger("main")
 
 # 尝试导入火山引擎SDK
 try:
@@ -47,6 +113,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Audio-Url"],
 )
 
 # 挂载静态文件目录（用于本地存储模式）
@@ -64,12 +131,20 @@ class ImageGenerationRequest(BaseModel):
     prompt: str
     frame: Optional[dict] = None
     save_to_storage: bool = True  # 是否保存到存储（返回URL而非base64）
+    use_cache: bool = True  # 是否使用结果缓存（相同提示词、尺寸和保存目标直接返回已保存的图片；重新生成时传false）
 
 class ImageGenerationResponse(BaseModel):
     success: bool
     data: Optional[dict] = None
     error: Optional[str] = None
 
+# 批量图片生成请求模型（分镜页 + 角色）
+class BatchImageGenerationRequest(BaseModel):
+    frames: List[dict]  # 每项为 frame 数据，提示词取 prompt 或 jimengPrompt
+    save_to_storage: bool = True
+    use_cache: bool = True
+    stream_format: str = "sse"  # 结果推送格式：sse 或 ndjson
+
 # 音频生成请求模型
 class AudioGenerationRequest(BaseModel):
     text: str
@@ -77,6 +152,7 @@ class AudioGenerationRequest(BaseModel):
     speaker_id: str = "child"
     speed_factor: str = "1.0"
     pitch_factor: str = "1.0"
+    output_format: Optional[str] = None  # wav / mp3 / opus / aac，默认由 AUDIO_OUTPUT_FORMAT 决定
 
 class AudioGenerationResponse(BaseModel):
     success: bool
@@ -98,43 +174,27 @@ class ImageEditResponse(BaseModel):
 # 常量配置
 REQ_KEY = "jimeng_t2i_v40"  # 即梦V4模型
 REQ_KEY_I2I = "jimeng_high_aes_i2i"  # 即梦图生图模型
-MAX_POLL_TIMES = 150  # 最大轮询次数
-POLL_INTERVAL = 2  # 轮询间隔(秒)
 
-def create_visual_service():
-    """创建并配置火山引擎视觉服务实例"""
+def get_visual_service_pool():
+    """获取火山引擎视觉服务客户端池（启动时创建，之后所有请求复用）"""
     if not SDK_AVAILABLE:
         raise HTTPException(status_code=500, detail="火山引擎SDK未安装")
 
-    # 获取环境变量
-    access_key = os.getenv('VOLCENGINE_ACCESS_KEY_ID')
-    secret_key = os.getenv('VOLCENGINE_SECRET_ACCESS_KEY')
+    try:
+        return get_visual_client_pool()
+    except VisualCredentialsError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-    if not access_key or not secret_key:
-        raise HTTPException(
-            status_code=500,
-            detail="未配置VOLCENGINE_ACCESS_KEY_ID或VOLCENGINE_SECRET_ACCESS_KEY"
-        )
+async def call_visual_api(method_name: str, form: dict) -> dict:
+    """从客户端池借出VisualService，在SDK执行器线程中调用指定方法"""
+    pool = get_visual_service_pool()
 
-    # 检查密钥是否是Base64编码的，如果是则解码
-    import base64
-    try:
-        # 尝试解码
-        decoded_access_key = base64.b64decode(access_key).decode('utf-8')
-        decoded_secret_key = base64.b64decode(secret_key).decode('utf-8')
-        print(f"🔑 [密钥解码] 使用解码后的密钥")
-        access_key = decoded_access_key
-        secret_key = decoded_secret_key
-    except:
-        # 如果解码失败，使用原始密钥
-        print(f"🔑 [密钥直接] 使用原始密钥")
-
-    # 创建服务实例
-    visual_service = VisualService()
-    visual_service.set_ak(access_key.strip())
-    visual_service.set_sk(secret_key.strip())
-
-    return visual_service
+    def invoke():
+        with pool.checkout() as visual_service:
+            return getattr(visual_service, method_name)(form)
+    invoke.__name__ = method_name
+
+    return await get_sdk_executor().run(invoke)
 
 # 画幅尺寸映射表（即梦API支持的尺寸）
 ASPECT_RATIO_SIZES = {
@@ -148,125 +208,236 @@ ASPECT_RATIO_SIZES = {
     "2:3": {"width": 1080, "height": 1620},
 }
 
-async def generate_image_with_sdk(prompt: str, request_id: str = None, aspect_ratio: str = "16:9") -> str:
+def build_t2i_submit_form(prompt: str, aspect_ratio: str = "16:9") -> dict:
+    """构建文生图提交参数（同时用作结果缓存的键）"""
+    size_config = ASPECT_RATIO_SIZES.get(aspect_ratio, ASPECT_RATIO_SIZES["16:9"])
+    return {
+        "req_key": REQ_KEY,
+        "prompt": prompt,
+        # 尺寸参数
+        "width": size_config["width"],
+        "height": size_config["height"],
+        # 可选参数
+        "return_url": True,
+        "logo_info": {
+            "add_logo": False,
+            "position": 0,
+            "language": 0,
+            "opacity": 1
+        }
+    }
+
+def parse_t2i_query_response(query_resp: dict, poll_index: int, request_id: str) -> Optional[Union[str, ImageData]]:
+    """解析文生图查询响应
+
+    Returns:
+        图片URL或图片数据；任务仍在处理时返回None
+
+    Raises:
+        HTTPException: 查询失败或任务执行失败
+    """
+    logger.info(f"🔄 [Python后端-{request_id}] 轮询第 {poll_index} 次", extra={"poll": poll_index})
+
+    # 检查响应错误 - 适配新的响应格式
+    if query_resp.get('ResponseMetadata', {}).get('Error'):
+        error_info = query_resp['ResponseMetadata']['Error']
+        logger.error(f"❌ [Python后端-{request_id}] 查询失败 - ResponseMetadata错误", extra={"fields": {"error": error_info}})
+        raise HTTPException(
+            status_code=500,
+            detail=f"查询任务失败: {error_info.get('Message')} (Code: {error_info.get('Code')})"
+        )
+
+    # 检查新的响应格式错误
+    if query_resp.get('code') and query_resp.get('code') != 10000:
+        logger.error(f"❌ [Python后端-{request_id}] 查询失败 - 业务错误",
+                     extra={"fields": {"code": query_resp.get('code'), "message": query_resp.get('message')}})
+        raise HTTPException(
+            status_code=500,
+            detail=f"查询任务失败: {query_resp.get('message')} (Code: {query_resp.get('code')})"
+        )
+
+    query_data = query_resp.get('data', {}) or query_resp.get('Result', {})
+    status = query_data.get('status')
+
+    logger.debug(f"📊 [Python后端-{request_id}] 任务状态: {status}", extra={"poll": poll_index})
+
+    # 优先检查是否有 image_urls
+    if query_data.get('image_urls') and len(query_data['image_urls']) > 0:
+        image_url = query_data['image_urls'][0]
+        logger.info(f"🎉 [Python后端-{request_id}] 获得图片URL", extra={"fields": {"image_url": image_url}})
+        return image_url
+
+    # 检查是否有 binary_data_base64 (即梦V4常见情况)
+    if query_data.get('binary_data_base64') and len(query_data['binary_data_base64']) > 0:
+        base64_data = query_data['binary_data_base64'][0]
+        logger.info(f"📷 [Python后端-{request_id}] 获得base64图片数据，长度: {len(base64_data)}")
+        return ImageData.from_base64(base64_data)
+
+    # 检查任务状态
+    if status == 1 or status == 10000 or status == "done":
+        # 任务成功，尝试提取图片URL
+        logger.debug(f"✅ [Python后端-{request_id}] 任务状态成功，尝试提取图片URL...", extra={"poll": poll_index})
+        image_url = query_data.get('image_url')
+
+        # 如果没有直接的image_url，尝试解析resp_data
+        if not image_url and query_data.get('resp_data'):
+            try:
+                logger.debug(f"🔍 [Python后端-{request_id}] 解析resp_data...", extra={"poll": poll_index})
+                resp_data = query_data['resp_data']
+                if isinstance(resp_data, str):
+                    resp_data = json.loads(resp_data)
+
+                if resp_data.get('image_urls') and len(resp_data['image_urls']) > 0:
+                    image_url = resp_data['image_urls'][0]
+                    logger.debug(f"📷 [Python后端-{request_id}] 从resp_data提取到图片URL",
+                                 extra={"fields": {"image_url": image_url}})
+            except (json.JSONDecodeError, KeyError) as e:
+                logger.warning(f"⚠️ [Python后端-{request_id}] 解析resp_data失败: {e}")
+
+        if image_url:
+            logger.info(f"🎉 [Python后端-{request_id}] 最终获得图片URL", extra={"fields": {"image_url": image_url}})
+            return image_url
+        else:
+            logger.info(f"⏳ [Python后端-{request_id}] 状态成功但图片URL尚未生成，继续等待...", extra={"poll": poll_index})
+
+    elif status == 2 or status == -1 or status == "failed":
+        logger.error(f"❌ [Python后端-{request_id}] 任务执行失败，状态: {status}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"任务执行失败 (Status: {status})"
+        )
+    else:
+        logger.debug(f"⏳ [Python后端-{request_id}] 任务处理中，状态: {status}", extra={"poll": poll_index})
+
+    return None
+
+@traced("jimeng.generate")
+async def generate_image_with_sdk(prompt: str, request_id: str = None, aspect_ratio: str = "16:9",
+                                  job: Optional[JobContext] = None,
+                                  priority: int = PRIORITY_NORMAL) -> Union[str, ImageData]:
     """使用官方SDK生成图片
 
     Args:
         prompt: 提示词
         request_id: 请求ID
         aspect_ratio: 画幅比例，支持 16:9, 4:3, 1:1, 3:4, 9:16 等
+        job: 后台任务上下文；已记录上游 task_id 时（服务重启后恢复）跳过提交直接轮询
+        priority: 上游名额排队优先级（见 rate_limiter）
     """
 
     if not request_id:
-        request_id = f"img_{int(time.time())}"
+        request_id = get_request_id() or new_request_id("img")
 
     # 获取尺寸
     size_config = ASPECT_RATIO_SIZES.get(aspect_ratio, ASPECT_RATIO_SIZES["16:9"])
 
-    print(f"\n🎨 [Python后端-{request_id}] API启动")
-    print(f"📝 [Python后端-{request_id}] 生成参数:", {
+    logger.info(f"🎨 [Python后端-{request_id}] API启动")
+    logger.info(f"📝 [Python后端-{request_id}] 生成参数", extra={"fields": {
         "prompt": f"{prompt[:50]}..." if len(prompt) > 50 else prompt,
         "prompt_length": len(prompt),
         "aspect_ratio": aspect_ratio,
         "size": f"{size_config['width']}x{size_config['height']}",
         "timestamp": time.strftime('%Y-%m-%d %H:%M:%S')
-    })
+    }})
 
     if not SDK_AVAILABLE:
         # 演示模式 - 返回模拟URL
-        print(f"⚠️ [Python后端-{request_id}] 演示模式: SDK未安装，返回模拟图片URL")
+        logger.warning(f"⚠️ [Python后端-{request_id}] 演示模式: SDK未安装，返回模拟图片URL")
         await asyncio.sleep(2)  # 模拟处理时间
         demo_url = f"https://example.com/demo-image-{int(time.time())}.jpg"
-        print(f"✅ [Python后端-{request_id}] 演示模式完成: {demo_url}")
+        logger.info(f"✅ [Python后端-{request_id}] 演示模式完成: {demo_url}")
         return demo_url
 
-    # 创建服务实例
-    print(f"🔧 [Python后端-{request_id}] 初始化火山引擎SDK...")
-    visual_service = create_visual_service()
-    print(f"✅ [Python后端-{request_id}] SDK初始化完成")
+    # 检查客户端池可用（未配置密钥时直接报错）
+    get_visual_service_pool()
 
     # --- Step 1: 提交任务 ---
-    print(f"\n🚀 [Python后端-{request_id}] Step 1: 提交任务...")
-
-    submit_form = {
-        "req_key": REQ_KEY,
-        "prompt": prompt,
-        # 尺寸参数
-        "width": size_config["width"],
-        "height": size_config["height"],
-        # 可选参数
-        "return_url": True,
-        "logo_info": {
-            "add_logo": False,
-            "position": 0,
-            "language": 0,
-            "opacity": 1
-        }
-    }
+    logger.info(f"🚀 [Python后端-{request_id}] Step 1: 提交任务...")
 
-    print(f"📤 [Python后端-{request_id}] 提交参数: {json.dumps(submit_form, indent=2, ensure_ascii=False)}")
+    submit_form = build_t2i_submit_form(prompt, aspect_ratio)
 
-    try:
-        submit_start = time.time()
-        submit_resp = visual_service.cv_sync2async_submit_task(submit_form)
-        submit_time = time.time() - submit_start
-
-        print(f"📥 [Python后端-{request_id}] 提交响应 (耗时: {submit_time:.2f}s): {json.dumps(submit_resp, indent=2, ensure_ascii=False)}")
-
-        # 检查响应状态
-        if submit_resp.get('ResponseMetadata', {}).get('Error'):
-            error_info = submit_resp['ResponseMetadata']['Error']
-            print(f"❌ [Python后端-{request_id}] 任务提交失败 - ResponseMetadata错误: {error_info}")
-            raise HTTPException(
-                status_code=400,
-                detail=f"任务提交失败: {error_info.get('Message')} (Code: {error_info.get('Code')})"
-            )
-
-        # 检查新的响应格式
-        if submit_resp.get('code') != 10000:
-            print(f"❌ [Python后端-{request_id}] 任务提交失败 - 业务错误: code={submit_resp.get('code')}, message={submit_resp.get('message')}")
-            raise HTTPException(
-                status_code=400,
-                detail=f"任务提交失败: {submit_resp.get('message')} (Code: {submit_resp.get('code')})"
-            )
-
-        # 获取任务ID - 适配新的响应格式
-        submit_data = submit_resp.get('data', {}) or submit_resp.get('Result', {})
-        print(f"📊 [Python后端-{request_id}] 解析提交数据: {json.dumps(submit_data, indent=2, ensure_ascii=False)}")
-
-        # 检查是否直接返回图片URLs（少见情况）
-        if submit_data.get('image_urls'):
-            result_url = submit_data['image_urls'][0]
-            print(f"✅ [Python后端-{request_id}] 同步成功 - 直接获得图片URL: {result_url}")
-            return result_url
-
-        # 检查是否直接返回base64数据（即梦V4常见情况）
-        if submit_data.get('binary_data_base64') and len(submit_data['binary_data_base64']) > 0:
-            base64_data = submit_data['binary_data_base64'][0]
-            print(f"📷 [Python后端-{request_id}] 同步成功 - 获得base64图片数据，长度: {len(base64_data)}")
-
-            # 将base64数据转换为data URL格式，前端可以直接使用
-            data_url = f"data:image/png;base64,{base64_data}"
-            print(f"✅ [Python后端-{request_id}] 转换完成 - 已转换为data URL格式")
-            return data_url
-
-        task_id = submit_data.get('task_id')
-        if not task_id:
-            print(f"❌ [Python后端-{request_id}] 任务提交失败 - 未获得task_id")
-            raise HTTPException(
-                status_code=500,
-                detail=f"任务提交响应异常，未获得task_id: {submit_resp}"
-            )
+    logger.debug(f"📤 [Python后端-{request_id}] 提交参数", extra={"fields": {"submit_form": submit_form}})
 
-        print(f"⏳ [Python后端-{request_id}] Step 2: 获得TaskID: {task_id}，开始轮询...")
-
-        # --- Step 2: 轮询结果 ---
-        for i in range(MAX_POLL_TIMES):
-            await asyncio.sleep(POLL_INTERVAL)
-
-            print(f"🔄 [Python后端-{request_id}] 轮询第 {i+1}/{MAX_POLL_TIMES} 次")
+    # 同步请求在排队已满时直接拒绝；后台任务已被接受，始终排队
+    limiter = get_upstream_limiter()
+    if job is None:
+        try:
+            limiter.admit(REQ_KEY)
+        except BacklogFullError as e:
+            raise HTTPException(status_code=429, detail=str(e))
 
-            # 查询任务状态
+    # 占用上游并发名额，覆盖提交到轮询结束的整个过程
+    async with limiter.slot(REQ_KEY, priority):
+        try:
+            if job is not None and job.task_id:
+                task_id = job.task_id
+                logger.info(f"♻️ [Python后端-{request_id}] 恢复任务，继续轮询 TaskID: {task_id}")
+            else:
+                async def submit():
+                    await limiter.wait_submit(REQ_KEY, priority)
+                    call_start = time.time()
+                    with start_span("jimeng.submit", req_key=REQ_KEY):
+                        resp = await call_visual_api('cv_sync2async_submit_task', submit_form)
+                    SUBMIT_LATENCY.observe(time.time() - call_start, req_key=REQ_KEY)
+                    return resp
+
+                # 限流和5xx退避后重试；提交不是幂等的，请求可能已发出的网络错误不重试
+                submit_start = time.time()
+                submit_resp = await get_retry_policy().run('submit', submit, request_id, idempotent=False)
+                submit_time = time.time() - submit_start
+
+                logger.info(f"📥 [Python后端-{request_id}] 提交响应 (耗时: {submit_time:.2f}s)")
+                logger.debug(f"📥 [Python后端-{request_id}] 提交响应内容", extra={"fields": {"response": submit_resp}})
+
+                # 检查响应状态
+                if submit_resp.get('ResponseMetadata', {}).get('Error'):
+                    error_info = submit_resp['ResponseMetadata']['Error']
+                    logger.error(f"❌ [Python后端-{request_id}] 任务提交失败 - ResponseMetadata错误",
+                                 extra={"fields": {"error": error_info}})
+                    raise HTTPException(
+                        status_code=ERROR_HTTP_STATUS.get(classify_response(submit_resp), 400),
+                        detail=f"任务提交失败: {error_info.get('Message')} (Code: {error_info.get('Code')})"
+                    )
+
+                # 检查新的响应格式
+                if submit_resp.get('code') != 10000:
+                    logger.error(f"❌ [Python后端-{request_id}] 任务提交失败 - 业务错误",
+                                 extra={"fields": {"code": submit_resp.get('code'), "message": submit_resp.get('message')}})
+                    raise HTTPException(
+                        status_code=ERROR_HTTP_STATUS.get(classify_response(submit_resp), 400),
+                        detail=f"任务提交失败: {submit_resp.get('message')} (Code: {submit_resp.get('code')})"
+                    )
+
+                # 获取任务ID - 适配新的响应格式
+                submit_data = submit_resp.get('data', {}) or submit_resp.get('Result', {})
+
+                # 检查是否直接返回图片URLs（少见情况）
+                if submit_data.get('image_urls'):
+                    result_url = submit_data['image_urls'][0]
+                    logger.info(f"✅ [Python后端-{request_id}] 同步成功 - 直接获得图片URL", extra={"fields": {"image_url": result_url}})
+                    return result_url
+
+                # 检查是否直接返回base64数据（即梦V4常见情况）
+                if submit_data.get('binary_data_base64') and len(submit_data['binary_data_base64']) > 0:
+                    base64_data = submit_data['binary_data_base64'][0]
+                    logger.info(f"📷 [Python后端-{request_id}] 同步成功 - 获得base64图片数据，长度: {len(base64_data)}")
+                    return ImageData.from_base64(base64_data)
+
+                task_id = submit_data.get('task_id')
+                if not task_id:
+                    logger.error(f"❌ [Python后端-{request_id}] 任务提交失败 - 未获得task_id",
+                                 extra={"fields": {"response": submit_resp}})
+                    raise HTTPException(
+                        status_code=500,
+                        detail=f"任务提交响应异常，未获得task_id: {redact(submit_resp)}"
+                    )
+
+                if job is not None:
+                    await job.mark_submitted(task_id, REQ_KEY)
+                set_span_attributes(task_id=task_id)
+                logger.info(f"⏳ [Python后端-{request_id}] Step 2: 获得TaskID: {task_id}，开始轮询...")
+
+            # --- Step 2: 轮询结果（由中心调度器按自适应间隔轮询）---
             query_form = {
                 "req_key": REQ_KEY,
                 "task_id": task_id,
@@ -280,102 +451,93 @@ async def generate_image_with_sdk(prompt: str, request_id: str = None, aspect_ra
                 }
             }
 
-            query_start = time.time()
-            query_resp = visual_service.cv_sync2async_get_result(query_form)
-            query_time = time.time() - query_start
+            query_started = {}
 
-            print(f"📥 [Python后端-{request_id}] 查询响应 (耗时: {query_time:.2f}s): {json.dumps(query_resp, indent=2, ensure_ascii=False)}")
-
-            # 检查响应错误 - 适配新的响应格式
-            if query_resp.get('ResponseMetadata', {}).get('Error'):
-                error_info = query_resp['ResponseMetadata']['Error']
-                print(f"❌ [Python后端-{request_id}] 查询失败 - ResponseMetadata错误: {error_info}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"查询任务失败: {error_info.get('Message')} (Code: {error_info.get('Code')})"
+            async def query():
+                query_started["at"] = time.time()
+                # 查询失败只重试查询本身，继续使用已有的 task_id
+                return await get_retry_policy().run(
+                    'query', lambda: call_visual_api('cv_sync2async_get_result', query_form), request_id
                 )
 
-            # 检查新的响应格式错误
-            if query_resp.get('code') and query_resp.get('code') != 10000:
-                print(f"❌ [Python后端-{request_id}] 查询失败 - 业务错误: code={query_resp.get('code')}, message={query_resp.get('message')}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"查询任务失败: {query_resp.get('message')} (Code: {query_resp.get('code')})"
+            def handle(query_resp, poll_index):
+                # 响应内容只在DEBUG级别记录，且经过采样和脱敏（binary_data_base64只记录长度）
+                logger.debug(f"📥 [Python后端-{request_id}] 查询响应 (耗时: {time.time() - query_started['at']:.2f}s)",
+                             extra={"poll": poll_index, "fields": {"response": query_resp}})
+                if job is not None:
+                    job.mark_polling(poll_index)
+                return parse_t2i_query_response(query_resp, poll_index, request_id)
+
+            try:
+                result = await get_poll_scheduler().wait_for(
+                    task_id, REQ_KEY, query, handle,
+                    submitted_at=job.submitted_at if job else None
                 )
-
-            query_data = query_resp.get('data', {}) or query_resp.get('Result', {})
-            status = query_data.get('status')
-
-            print(f"📊 [Python后端-{request_id}] 任务状态: {status}")
-
-            # 优先检查是否有 image_urls
-            if query_data.get('image_urls') and len(query_data['image_urls']) > 0:
-                image_url = query_data['image_urls'][0]
-                print(f"🎉 [Python后端-{request_id}] 获得图片URL: {image_url}")
-                return image_url
-
-            # 检查是否有 binary_data_base64 (即梦V4常见情况)
-            if query_data.get('binary_data_base64') and len(query_data['binary_data_base64']) > 0:
-                base64_data = query_data['binary_data_base64'][0]
-                print(f"📷 [Python后端-{request_id}] 获得base64图片数据，长度: {len(base64_data)}")
-
-                # 将base64数据转换为data URL格式，前端可以直接使用
-                data_url = f"data:image/png;base64,{base64_data}"
-                print(f"✅ [Python后端-{request_id}] 转换完成 - 已转换为data URL格式")
-                return data_url
-
-            # 检查任务状态
-            if status == 1 or status == 10000 or status == "done":
-                # 任务成功，尝试提取图片URL
-                print(f"✅ [Python后端-{request_id}] 任务状态成功，尝试提取图片URL...")
-                image_url = query_data.get('image_url')
-
-                # 如果没有直接的image_url，尝试解析resp_data
-                if not image_url and query_data.get('resp_data'):
-                    try:
-                        print(f"🔍 [Python后端-{request_id}] 解析resp_data...")
-                        resp_data = query_data['resp_data']
-                        if isinstance(resp_data, str):
-                            resp_data = json.loads(resp_data)
-
-                        if resp_data.get('image_urls') and len(resp_data['image_urls']) > 0:
-                            image_url = resp_data['image_urls'][0]
-                            print(f"📷 [Python后端-{request_id}] 从resp_data提取到图片URL: {image_url}")
-                    except (json.JSONDecodeError, KeyError) as e:
-                        print(f"⚠️ [Python后端-{request_id}] 解析resp_data失败: {e}")
-
-                if image_url:
-                    print(f"🎉 [Python后端-{request_id}] 最终获得图片URL: {image_url}")
-                    return image_url
-                else:
-                    print(f"⏳ [Python后端-{request_id}] 状态成功但图片URL尚未生成，继续等待...")
-
-            elif status == 2 or status == -1 or status == "failed":
-                print(f"❌ [Python后端-{request_id}] 任务执行失败，状态: {status}")
+            except PollTimeoutError as e:
+                logger.warning(f"⏰ [Python后端-{request_id}] 图片生成超时: {e}")
                 raise HTTPException(
-                    status_code=500,
-                    detail=f"任务执行失败 (Status: {status})"
+                    status_code=408,
+                    detail=f"图片生成超时 (等待了 {int(get_poll_scheduler().timeout)} 秒)"
                 )
-            else:
-                print(f"⏳ [Python后端-{request_id}] 任务处理中，状态: {status}")
-
-        # 超时
-        total_wait_time = MAX_POLL_TIMES * POLL_INTERVAL
-        print(f"⏰ [Python后端-{request_id}] 图片生成超时，等待时间: {total_wait_time}秒")
-        raise HTTPException(
-            status_code=408,
-            detail=f"图片生成超时 (等待了 {total_wait_time} 秒)"
-        )
+            if job is not None:
+                await job.mark_upstream_done()
+            return result
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"❌ [Python后端-{request_id}] SDK调用错误:", {
-            "error_type": type(e).__name__,
-            "error_message": str(e),
-            "timestamp": time.strftime('%Y-%m-%d %H:%M:%S')
-        })
-        raise HTTPException(status_code=500, detail=f"SDK调用失败: {str(e)}")
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"❌ [Python后端-{request_id}] SDK调用错误", extra={"fields": {
+                "error_type": type(e).__name__,
+                "error_message": str(e)
+            }})
+            raise HTTPException(status_code=ERROR_HTTP_STATUS.get(classify_exception(e), 500), detail=f"SDK调用失败: {str(e)}")
+
+@app.on_event("startup")
+async def on_startup():
+    """服务启动时初始化SDK执行器和客户端池，恢复上次未完成的后台任务"""
+    get_sdk_executor()
+    if SDK_AVAILABLE:
+        try:
+            get_visual_client_pool()
+        except VisualCredentialsError as e:
+            logger.warning(f"⚠️ [启动] 客户端池未创建: {e}")
+
+    jobs = get_job_manager()
+    jobs.register("image", run_image_job)
+    jobs.register("edit", run_edit_job)
+    jobs.register("audio", run_audio_job)
+    resumed = await jobs.resume()
+    if resumed:
+        logger.info(f"♻️ [启动] 已恢复 {resumed} 个未完成的任务")
+
+    # 采集时从各组件读取当前值的监控指标
+    UPSTREAM_IN_FLIGHT.set_function(
+        lambda: {(req_key,): info["active"] for req_key, info in get_upstream_limiter().get_backlog().items()}
+    )
+    UPSTREAM_WAITING.set_function(
+        lambda: {(req_key,): info["waiting"] for req_key, info in get_upstream_limiter().get_backlog().items()}
+    )
+    POLL_OUTSTANDING.set_function(lambda: get_poll_scheduler().get_stats()["outstanding"])
+    JOBS_RUNNING.set_function(lambda: get_job_manager().running)
+    SINGLE_FLIGHT_IN_FLIGHT.set_function(
+        lambda: {(name,): stats["in_flight"] for name, stats in get_single_flight_stats().items()}
+    )
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """服务关闭时停止后台任务和轮询调度，释放SDK执行器线程池、客户端连接、缓存数据库、TTS连接、编码进程池、衍生图进程池、下载连接和上传线程池，最后写出剩余的span和日志"""
+    shutdown_job_manager()
+    shutdown_poll_scheduler()
+    shutdown_sdk_executor()
+    reset_visual_client_pool()
+    reset_result_cache()
+    await get_audio_provider().close()
+    shutdown_audio_encoder()
+    shutdown_derivative_generator()
+    await close_http_client()
+    get_storage_provider().close()
+    shutdown_span_exporter()
+    shutdown_logging()
 
 @app.get("/")
 async def root():
@@ -386,10 +548,25 @@ async def root():
         "sdk_available": SDK_AVAILABLE,
         "endpoints": [
             "POST /api/generate-image - 生成图片",
-            "GET /api/health - 健康检查"
+            "POST /api/generate-images/batch - 批量生成图片（流式返回）",
+            "POST /api/generate-audio/stream - 生成音频（边合成边返回）",
+            "POST /api/jobs/generate-image - 提交图片生成任务（立即返回job_id）",
+            "POST /api/jobs/edit-image - 提交图片编辑任务（立即返回job_id）",
+            "POST /api/jobs/generate-audio - 提交音频合成任务（立即返回job_id）",
+            "GET /api/jobs/events - 任务事件流（SSE）",
+            "GET /api/upstream/backlog - 上游任务排队情况",
+            "GET /api/jobs/{job_id} - 查询任务状态",
+            "GET /api/jobs/{job_id}/result - 获取任务结果",
+            "GET /api/health - 健康检查",
+            "GET /metrics - 监控指标（Prometheus格式）"
         ]
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """监控指标接口（Prometheus文本格式）"""
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/api/health")
 async def health_check():
     """健康检查接口"""
@@ -401,111 +578,220 @@ async def health_check():
         "sdk_available": SDK_AVAILABLE,
         "storage_provider": type(storage).__name__,
         "storage_external_accessible": storage.is_url_accessible_externally(),
+        "storage_stats": storage.get_stats(),
+        "image_ingestor": get_image_ingestor().get_stats(),
+        "source_image_cache": get_source_image_cache().get_stats(),
+        "image_preprocessor": get_image_preprocessor().get_stats() if get_image_preprocessor() else None,
+        "image_derivatives": get_derivative_generator().get_stats() if get_derivative_generator() else None,
         "audio_provider": type(audio).__name__,
+        "audio_stats": audio.get_stats(),
+        "audio_encoder": get_audio_encoder().get_stats(),
+        "sdk_executor": get_sdk_executor().get_stats(),
+        "visual_client_pool": get_visual_client_pool_stats(),
+        "poll_scheduler": get_poll_scheduler().get_stats(),
+        "upstream_limiter": get_upstream_limiter().get_stats(),
+        "upstream_retry": get_retry_policy().get_stats(),
+        "result_cache": await asyncio.to_thread(get_result_cache().get_stats) if get_result_cache() else None,
+        "single_flight": get_single_flight_stats(),
+        "jobs": await asyncio.to_thread(get_job_manager().get_stats),
+        "job_events": get_job_event_bus().get_stats(),
+        "logging": get_log_pipeline().get_stats(),
+        "tracing": get_span_exporter().get_stats() if get_span_exporter() else None,
         "timestamp": int(time.time())
     }
 
+def is_upstream_url(image_data: Union[str, ImageData]) -> bool:
+    """上游返回的临时结果URL（演示模式的示例URL除外）"""
+    return (isinstance(image_data, str) and image_data.startswith("http")
+            and "example.com" not in image_data)
+
+async def save_result_image(image_data: Union[str, ImageData], storage, filename: str, folder: str):
+    """保存生成结果：图片数据直接写入存储，上游URL下载后流式转存"""
+    if isinstance(image_data, ImageData):
+        return await storage.save_image(image_data, filename=filename, folder=folder)
+    return await get_image_ingestor().ingest(image_data, storage, filename=filename, folder=folder)
+
+async def create_image_variants(image_data: Union[str, ImageData], local_path: str, storage,
+                                filename: str, folder: str, request_id: str) -> Optional[dict]:
+    """生成缩略图/预览图等衍生图，返回 {尺寸名: URL}；未启用或无法获取原图数据时返回None"""
+    generator = get_derivative_generator()
+    if generator is None:
+        return None
+
+    # 图片数据直接使用；上游URL转存到本地时读取本地文件，转存到对象存储时不再重新下载
+    if isinstance(image_data, ImageData):
+        source = await image_data.load()
+    elif local_path and os.path.isfile(local_path):
+        source = local_path
+    else:
+        return None
+
+    try:
+        variants = await generator.create(source, storage, filename, folder)
+    except Exception as e:
+        # 衍生图只用于加速预览，失败时不影响原图结果
+        logger.warning(f"⚠️ [Python后端-{request_id}] 衍生图生成失败: {e}")
+        return None
+    logger.info(f"🖼️ [Python后端-{request_id}] 衍生图生成完成: {variants}")
+    return variants
+
+async def generate_frame_image(request: ImageGenerationRequest, request_id: str,
+                               priority: int = PRIORITY_NORMAL) -> dict:
+    """生成单帧图片并保存到存储，返回响应数据（单张接口和批量接口共用）
+
+    相同请求并发到达时合并为一次上游任务
+
+    Raises:
+        HTTPException: 参数错误或上游调用失败
+    """
+    key = make_request_key(jsonable_encoder(request))
+    return await get_single_flight("image").do(key, lambda: _generate_frame_image(request, request_id, priority=priority))
+
+@traced("image.generate")
+async def _generate_frame_image(request: ImageGenerationRequest, request_id: str,
+                                job: Optional[JobContext] = None, priority: int = PRIORITY_NORMAL) -> dict:
+    """生成单帧图片并保存到存储（实际执行；后台任务直接调用，不参与请求合并）"""
+    # 提取提示词
+    prompt = request.prompt
+    if request.frame and request.frame.get('prompt'):
+        prompt = request.frame['prompt']
+    elif request.frame and request.frame.get('jimengPrompt'):
+        prompt = request.frame['jimengPrompt']
+
+    # 提取画幅参数
+    aspect_ratio = "16:9"  # 默认值
+    if request.frame and request.frame.get('aspectRatio'):
+        aspect_ratio = request.frame['aspectRatio']
+
+    logger.info(f"📝 [Python后端-{request_id}] 解析参数", extra={"fields": {
+        "final_prompt": f"{prompt[:50]}..." if prompt and len(prompt) > 50 else prompt,
+        "aspect_ratio": aspect_ratio,
+        "frame_data": request.frame if request.frame else None,
+        "prompt_source": "request.prompt" if request.prompt else ("frame.prompt" if request.frame and request.frame.get('prompt') else ("frame.jimengPrompt" if request.frame and request.frame.get('jimengPrompt') else "none"))
+    }})
+
+    if not prompt or not prompt.strip():
+        logger.error(f"❌ [Python后端-{request_id}] 参数验证失败: 缺少提示词")
+        raise HTTPException(status_code=400, detail="缺少必要参数: prompt")
+
+    # 确定文件夹和文件名
+    folder = ""
+    filename_prefix = "img"
+    if request.frame:
+        frame_type = request.frame.get('type', '')
+        if frame_type == 'character':
+            folder = "characters"
+            char_id = request.frame.get('characterId', request_id)
+            filename_prefix = f"char_{char_id}"
+        elif frame_type == 'page':
+            folder = "pages"
+            page_index = request.frame.get('pageIndex', 0)
+            filename_prefix = f"page_{page_index}"
+
+    # 查询结果缓存（仅对保存到存储的结果生效；保存目标参与计算键）
+    cache = get_result_cache() if request.use_cache and request.save_to_storage else None
+    cache_key = make_cache_key(build_t2i_submit_form(prompt.strip(), aspect_ratio),
+                               folder, filename_prefix) if cache else None
+    if cache:
+        storage = get_storage_provider()
+        cached = await asyncio.to_thread(cache.get, cache_key)
+        if cached and cached["storage_provider"] == type(storage).__name__:
+            logger.info(f"⚡ [Python后端-{request_id}] 命中结果缓存: {cached['image_url']}")
+            variants = {"variants": cached["variants"]} if cached["variants"] else {}
+            return {
+                "imageUrl": cached["image_url"],
+                "taskId": f"jimeng_v4_{request_id}",
+                "prompt": prompt,
+                "frame": request.frame,
+                "storage_provider": cached["storage_provider"],
+                "local_path": cached["local_path"],
+                "external_accessible": storage.is_url_accessible_externally(),
+                **variants,
+                "cached": True
+            }
+
+    logger.info(f"🎨 [Python后端-{request_id}] 开始图片生成... 画幅: {aspect_ratio}")
+    generation_start = time.time()
+    set_span_attributes(aspect_ratio=aspect_ratio)
+
+    # 生成图片（返回图片数据或URL）
+    image_data = await generate_image_with_sdk(prompt.strip(), request_id, aspect_ratio, job, priority)
+
+    # 如果需要保存到存储
+    final_url = image_data
+    storage_info = {}
+
+    if request.save_to_storage and (isinstance(image_data, ImageData) or is_upstream_url(image_data)):
+        logger.info(f"💾 [Python后端-{request_id}] 保存图片到存储...")
+        storage = get_storage_provider()
+
+        local_path, public_url = await save_result_image(image_data, storage, filename_prefix, folder)
+
+        final_url = public_url
+        storage_info = {
+            "storage_provider": type(storage).__name__,
+            "local_path": local_path,
+            "external_accessible": storage.is_url_accessible_externally()
+        }
+
+        logger.info(f"💾 [Python后端-{request_id}] 存储完成: {public_url}")
+
+        variants = await create_image_variants(image_data, local_path, storage, filename_prefix, folder, request_id)
+        if variants:
+            storage_info["variants"] = variants
+
+        if cache:
+            await asyncio.to_thread(cache.put, cache_key, public_url, local_path,
+                                    storage_info["storage_provider"], variants)
+        elif get_result_cache():
+            # 未使用缓存时同一路径也可能被覆盖，清除指向它的旧缓存
+            await asyncio.to_thread(get_result_cache().invalidate_path, local_path)
+    elif isinstance(image_data, ImageData):
+        # 调用方明确要求不保存时，才以data URL内联返回图片
+        final_url = image_data.to_data_url()
+
+    IMAGE_GENERATION_LATENCY.observe(time.time() - generation_start, aspect_ratio=aspect_ratio)
+
+    logger.info(f"✅ [Python后端-{request_id}] 图片生成完成", extra={"fields": {
+        "url_type": "file_url" if not final_url.startswith("data:") else "data_url",
+        "url_length": len(final_url),
+        "is_demo": "example.com" in final_url,
+        **storage_info
+    }})
+
+    # 返回结果
+    response_data = {
+        "imageUrl": final_url,
+        "taskId": f"jimeng_v4_{request_id}",
+        "prompt": prompt,
+        "frame": request.frame,
+        **storage_info
+    }
+
+    logger.info(f"📤 [Python后端-{request_id}] 构造响应", extra={"fields": {
+        "success": True,
+        "response_keys": list(response_data.keys()),
+        "url_preview": final_url[:100] + "..." if len(final_url) > 100 else final_url
+    }})
+
+    return response_data
+
 @app.post("/api/generate-image", response_model=ImageGenerationResponse)
 async def generate_image(request: ImageGenerationRequest):
     """生成图片接口"""
 
-    request_id = f"api_{int(time.time())}"
+    request_id = new_request_id("api")
 
-    print(f"\n🎯 [Python后端-{request_id}] 收到图片生成请求:", {
+    logger.info(f"🎯 [Python后端-{request_id}] 收到图片生成请求", extra={"fields": {
         "timestamp": time.strftime('%Y-%m-%d %H:%M:%S'),
         "has_prompt": bool(request.prompt),
         "has_frame": bool(request.frame),
         "prompt_length": len(request.prompt) if request.prompt else 0,
         "save_to_storage": request.save_to_storage
-    })
+    }})
 
     try:
-        # 提取提示词
-        prompt = request.prompt
-        if request.frame and request.frame.get('prompt'):
-            prompt = request.frame['prompt']
-        elif request.frame and request.frame.get('jimengPrompt'):
-            prompt = request.frame['jimengPrompt']
-
-        # 提取画幅参数
-        aspect_ratio = "16:9"  # 默认值
-        if request.frame and request.frame.get('aspectRatio'):
-            aspect_ratio = request.frame['aspectRatio']
-
-        print(f"📝 [Python后端-{request_id}] 解析参数:", {
-            "final_prompt": f"{prompt[:50]}..." if prompt and len(prompt) > 50 else prompt,
-            "aspect_ratio": aspect_ratio,
-            "frame_data": request.frame if request.frame else None,
-            "prompt_source": "request.prompt" if request.prompt else ("frame.prompt" if request.frame and request.frame.get('prompt') else ("frame.jimengPrompt" if request.frame and request.frame.get('jimengPrompt') else "none"))
-        })
-
-        if not prompt or not prompt.strip():
-            print(f"❌ [Python后端-{request_id}] 参数验证失败: 缺少提示词")
-            raise HTTPException(status_code=400, detail="缺少必要参数: prompt")
-
-        print(f"🎨 [Python后端-{request_id}] 开始图片生成... 画幅: {aspect_ratio}")
-
-        # 生成图片（返回base64或URL）
-        image_data = await generate_image_with_sdk(prompt.strip(), request_id, aspect_ratio)
-
-        # 确定文件夹和文件名
-        folder = ""
-        filename_prefix = "img"
-        if request.frame:
-            frame_type = request.frame.get('type', '')
-            if frame_type == 'character':
-                folder = "characters"
-                char_id = request.frame.get('characterId', request_id)
-                filename_prefix = f"char_{char_id}"
-            elif frame_type == 'page':
-                folder = "pages"
-                page_index = request.frame.get('pageIndex', 0)
-                filename_prefix = f"page_{page_index}"
-
-        # 如果需要保存到存储
-        final_url = image_data
-        storage_info = {}
-
-        if request.save_to_storage and image_data.startswith("data:"):
-            print(f"💾 [Python后端-{request_id}] 保存图片到存储...")
-            storage = get_storage_provider()
-
-            local_path, public_url = await storage.save_image(
-                image_data,
-                filename=filename_prefix,
-                folder=folder
-            )
-
-            final_url = public_url
-            storage_info = {
-                "storage_provider": type(storage).__name__,
-                "local_path": local_path,
-                "external_accessible": storage.is_url_accessible_externally()
-            }
-
-            print(f"💾 [Python后端-{request_id}] 存储完成: {public_url}")
-
-        print(f"✅ [Python后端-{request_id}] 图片生成完成:", {
-            "url_type": "file_url" if not final_url.startswith("data:") else "data_url",
-            "url_length": len(final_url),
-            "is_demo": "example.com" in final_url,
-            **storage_info
-        })
-
-        # 返回结果
-        response_data = {
-            "imageUrl": final_url,
-            "taskId": f"jimeng_v4_{request_id}",
-            "prompt": prompt,
-            "frame": request.frame,
-            **storage_info
-        }
-
-        print(f"📤 [Python后端-{request_id}] 构造响应:", {
-            "success": True,
-            "response_keys": list(response_data.keys()),
-            "url_preview": final_url[:100] + "..." if len(final_url) > 100 else final_url
-        })
+        response_data = await generate_frame_image(request, request_id)
 
         return ImageGenerationResponse(
             success=True,
@@ -515,304 +801,633 @@ async def generate_image(request: ImageGenerationRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ [Python后端-{request_id}] 生成失败:", {
+        logger.error(f"❌ [Python后端-{request_id}] 生成失败", extra={"fields": {
             "error_type": type(e).__name__,
             "error_message": str(e),
             "timestamp": time.strftime('%Y-%m-%d %H:%M:%S')
-        })
+        }})
         return ImageGenerationResponse(
             success=False,
             error=f"图片生成失败: {str(e)}"
         )
 
-@app.post("/api/generate-audio", response_model=AudioGenerationResponse)
-async def generate_audio(request: AudioGenerationRequest):
-    """生成音频接口"""
+@app.post("/api/generate-images/batch")
+async def generate_images_batch(request: BatchImageGenerationRequest):
+    """批量生成图片接口
 
-    request_id = f"audio_{int(time.time())}"
+    所有帧并发调度（受上游限流器控制），每帧完成后立即推送结果，
+    整本书的耗时接近最慢的一帧，而不是所有帧耗时之和。
+    """
 
-    print(f"\n🔊 [Python后端-{request_id}] 收到音频生成请求:", {
-        "timestamp": time.strftime('%Y-%m-%d %H:%M:%S'),
-        "text_length": len(request.text) if request.text else 0,
-        "page_index": request.page_index,
-        "speaker_id": request.speaker_id,
-        "speed_factor": request.speed_factor,
-        "pitch_factor": request.pitch_factor
-    })
+    batch_id = new_request_id("batch")
+    stream_format = request.stream_format.lower()
+    if stream_format not in ("sse", "ndjson"):
+        raise HTTPException(status_code=400, detail=f"不支持的推送格式: {request.stream_format}")
 
-    try:
-        if not request.text or not request.text.strip():
-            print(f"❌ [Python后端-{request_id}] 参数验证失败: 缺少文本")
-            raise HTTPException(status_code=400, detail="缺少必要参数: text")
+    total = len(request.frames)
+    logger.info(f"📚 [Python后端-{batch_id}] 收到批量生成请求: {total} 帧，推送格式: {stream_format}")
 
-        # 获取音频Provider
-        audio_provider = get_audio_provider()
+    async def run_frame(index: int, frame: dict) -> dict:
+        frame_request = ImageGenerationRequest(
+            prompt=frame.get('prompt') or frame.get('jimengPrompt') or "",
+            frame=frame,
+            save_to_storage=request.save_to_storage,
+            use_cache=request.use_cache
+        )
+        start_time = time.time()
+        event = {"index": index, "sequence": frame.get('sequence')}
+        try:
+            data = await generate_frame_image(frame_request, f"{batch_id}_{index}", PRIORITY_BULK)
+            event.update({"type": "frame_complete", "imageUrl": data["imageUrl"], "data": data})
+        except HTTPException as e:
+            event.update({"type": "frame_error", "error": e.detail, "status_code": e.status_code})
+        except Exception as e:
+            event.update({"type": "frame_error", "error": f"图片生成失败: {str(e)}"})
+        event["responseTime"] = int((time.time() - start_time) * 1000)
+        return event
+
+    def encode(event: dict) -> str:
+        payload = json.dumps(event, ensure_ascii=False)
+        return f"data: {payload}\n\n" if stream_format == "sse" else f"{payload}\n"
+
+    async def event_stream():
+        # 所有帧立即进入调度；客户端断开后已开始的帧仍会完成并落盘
+        tasks = [asyncio.create_task(run_frame(i, frame)) for i, frame in enumerate(request.frames)]
+        yield encode({"type": "start", "batchId": batch_id, "total": total})
+
+        success_count = 0
+        failed_count = 0
+        for finished in asyncio.as_completed(tasks):
+            event = await finished
+            if event["type"] == "frame_complete":
+                success_count += 1
+            else:
+                failed_count += 1
+            event["completed"] = success_count + failed_count
+            event["total"] = total
+            event["progress"] = round(event["completed"] / total * 100) if total else 100
+            yield encode(event)
+
+        stats = {
+            "total": total,
+            "success": success_count,
+            "failed": failed_count,
+            "successRate": round(success_count / total * 100) if total else 0
+        }
+        logger.info(f"✅ [Python后端-{batch_id}] 批量生成完成: {stats}")
+        yield encode({"type": "complete", "batchId": batch_id, "stats": stats})
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        event_stream(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@traced("audio.generate")
+async def generate_audio_file(request: AudioGenerationRequest, request_id: str,
+                              job: Optional[JobContext] = None) -> dict:
+    """合成并保存音频，返回响应数据（同步接口和后台任务共用）
+
+    Raises:
+        HTTPException: 参数错误
+    """
+    if not request.text or not request.text.strip():
+        logger.error(f"❌ [Python后端-{request_id}] 参数验证失败: 缺少文本")
+        raise HTTPException(status_code=400, detail="缺少必要参数: text")
 
-        # 生成文件名
-        if request.page_index is not None:
-            filename = f"page_{request.page_index}"
-            folder = "pages"
-        else:
-            filename = f"audio_{request_id}"
-            folder = ""
+    # 获取音频Provider
+    audio_provider = get_audio_provider()
 
-        print(f"🎤 [Python后端-{request_id}] 开始音频合成...")
+    try:
+        output_format = get_audio_encoder().resolve_format(request.output_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 生成文件名
+    if request.page_index is not None:
+        filename = f"page_{request.page_index}"
+        folder = "pages"
+    else:
+        filename = f"audio_{request_id}"
+        folder = ""
 
-        # 合成并保存音频
-        local_path, audio_url = await audio_provider.synthesize_and_save(
+    logger.info(f"🎤 [Python后端-{request_id}] 开始音频合成...")
+
+    def synthesize():
+        return audio_provider.synthesize_and_save(
             text=request.text.strip(),
             filename=filename,
             folder=folder,
             speaker_id=request.speaker_id,
             speed_factor=request.speed_factor,
-            pitch_factor=request.pitch_factor
+            pitch_factor=request.pitch_factor,
+            output_format=output_format
         )
 
-        print(f"✅ [Python后端-{request_id}] 音频生成完成:", {
-            "audio_url": audio_url,
-            "local_path": local_path
-        })
+    if job is not None:
+        await job.mark_submitted()
+        local_path, audio_url, metadata = await synthesize()
+    else:
+        # 合成并保存音频（相同请求并发时只合成一次）
+        local_path, audio_url, metadata = await get_single_flight("audio").do(
+            make_request_key({**jsonable_encoder(request), "output_format": output_format}),
+            synthesize
+        )
+
+    logger.info(f"✅ [Python后端-{request_id}] 音频生成完成", extra={"fields": {
+        "audio_url": audio_url,
+        "local_path": local_path,
+        **metadata
+    }})
+
+    return {
+        "audioUrl": audio_url,
+        "localPath": local_path,
+        "text": request.text,
+        "pageIndex": request.page_index,
+        "speakerId": request.speaker_id,
+        **metadata
+    }
+
+@app.post("/api/generate-audio", response_model=AudioGenerationResponse)
+async def generate_audio(request: AudioGenerationRequest):
+    """生成音频接口"""
+
+    request_id = new_request_id("audio")
+
+    logger.info(f"🔊 [Python后端-{request_id}] 收到音频生成请求", extra={"fields": {
+        "timestamp": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "text_length": len(request.text) if request.text else 0,
+        "page_index": request.page_index,
+        "speaker_id": request.speaker_id,
+        "speed_factor": request.speed_factor,
+        "pitch_factor": request.pitch_factor
+    }})
+
+    try:
+        response_data = await generate_audio_file(request, request_id)
 
         return AudioGenerationResponse(
             success=True,
-            data={
-                "audioUrl": audio_url,
-                "localPath": local_path,
-                "text": request.text,
-                "pageIndex": request.page_index,
-                "speakerId": request.speaker_id
-            }
+            data=response_data
         )
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ [Python后端-{request_id}] 音频生成失败:", {
+        logger.error(f"❌ [Python后端-{request_id}] 音频生成失败", extra={"fields": {
             "error_type": type(e).__name__,
             "error_message": str(e),
             "timestamp": time.strftime('%Y-%m-%d %H:%M:%S')
-        })
+        }})
         return AudioGenerationResponse(
             success=False,
             error=f"音频生成失败: {str(e)}"
         )
 
-async def edit_image_with_sdk(image_url: str, prompt: str, strength: float = 0.65, request_id: str = None) -> str:
-    """使用官方SDK进行图生图编辑"""
-    import base64
-    import httpx
+@app.post("/api/generate-audio/stream")
+async def generate_audio_stream(request: AudioGenerationRequest):
+    """
+    流式生成音频接口
+    合成过程中即转发WAV数据（流式文件头 + PCM），文件在后台写入，
+    保存后的访问地址通过响应头 X-Audio-Url 返回
+
+    响应体在文件保存成功后才结束，X-Audio-Url 只在响应体完整接收后可用；
+    首个音频块之前失败返回502，之后合成或保存失败时中断连接
+    """
+
+    request_id = new_request_id("audio_stream")
+
+    logger.info(f"🔊 [Python后端-{request_id}] 收到流式音频生成请求", extra={"fields": {
+        "timestamp": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "text_length": len(request.text) if request.text else 0,
+        "page_index": request.page_index,
+        "speaker_id": request.speaker_id
+    }})
+
+    if not request.text or not request.text.strip():
+        logger.error(f"❌ [Python后端-{request_id}] 参数验证失败: 缺少文本")
+        raise HTTPException(status_code=400, detail="缺少必要参数: text")
+
+    audio_provider = get_audio_provider()
 
+    if request.page_index is not None:
+        filename = f"page_{request.page_index}"
+        folder = "pages"
+    else:
+        filename = f"audio_{request_id}"
+        folder = ""
+
+    try:
+        # 后台合成任务创建时继承当前上下文中的请求ID和span
+        with start_span("audio.generate_stream", request_id=request_id):
+            audio_url, chunks = audio_provider.stream_and_save(
+                text=request.text.strip(),
+                filename=filename,
+                folder=folder,
+                speaker_id=request.speaker_id,
+                speed_factor=request.speed_factor,
+                pitch_factor=request.pitch_factor,
+                output_format=request.output_format
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except NotImplementedError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    # 等到首个音频块再返回响应头：连接或会话初始化失败时仍可返回错误状态码
+    start_time = time.time()
+    try:
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = None
+    except Exception as e:
+        logger.error(f"❌ [Python后端-{request_id}] 流式音频生成失败: {e}")
+        raise HTTPException(status_code=502, detail=f"音频生成失败: {str(e)}")
+    logger.info(f"🔊 [Python后端-{request_id}] 首个音频块耗时: {time.time() - start_time:.2f} 秒")
+
+    async def wav_stream():
+        # 采样率在首个音频块之前由服务端告知，此时再生成文件头
+        yield make_streaming_wav_header(audio_provider.sample_rate)
+        if first_chunk is not None:
+            yield first_chunk
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            # 响应头已发出：中断连接，客户端收到不完整的响应体而不是看似成功的截断音频
+            logger.error(f"❌ [Python后端-{request_id}] 流式音频中断，文件未保存: {e}")
+            raise
+        logger.info(f"✅ [Python后端-{request_id}] 流式音频发送完成并已保存: {audio_url}")
+
+    return StreamingResponse(
+        wav_stream(),
+        media_type="audio/wav",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Audio-Url": audio_url}
+    )
+
+def parse_i2i_query_response(query_resp: dict, poll_index: int, request_id: str) -> Optional[Union[str, ImageData]]:
+    """解析图生图查询响应，任务仍在处理时返回None"""
+    query_data = query_resp.get('data', {}) or query_resp.get('Result', {})
+
+    if query_data.get('image_urls') and len(query_data['image_urls']) > 0:
+        logger.info(f"🎉 [Python后端-{request_id}] 图生图完成!")
+        return query_data['image_urls'][0]
+
+    if query_data.get('binary_data_base64') and len(query_data['binary_data_base64']) > 0:
+        logger.info(f"🎉 [Python后端-{request_id}] 图生图完成!")
+        return ImageData.from_base64(query_data['binary_data_base64'][0])
+
+    status = query_data.get('status')
+    if status == 2 or status == -1 or status == "failed":
+        raise HTTPException(status_code=500, detail="图生图任务执行失败")
+
+    logger.info(f"🔄 [Python后端-{request_id}] 轮询第 {poll_index} 次，状态: {status}", extra={"poll": poll_index})
+    return None
+
+@traced("jimeng.edit")
+async def edit_image_with_sdk(image_url: str, prompt: str, strength: float = 0.65, request_id: str = None,
+                              job: Optional[JobContext] = None,
+                              priority: int = PRIORITY_INTERACTIVE) -> Union[str, ImageData]:
+    """使用官方SDK进行图生图编辑（job 已记录上游 task_id 时跳过提交直接轮询）
+
+    用户在编辑器中等待结果，默认以交互优先级排在批量生成之前
+    """
     if not request_id:
-        request_id = f"edit_{int(time.time())}"
+        request_id = get_request_id() or new_request_id("edit")
 
-    print(f"\n🖌️ [Python后端-{request_id}] 图生图API启动")
-    print(f"📝 [Python后端-{request_id}] 编辑参数:", {
+    logger.info(f"🖌️ [Python后端-{request_id}] 图生图API启动")
+    logger.info(f"📝 [Python后端-{request_id}] 编辑参数", extra={"fields": {
         "prompt": f"{prompt[:50]}..." if len(prompt) > 50 else prompt,
         "strength": strength,
         "image_url_type": "base64" if image_url.startswith("data:") else "url",
         "timestamp": time.strftime('%Y-%m-%d %H:%M:%S')
-    })
+    }})
 
     if not SDK_AVAILABLE:
-        print(f"⚠️ [Python后端-{request_id}] 演示模式: SDK未安装")
+        logger.warning(f"⚠️ [Python后端-{request_id}] 演示模式: SDK未安装")
         await asyncio.sleep(2)
         return f"https://example.com/demo-edited-{int(time.time())}.jpg"
 
-    # 创建服务实例
-    print(f"🔧 [Python后端-{request_id}] 初始化火山引擎SDK...")
-    visual_service = create_visual_service()
+    # 检查客户端池可用（未配置密钥时直接报错）
+    get_visual_service_pool()
 
-    # 准备图片数据
-    binary_data = None
-
-    if image_url.startswith("data:"):
-        # 从 data URL 提取 base64
-        try:
-            base64_part = image_url.split(",", 1)[1]
-            binary_data = base64_part
-            print(f"📷 [Python后端-{request_id}] 从data URL提取base64，长度: {len(binary_data)}")
-        except:
-            raise HTTPException(status_code=400, detail="无效的data URL格式")
-    elif image_url.startswith("http"):
-        # 下载图片并转为base64
-        print(f"📥 [Python后端-{request_id}] 下载原图: {image_url[:100]}...")
+    # 同步请求在排队已满时直接拒绝；后台任务已被接受，始终排队
+    limiter = get_upstream_limiter()
+    if job is None:
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                resp = await client.get(image_url)
-                resp.raise_for_status()
-                binary_data = base64.b64encode(resp.content).decode('utf-8')
-                print(f"📷 [Python后端-{request_id}] 下载完成，base64长度: {len(binary_data)}")
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"无法下载原图: {str(e)}")
-    elif image_url.startswith("/"):
-        # 本地路径
-        local_file = Path(__file__).parent.parent / "public" / image_url.lstrip("/")
-        if local_file.exists():
-            with open(local_file, "rb") as f:
-                binary_data = base64.b64encode(f.read()).decode('utf-8')
-            print(f"📷 [Python后端-{request_id}] 读取本地文件: {local_file}")
-        else:
-            raise HTTPException(status_code=400, detail=f"本地文件不存在: {image_url}")
-    else:
-        raise HTTPException(status_code=400, detail="不支持的图片URL格式")
+            limiter.admit(REQ_KEY_I2I)
+        except BacklogFullError as e:
+            raise HTTPException(status_code=429, detail=str(e))
 
-    # 构建图生图请求
-    submit_form = {
-        "req_key": REQ_KEY_I2I,
-        "prompt": prompt,
-        "binary_data_base64": [binary_data],
-        "strength": strength,  # 控制修改程度
-        "return_url": True,
-        "logo_info": {
-            "add_logo": False,
-            "position": 0,
-            "language": 0,
-            "opacity": 1
+    resuming = job is not None and job.task_id
+    if not resuming:
+        # 准备图片数据（相同原图的重复编辑直接使用缓存的编码结果）
+        try:
+            binary_data = await get_source_image_cache().get_base64(image_url)
+        except SourceImageError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        logger.info(f"📷 [Python后端-{request_id}] 原图就绪，base64长度: {len(binary_data)}")
+
+        # 构建图生图请求
+        submit_form = {
+            "req_key": REQ_KEY_I2I,
+            "prompt": prompt,
+            "binary_data_base64": [binary_data],
+            "strength": strength,  # 控制修改程度
+            "return_url": True,
+            "logo_info": {
+                "add_logo": False,
+                "position": 0,
+                "language": 0,
+                "opacity": 1
+            }
         }
-    }
 
-    print(f"📤 [Python后端-{request_id}] 提交图生图任务...")
+        logger.info(f"📤 [Python后端-{request_id}] 提交图生图任务...")
+        logger.debug(f"📤 [Python后端-{request_id}] 提交参数", extra={"fields": {"submit_form": submit_form}})
 
-    try:
-        submit_start = time.time()
-        submit_resp = visual_service.cv_sync2async_submit_task(submit_form)
-        submit_time = time.time() - submit_start
-
-        print(f"📥 [Python后端-{request_id}] 提交响应 (耗时: {submit_time:.2f}s)")
+    # 占用上游并发名额，覆盖提交到轮询结束的整个过程
+    async with limiter.slot(REQ_KEY_I2I, priority):
+        try:
+            if resuming:
+                task_id = job.task_id
+                logger.info(f"♻️ [Python后端-{request_id}] 恢复任务，继续轮询 TaskID: {task_id}")
+            else:
+                async def submit():
+                    await limiter.wait_submit(REQ_KEY_I2I, priority)
+                    call_start = time.time()
+                    with start_span("jimeng.submit", req_key=REQ_KEY_I2I):
+                        resp = await call_visual_api('cv_sync2async_submit_task', submit_form)
+                    SUBMIT_LATENCY.observe(time.time() - call_start, req_key=REQ_KEY_I2I)
+                    return resp
+
+                submit_start = time.time()
+                submit_resp = await get_retry_policy().run('submit', submit, request_id, idempotent=False)
+                submit_time = time.time() - submit_start
+
+                logger.info(f"📥 [Python后端-{request_id}] 提交响应 (耗时: {submit_time:.2f}s)")
+                logger.debug(f"📥 [Python后端-{request_id}] 提交响应内容", extra={"fields": {"response": submit_resp}})
+
+                # 检查响应
+                if submit_resp.get('ResponseMetadata', {}).get('Error'):
+                    error_info = submit_resp['ResponseMetadata']['Error']
+                    raise HTTPException(status_code=ERROR_HTTP_STATUS.get(classify_response(submit_resp), 400),
+                                        detail=f"任务提交失败: {error_info.get('Message')}")
+
+                if submit_resp.get('code') and submit_resp.get('code') != 10000:
+                    raise HTTPException(status_code=ERROR_HTTP_STATUS.get(classify_response(submit_resp), 400),
+                                        detail=f"任务提交失败: {submit_resp.get('message')}")
+
+                submit_data = submit_resp.get('data', {}) or submit_resp.get('Result', {})
+
+                # 检查是否直接返回结果
+                if submit_data.get('image_urls') and len(submit_data['image_urls']) > 0:
+                    return submit_data['image_urls'][0]
+
+                if submit_data.get('binary_data_base64') and len(submit_data['binary_data_base64']) > 0:
+                    return ImageData.from_base64(submit_data['binary_data_base64'][0])
+
+                task_id = submit_data.get('task_id')
+                if not task_id:
+                    raise HTTPException(status_code=500, detail="未获得task_id")
+
+                if job is not None:
+                    await job.mark_submitted(task_id, REQ_KEY_I2I)
+                set_span_attributes(task_id=task_id)
+                logger.info(f"⏳ [Python后端-{request_id}] 获得TaskID: {task_id}，开始轮询...")
+
+            # 轮询结果（由中心调度器按自适应间隔轮询）
+            query_form = {
+                "req_key": REQ_KEY_I2I,
+                "task_id": task_id,
+                "return_url": True,
+                "logo_info": {"add_logo": False}
+            }
 
-        # 检查响应
-        if submit_resp.get('ResponseMetadata', {}).get('Error'):
-            error_info = submit_resp['ResponseMetadata']['Error']
-            raise HTTPException(status_code=400, detail=f"任务提交失败: {error_info.get('Message')}")
+            async def query():
+                return await get_retry_policy().run(
+                    'query', lambda: call_visual_api('cv_sync2async_get_result', query_form), request_id
+                )
 
-        if submit_resp.get('code') and submit_resp.get('code') != 10000:
-            raise HTTPException(status_code=400, detail=f"任务提交失败: {submit_resp.get('message')}")
+            def handle(query_resp, poll_index):
+                if job is not None:
+                    job.mark_polling(poll_index)
+                logger.debug(f"📥 [Python后端-{request_id}] 查询响应", extra={"poll": poll_index, "fields": {"response": query_resp}})
+                return parse_i2i_query_response(query_resp, poll_index, request_id)
 
-        submit_data = submit_resp.get('data', {}) or submit_resp.get('Result', {})
+            try:
+                result = await get_poll_scheduler().wait_for(
+                    task_id, REQ_KEY_I2I, query, handle,
+                    submitted_at=job.submitted_at if job else None
+                )
+            except PollTimeoutError:
+                raise HTTPException(status_code=408, detail="图生图任务超时")
+            if job is not None:
+                await job.mark_upstream_done()
+            return result
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"❌ [Python后端-{request_id}] 图生图错误: {str(e)}")
+            raise HTTPException(status_code=ERROR_HTTP_STATUS.get(classify_exception(e), 500), detail=f"图生图失败: {str(e)}")
 
-        # 检查是否直接返回结果
-        if submit_data.get('image_urls') and len(submit_data['image_urls']) > 0:
-            return submit_data['image_urls'][0]
 
-        if submit_data.get('binary_data_base64') and len(submit_data['binary_data_base64']) > 0:
-            return f"data:image/png;base64,{submit_data['binary_data_base64'][0]}"
+@traced("image.edit")
+async def edit_frame_image(request: ImageEditRequest, request_id: str, job: Optional[JobContext] = None) -> dict:
+    """执行图生图并保存结果，返回响应数据（同步接口和后台任务共用）
 
-        task_id = submit_data.get('task_id')
-        if not task_id:
-            raise HTTPException(status_code=500, detail="未获得task_id")
+    Raises:
+        HTTPException: 参数错误或上游调用失败
+    """
+    if not request.prompt or not request.prompt.strip():
+        raise HTTPException(status_code=400, detail="缺少修改提示词")
 
-        print(f"⏳ [Python后端-{request_id}] 获得TaskID: {task_id}，开始轮询...")
+    if not request.image_url:
+        raise HTTPException(status_code=400, detail="缺少原图")
 
-        # 轮询结果
-        for i in range(MAX_POLL_TIMES):
-            await asyncio.sleep(POLL_INTERVAL)
+    # 执行图生图
+    image_data = await edit_image_with_sdk(
+        image_url=request.image_url,
+        prompt=request.prompt.strip(),
+        strength=request.strength,
+        request_id=request_id,
+        job=job
+    )
 
-            query_form = {
-                "req_key": REQ_KEY_I2I,
-                "task_id": task_id,
-                "return_url": True,
-                "logo_info": {"add_logo": False}
-            }
+    # 保存结果
+    final_url = image_data
+    storage_info = {}
 
-            query_resp = visual_service.cv_sync2async_get_result(query_form)
-            query_data = query_resp.get('data', {}) or query_resp.get('Result', {})
+    if isinstance(image_data, ImageData) or is_upstream_url(image_data):
+        logger.info(f"💾 [Python后端-{request_id}] 保存编辑后的图片...")
+        storage = get_storage_provider()
 
-            if query_data.get('image_urls') and len(query_data['image_urls']) > 0:
-                print(f"🎉 [Python后端-{request_id}] 图生图完成!")
-                return query_data['image_urls'][0]
+        folder = "pages"
+        filename_prefix = f"edited_{request.page_index}" if request.page_index else f"edited_{request_id}"
 
-            if query_data.get('binary_data_base64') and len(query_data['binary_data_base64']) > 0:
-                print(f"🎉 [Python后端-{request_id}] 图生图完成!")
-                return f"data:image/png;base64,{query_data['binary_data_base64'][0]}"
+        local_path, public_url = await save_result_image(image_data, storage, filename_prefix, folder)
 
-            status = query_data.get('status')
-            if status == 2 or status == -1 or status == "failed":
-                raise HTTPException(status_code=500, detail="图生图任务执行失败")
+        final_url = public_url
+        storage_info = {
+            "storage_provider": type(storage).__name__,
+            "local_path": local_path
+        }
 
-            print(f"🔄 [Python后端-{request_id}] 轮询 {i+1}/{MAX_POLL_TIMES}，状态: {status}")
+        variants = await create_image_variants(image_data, local_path, storage, filename_prefix, folder, request_id)
+        if variants:
+            storage_info["variants"] = variants
 
-        raise HTTPException(status_code=408, detail="图生图任务超时")
+        # 编辑结果可能覆盖已缓存的文件
+        if get_result_cache():
+            await asyncio.to_thread(get_result_cache().invalidate_path, local_path)
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"❌ [Python后端-{request_id}] 图生图错误: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"图生图失败: {str(e)}")
+    logger.info(f"✅ [Python后端-{request_id}] 图片编辑完成: {final_url[:100]}...")
 
+    return {
+        "imageUrl": final_url,
+        "prompt": request.prompt,
+        "pageIndex": request.page_index,
+        **storage_info
+    }
 
 @app.post("/api/edit-image", response_model=ImageEditResponse)
 async def edit_image(request: ImageEditRequest):
     """图片编辑接口（图生图）"""
 
-    request_id = f"edit_{int(time.time())}"
+    request_id = new_request_id("edit")
 
-    print(f"\n🖌️ [Python后端-{request_id}] 收到图片编辑请求:", {
+    logger.info(f"🖌️ [Python后端-{request_id}] 收到图片编辑请求", extra={"fields": {
         "timestamp": time.strftime('%Y-%m-%d %H:%M:%S'),
         "prompt": request.prompt[:50] if request.prompt else "",
         "page_index": request.page_index,
         "strength": request.strength,
         "image_url_type": "base64" if request.image_url.startswith("data:") else "url"
-    })
+    }})
 
     try:
-        if not request.prompt or not request.prompt.strip():
-            raise HTTPException(status_code=400, detail="缺少修改提示词")
-
-        if not request.image_url:
-            raise HTTPException(status_code=400, detail="缺少原图")
-
-        # 执行图生图
-        image_data = await edit_image_with_sdk(
-            image_url=request.image_url,
-            prompt=request.prompt.strip(),
-            strength=request.strength,
-            request_id=request_id
-        )
-
-        # 保存结果
-        final_url = image_data
-        storage_info = {}
-
-        if image_data.startswith("data:"):
-            print(f"💾 [Python后端-{request_id}] 保存编辑后的图片...")
-            storage = get_storage_provider()
-
-            folder = "pages"
-            filename_prefix = f"edited_{request.page_index}" if request.page_index else f"edited_{request_id}"
-
-            local_path, public_url = await storage.save_image(
-                image_data,
-                filename=filename_prefix,
-                folder=folder
-            )
-
-            final_url = public_url
-            storage_info = {
-                "storage_provider": type(storage).__name__,
-                "local_path": local_path
-            }
-
-        print(f"✅ [Python后端-{request_id}] 图片编辑完成: {final_url[:100]}...")
+        response_data = await edit_frame_image(request, request_id)
 
         return ImageEditResponse(
             success=True,
-            data={
-                "imageUrl": final_url,
-                "prompt": request.prompt,
-                "pageIndex": request.page_index,
-                **storage_info
-            }
+            data=response_data
         )
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ [Python后端-{request_id}] 编辑失败: {str(e)}")
+        logger.error(f"❌ [Python后端-{request_id}] 编辑失败: {str(e)}")
         return ImageEditResponse(
             success=False,
             error=f"图片编辑失败: {str(e)}"
         )
 
+# ============ 后台任务接口 ============
+
+async def run_image_job(request: dict, job: JobContext) -> dict:
+    """后台任务：文生图（按批量优先级排队，不抢占交互请求）"""
+    return await _generate_frame_image(ImageGenerationRequest(**request), job.job_id, job, PRIORITY_BULK)
+
+async def run_edit_job(request: dict, job: JobContext) -> dict:
+    """后台任务：图生图"""
+    return await edit_frame_image(ImageEditRequest(**request), job.job_id, job)
+
+async def run_audio_job(request: dict, job: JobContext) -> dict:
+    """后台任务：音频合成"""
+    return await generate_audio_file(AudioGenerationRequest(**request), job.job_id, job)
+
+def job_status_data(job: dict) -> dict:
+    return {
+        "jobId": job["job_id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "taskId": job["task_id"],
+        "error": job["error"],
+        "createdAt": job["created_at"],
+        "updatedAt": job["updated_at"],
+    }
+
+@app.post("/api/jobs/generate-image", response_model=ImageGenerationResponse)
+async def submit_generate_image_job(request: ImageGenerationRequest):
+    """提交图片生成任务，立即返回job_id（服务重启后自动恢复）"""
+    job_id = await get_job_manager().submit("image", jsonable_encoder(request))
+    logger.info(f"📋 [Python后端-{job_id}] 图片生成任务已提交")
+    return ImageGenerationResponse(success=True, data={"jobId": job_id, "status": "queued"})
+
+@app.post("/api/jobs/edit-image", response_model=ImageEditResponse)
+async def submit_edit_image_job(request: ImageEditRequest):
+    """提交图片编辑任务，立即返回job_id（服务重启后自动恢复）"""
+    job_id = await get_job_manager().submit("edit", jsonable_encoder(request))
+    logger.info(f"📋 [Python后端-{job_id}] 图片编辑任务已提交")
+    return ImageEditResponse(success=True, data={"jobId": job_id, "status": "queued"})
+
+@app.post("/api/jobs/generate-audio", response_model=AudioGenerationResponse)
+async def submit_generate_audio_job(request: AudioGenerationRequest):
+    """提交音频合成任务，立即返回job_id"""
+    job_id = await get_job_manager().submit("audio", jsonable_encoder(request))
+    logger.info(f"📋 [Python后端-{job_id}] 音频合成任务已提交")
+    return AudioGenerationResponse(success=True, data={"jobId": job_id, "status": "queued"})
+
+@app.get("/api/upstream/backlog")
+async def upstream_backlog():
+    """上游任务排队情况（按 req_key 统计处理中和等待中的任务数）"""
+    return {"success": True, "data": get_upstream_limiter().get_backlog()}
+
+@app.get("/api/jobs/events")
+async def job_events(job_ids: Optional[str] = None, last_event_id: Optional[str] = Header(None)):
+    """任务事件流（SSE）
+
+    推送后台任务的状态变化（queued / submitted / polling / upstream_done / stored / failed）。
+    job_ids 为逗号分隔的任务ID，只推送这些任务的事件并补发其历史事件（polling 事件不补发）；
+    已结束任务的结束事件已不在历史中时，从任务库读取后补发（带 snapshot 标记）。不指定时推送所有任务的新事件。
+    断线重连时浏览器自动携带 Last-Event-ID 请求头，补发错过的事件。
+    """
+    ids = {job_id.strip() for job_id in job_ids.split(",") if job_id.strip()} if job_ids else None
+    try:
+        since = int(last_event_id) if last_event_id else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无效的Last-Event-ID: {last_event_id}")
+
+    # 已结束任务的结束事件在线程中预先读出；订阅时历史中已有结束事件的任务以历史为准
+    terminal_events = await get_job_manager().terminal_events(ids) if ids else {}
+
+    async def event_stream():
+        async for event in get_job_event_bus().subscribe(ids, since, terminal_lookup=terminal_events.get):
+            if event is None:
+                # 心跳，防止代理因空闲断开连接
+                yield ": keepalive\n\n"
+                continue
+            payload = json.dumps(event, ensure_ascii=False)
+            yield f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """查询任务状态"""
+    job = await get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    return {"success": True, "data": job_status_data(job)}
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """获取任务结果：成功时返回与同步接口相同的data，未完成时返回202"""
+    job = await get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    if job["status"] == "succeeded":
+        return {"success": True, "data": job["result"]}
+    if job["status"] == "failed":
+        return {"success": False, "error": job["error"], "data": job_status_data(job)}
+    return JSONResponse(status_code=202, content={"success": False, "data": job_status_data(job)})
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,248 @@
+"""
+监控指标模块
+以 Prometheus 文本格式（text/plain; version=0.0.4）通过 /metrics 暴露生成链路各阶段的耗时分布，
+用于容量规划和发现上游性能退化。不依赖 prometheus_client，只实现本服务用到的直方图、计数器和仪表盘。
+
+指标：
+- jimeng_submit_seconds{req_key}: 单次提交任务调用耗时（不含限流排队）
+- jimeng_task_seconds{req_key}: 上游任务从提交到完成的耗时
+- jimeng_polls_per_task{req_key, outcome}: 每个任务的查询次数（outcome: completed/failed/timeout）
+- image_generation_seconds{aspect_ratio}: 单帧图片端到端耗时（生成、保存、衍生图；不含缓存命中）
+- storage_write_seconds{provider, operation}: 存储写入/上传耗时
+- tts_time_to_first_byte_seconds: TTS从发起会话到收到首个音频块的耗时
+- tts_realtime_factor: TTS合成耗时 / 音频时长（小于1表示快于实时）
+- upstream_tasks_in_flight{req_key} / upstream_tasks_waiting{req_key}: 占用/等待上游名额的任务数
+- poll_tasks_outstanding: 轮询中的上游任务数
+- jobs_running: 后台执行中的任务数
+- tts_sessions_in_flight: 进行中的TTS合成会话数
+- single_flight_requests_total{name, role}: 请求合并器收到的请求数（role: leader 实际执行 / coalesced 等待已有结果）
+- single_flight_in_flight{name}: 合并器中正在执行的请求数
+"""
+
+import functools
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# 默认耗时分桶（秒）
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Histogram:
+    """直方图：按标签分别统计各分桶的累计次数、总和与次数"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # 标签值 -> [各分桶计数..., 总和, 次数]
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in sorted(items):
+            for index, bound in enumerate(self.buckets):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {series[index]}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, inf)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    """计数器：只增不减，按标签分别累计"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """仪表盘：直接 inc/dec/set，或在采集时调用 set_function 注册的函数取值"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], Union[float, Dict[LabelValues, float]]]] = None
+
+    def _key(self, labels: dict) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], Union[float, Dict[LabelValues, float]]]):
+        """
+        采集时取值：无标签时函数返回数值，有标签时返回 {标签值元组: 数值}
+        """
+        self._function = function
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        if self._function is not None:
+            try:
+                values = self._function()
+            except Exception:
+                # 依赖的组件尚未初始化或已关闭时不输出数据
+                values = {}
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+# ============ 指标定义 ============
+
+SUBMIT_LATENCY = Histogram(
+    "jimeng_submit_seconds", "Jimeng submit task call latency", ["req_key"]
+)
+TASK_DURATION = Histogram(
+    "jimeng_task_seconds", "Jimeng task duration from submit to completion", ["req_key"],
+    buckets=(2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300)
+)
+POLLS_PER_TASK = Histogram(
+    "jimeng_polls_per_task", "Number of result queries per Jimeng task", ["req_key", "outcome"],
+    buckets=(1, 2, 3, 5, 8, 13, 20, 30, 50, 80, 120, 200)
+)
+IMAGE_GENERATION_LATENCY = Histogram(
+    "image_generation_seconds", "End-to-end frame image generation latency", ["aspect_ratio"],
+    buckets=(2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300)
+)
+STORAGE_WRITE_LATENCY = Histogram(
+    "storage_write_seconds", "Storage write/upload latency", ["provider", "operation"]
+)
+TTS_TTFB = Histogram(
+    "tts_time_to_first_byte_seconds", "TTS latency from session start to first audio chunk"
+)
+TTS_REALTIME_FACTOR = Histogram(
+    "tts_realtime_factor", "TTS synthesis time divided by audio duration",
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3)
+)
+
+SINGLE_FLIGHT_REQUESTS = Counter(
+    "single_flight_requests_total", "Requests seen by a single-flight group, by leader/coalesced role",
+    ["name", "role"]
+)
+
+UPSTREAM_IN_FLIGHT = Gauge(
+    "upstream_tasks_in_flight", "Jimeng tasks holding an upstream concurrency slot", ["req_key"]
+)
+UPSTREAM_WAITING = Gauge(
+    "upstream_tasks_waiting", "Jimeng tasks waiting for an upstream concurrency slot", ["req_key"]
+)
+POLL_OUTSTANDING = Gauge(
+    "poll_tasks_outstanding", "Jimeng tasks currently being polled"
+)
+JOBS_RUNNING = Gauge(
+    "jobs_running", "Background jobs currently executing"
+)
+TTS_IN_FLIGHT = Gauge(
+    "tts_sessions_in_flight", "TTS synthesis sessions in progress"
+)
+SINGLE_FLIGHT_IN_FLIGHT = Gauge(
+    "single_flight_in_flight", "Single-flight calls currently executing", ["name"]
+)
+
+METRICS = [
+    SUBMIT_LATENCY, TASK_DURATION, POLLS_PER_TASK, IMAGE_GENERATION_LATENCY, STORAGE_WRITE_LATENCY,
+    TTS_TTFB, TTS_REALTIME_FACTOR, SINGLE_FLIGHT_REQUESTS,
+    UPSTREAM_IN_FLIGHT, UPSTREAM_WAITING, POLL_OUTSTANDING, JOBS_RUNNING, TTS_IN_FLIGHT,
+    SINGLE_FLIGHT_IN_FLIGHT,
+]
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def render_metrics() -> str:
+    """输出所有指标的 Prometheus 文本格式"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def timed_storage_write(operation: str):
+    """记录存储Provider异步写入方法的耗时（按Provider类名区分）"""
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            start_time = time.time()
+            try:
+                return await method(self, *args, **kwargs)
+            finally:
+                STORAGE_WRITE_LATENCY.observe(time.time() - start_time,
+                                              provider=type(self).__name__, operation=operation)
+        return wrapper
+    return decorator
@@ -0,0 +1,358 @@
+"""
+任务轮询调度模块
+集中管理所有未完成的即梦异步任务（task_id），由一个后台协程统一调度查询，
+替代每个请求各自 "sleep 2秒 × 150次" 的固定轮询循环。
+
+轮询间隔根据同类任务（按 req_key 区分）历史完成耗时自适应：
+- 历史样本不足时：从 POLL_INITIAL_INTERVAL 开始指数退避，最大 POLL_MAX_INTERVAL
+- 早于历史P10：几乎不可能完成，直接等到P10附近再查
+- P10 ~ P90 之间：按完成概率步进，每次等到历史样本中再有 POLL_QUANTILE_STEP 比例的任务完成的时间点再查，
+  完成集中的时段查得密（间隔可短至 POLL_MIN_INTERVAL，低于原固定的2秒），分散的时段查得疏
+- 超过P90：长尾任务，从 POLL_INITIAL_INTERVAL 开始指数退避降低查询量
+所有任务的查询共用一个令牌桶（POLL_MAX_QPS），总查询频率有上限，超出时顺延
+
+同一任务可被多个请求等待（如服务重启后恢复的任务），只有最后一个等待者离开时才停止轮询
+
+通过环境变量配置：
+- POLL_MIN_INTERVAL: 高概率完成区间内的最短轮询间隔秒数（默认0.5）
+- POLL_INITIAL_INTERVAL: 无历史样本和长尾阶段的起始退避间隔秒数（默认1）
+- POLL_MAX_INTERVAL: 最长轮询间隔秒数（默认5）
+- POLL_QUANTILE_STEP: P10 ~ P90 区间内每次轮询推进的完成概率（默认0.05）
+- POLL_MAX_QPS: 所有任务合计每秒最多查询次数（默认10，0为不限制）
+- POLL_TIMEOUT: 单个任务最长等待秒数（默认300）
+"""
+
+import os
+import asyncio
+import bisect
+import math
+import contextvars
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from metrics import POLLS_PER_TASK, TASK_DURATION
+from rate_limiter import TokenBucket
+from tracing import Span, current_span, start_span
+from app_logging import get_logger
+
+logger = get_logger("poll_scheduler")
+
+# 自适应调度所需的最少历史样本数
+MIN_HISTORY_SAMPLES = 5
+# 每类任务保留的历史样本数
+HISTORY_SIZE = 200
+# 退避倍率
+BACKOFF_FACTOR = 1.5
+
+
+class PollTimeoutError(TimeoutError):
+    """任务轮询超时"""
+    pass
+
+
+@dataclass
+class _PollEntry:
+    """一个正在轮询的任务"""
+    task_id: str
+    category: str
+    query: Callable[[], Awaitable[dict]]
+    handler: Callable[[dict, int], Any]
+    future: asyncio.Future
+    submitted_at: float
+    deadline: float
+    next_poll_at: float
+    polls: int = 0
+    backoff_polls: int = 0
+    in_flight: bool = False
+    waiters: int = 0
+    # 登记任务的请求所在的span：查询在调度器的任务中执行，需显式关联
+    parent_span: Optional[Span] = None
+
+
+class PollScheduler:
+    """中心化轮询调度器"""
+
+    def __init__(self, min_interval: float = 0.5, max_interval: float = 5.0, timeout: float = 300.0,
+                 quantile_step: float = 0.05, initial_interval: float = 1.0, max_qps: float = 10.0):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.initial_interval = min(max(initial_interval, min_interval), self.max_interval)
+        self.timeout = timeout
+        self.quantile_step = quantile_step
+        self.max_qps = max_qps
+        self._budget = TokenBucket(max_qps) if max_qps > 0 else None
+
+        self._entries: Dict[str, _PollEntry] = {}
+        self._history: Dict[str, Deque[float]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+
+        # 统计数据
+        self._total_polls = 0
+        self._completed = 0
+        self._failed = 0
+        self._timeouts = 0
+
+        logger.info(f"⏱️ [PollScheduler] 初始化，轮询间隔: {min_interval}s ~ {self.max_interval}s，"
+                    f"起始退避: {self.initial_interval}s，概率步长: {quantile_step}，"
+                    f"查询QPS上限: {max_qps or '不限'}，超时: {timeout}s")
+
+    async def wait_for(self, task_id: str, category: str,
+                       query: Callable[[], Awaitable[dict]],
+                       handler: Callable[[dict, int], Any],
+                       submitted_at: Optional[float] = None) -> Any:
+        """
+        登记任务并等待其完成
+
+        Args:
+            task_id: 上游任务ID
+            category: 任务类别（如 req_key），用于区分完成耗时分布
+            query: 发起一次查询的协程函数，返回查询响应
+            handler: 解析查询响应 handler(resp, poll_index)，
+                     返回非None表示任务完成；返回None表示仍在处理；抛出异常表示任务失败
+            submitted_at: 任务提交时间，默认为当前时间（服务重启后恢复任务时传入原提交时间）
+
+        Returns:
+            handler 返回的结果
+
+        Raises:
+            PollTimeoutError: 超过 POLL_TIMEOUT 仍未完成
+        """
+        key = f"{category}:{task_id}"
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._register(key, task_id, category, query, handler, submitted_at)
+
+        # 同一任务已在轮询中时共享结果；单个等待者取消不影响其他等待者
+        entry.waiters += 1
+        try:
+            return await asyncio.shield(entry.future)
+        finally:
+            entry.waiters -= 1
+            if entry.waiters == 0:
+                # 最后一个等待者离开：停止轮询该任务
+                if not entry.future.done():
+                    entry.future.cancel()
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+
+    def _register(self, key: str, task_id: str, category: str,
+                  query: Callable[[], Awaitable[dict]], handler: Callable[[dict, int], Any],
+                  submitted_at: Optional[float]) -> _PollEntry:
+        loop = asyncio.get_running_loop()
+        now = time.time()
+        submitted_at = submitted_at or now
+
+        entry = _PollEntry(
+            task_id=task_id,
+            category=category,
+            query=query,
+            handler=handler,
+            future=loop.create_future(),
+            submitted_at=submitted_at,
+            deadline=submitted_at + self.timeout,
+            next_poll_at=now,
+            parent_span=current_span(),
+        )
+        entry.next_poll_at = now + self._next_delay(entry, now)
+        self._entries[key] = entry
+        self._ensure_runner()
+        self._wakeup.set()
+        return entry
+
+    def _ensure_runner(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._runner is None or self._runner.done():
+            # 在空白上下文中启动，不继承首个登记任务的请求的上下文（请求ID、span）
+            self._runner = contextvars.Context().run(asyncio.create_task, self._run())
+
+    async def _run(self):
+        """后台调度循环：在最早到期的任务时间点醒来，发起所有到期任务的查询"""
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+
+            next_wake = None
+            for entry in list(self._entries.values()):
+                if entry.in_flight or entry.future.done():
+                    continue
+                if entry.next_poll_at <= now:
+                    entry.in_flight = True
+                    asyncio.create_task(self._poll(entry))
+                elif next_wake is None or entry.next_poll_at < next_wake:
+                    next_wake = entry.next_poll_at
+
+            timeout = None if next_wake is None else max(next_wake - time.time(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, entry: _PollEntry):
+        """对单个任务发起一次查询"""
+        if self._budget is not None:
+            # 总查询频率超出上限时顺延
+            await self._budget.acquire()
+        if entry.future.done():
+            entry.in_flight = False
+            return
+        entry.polls += 1
+        self._total_polls += 1
+        try:
+            with start_span("jimeng.poll", parent=entry.parent_span, req_key=entry.category,
+                            task_id=entry.task_id, poll=entry.polls) as span:
+                resp = await entry.query()
+                result = entry.handler(resp, entry.polls)
+                span.set_attribute("done", result is not None)
+        except Exception as e:
+            self._failed += 1
+            POLLS_PER_TASK.observe(entry.polls, req_key=entry.category, outcome="failed")
+            if not entry.future.done():
+                entry.future.set_exception(e)
+            return
+        finally:
+            entry.in_flight = False
+
+        now = time.time()
+        if result is not None:
+            self._record_completion(entry.category, now - entry.submitted_at)
+            self._completed += 1
+            TASK_DURATION.observe(now - entry.submitted_at, req_key=entry.category)
+            POLLS_PER_TASK.observe(entry.polls, req_key=entry.category, outcome="completed")
+            if not entry.future.done():
+                entry.future.set_result(result)
+            return
+
+        if now >= entry.deadline:
+            self._timeouts += 1
+            POLLS_PER_TASK.observe(entry.polls, req_key=entry.category, outcome="timeout")
+            if not entry.future.done():
+                entry.future.set_exception(PollTimeoutError(
+                    f"任务轮询超时 (task_id: {entry.task_id}, 等待了 {int(now - entry.submitted_at)} 秒)"
+                ))
+            return
+
+        entry.next_poll_at = min(now + self._next_delay(entry, now), entry.deadline)
+        self._wakeup.set()
+
+    def _next_delay(self, entry: _PollEntry, now: float) -> float:
+        """根据历史完成耗时分布计算下次轮询的等待时间"""
+        elapsed = now - entry.submitted_at
+        samples = self._samples(entry.category)
+
+        if samples is None:
+            return self._backoff(entry)
+
+        p10, p90 = self._percentile(samples, 0.1), self._percentile(samples, 0.9)
+        if elapsed < p10:
+            # 早期：跳到P10附近再查
+            return self._clamp(p10 - elapsed)
+        if elapsed <= p90:
+            # 高概率完成区间：等到再有 quantile_step 比例的历史任务完成的时间点
+            completed = bisect.bisect_right(samples, elapsed)
+            step = max(1, math.ceil(self.quantile_step * len(samples)))
+            target = samples[min(completed + step - 1, len(samples) - 1)]
+            return self._clamp(target - elapsed)
+        # 长尾：退避
+        return self._backoff(entry)
+
+    def _clamp(self, delay: float) -> float:
+        return min(max(delay, self.min_interval), self.max_interval)
+
+    def _backoff(self, entry: _PollEntry) -> float:
+        delay = self._clamp(self.initial_interval * (BACKOFF_FACTOR ** entry.backoff_polls))
+        entry.backoff_polls += 1
+        return delay
+
+    def _samples(self, category: str) -> Optional[List[float]]:
+        """排序后的历史完成耗时；样本不足时返回None"""
+        history = self._history.get(category)
+        if not history or len(history) < MIN_HISTORY_SAMPLES:
+            return None
+        return sorted(history)
+
+    @staticmethod
+    def _percentile(samples: List[float], q: float) -> float:
+        return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+    def _quantiles(self, category: str):
+        samples = self._samples(category)
+        if samples is None:
+            return None
+        return self._percentile(samples, 0.1), self._percentile(samples, 0.9)
+
+    def _record_completion(self, category: str, duration: float):
+        if category not in self._history:
+            self._history[category] = deque(maxlen=HISTORY_SIZE)
+        self._history[category].append(duration)
+
+    def get_stats(self) -> dict:
+        """获取调度器状态"""
+        finished = self._completed + self._failed + self._timeouts
+        stats = {
+            "outstanding": len(self._entries),
+            "total_polls": self._total_polls,
+            "completed": self._completed,
+            "failed": self._failed,
+            "timeouts": self._timeouts,
+            "avg_polls_per_task": round(self._total_polls / finished, 2) if finished else 0.0,
+            "max_qps": self.max_qps,
+            "budget_waiting": self._budget.waiting if self._budget is not None else 0,
+            "completion_time": {},
+        }
+        for category in self._history:
+            quantiles = self._quantiles(category)
+            stats["completion_time"][category] = {
+                "samples": len(self._history[category]),
+                "p10": round(quantiles[0], 2) if quantiles else None,
+                "p90": round(quantiles[1], 2) if quantiles else None,
+            }
+        return stats
+
+    def shutdown(self):
+        """停止调度循环，未完成的任务以取消结束"""
+        if self._runner is not None:
+            self._runner.cancel()
+            self._runner = None
+        for entry in list(self._entries.values()):
+            if not entry.future.done():
+                entry.future.cancel()
+        self._entries.clear()
+        logger.info(f"⏱️ [PollScheduler] 已关闭")
+
+
+# ============ 工厂函数 ============
+
+_scheduler_instance: Optional[PollScheduler] = None
+
+def get_poll_scheduler() -> PollScheduler:
+    """
+    获取轮询调度器实例（单例模式）
+    通过环境变量 POLL_MIN_INTERVAL / POLL_INITIAL_INTERVAL / POLL_MAX_INTERVAL /
+    POLL_QUANTILE_STEP / POLL_MAX_QPS / POLL_TIMEOUT 配置
+    """
+    global _scheduler_instance
+
+    if _scheduler_instance is not None:
+        return _scheduler_instance
+
+    _scheduler_instance = PollScheduler(
+        min_interval=float(os.getenv('POLL_MIN_INTERVAL', 0.5)),
+        max_interval=float(os.getenv('POLL_MAX_INTERVAL', 5)),
+        timeout=float(os.getenv('POLL_TIMEOUT', 300)),
+        quantile_step=float(os.getenv('POLL_QUANTILE_STEP', 0.05)),
+        initial_interval=float(os.getenv('POLL_INITIAL_INTERVAL', 1)),
+        max_qps=float(os.getenv('POLL_MAX_QPS', 10))
+    )
+    return _scheduler_instance
+
+
+def shutdown_poll_scheduler():
+    """停止并重置轮询调度器实例"""
+    global _scheduler_instance
+    if _scheduler_instance is not None:
+        _scheduler_instance.shutdown()
+        _scheduler_instance = None
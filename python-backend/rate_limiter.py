@@ -0,0 +1,263 @@
+"""
+上游调用限流模块
+限制同时在即梦处理中的任务数量，并按QPS配额平滑提交请求，
+避免批量生成时瞬间打满上游配额。
+
+文生图（jimeng_t2i_v40）和图生图（jimeng_high_aes_i2i）的配额相互独立，按 req_key 分别限流；
+等待名额和令牌时按优先级排队，用户交互的图生图编辑排在批量生成的分镜页之前。
+
+通过环境变量配置：
+- JIMENG_MAX_CONCURRENCY: 每个 req_key 同时处理中的上游任务数上限（默认10）
+- JIMENG_SUBMIT_QPS: 每个 req_key 每秒最多提交的任务数（默认2）
+- JIMENG_BUDGETS: 按 req_key 单独配置，格式 req_key:并发数:QPS，逗号分隔
+  （如 jimeng_t2i_v40:10:2,jimeng_high_aes_i2i:4:1）
+- JIMENG_MAX_BACKLOG: 每个 req_key 最多排队等待的任务数，超出时直接拒绝（默认0，不限制）
+"""
+
+import os
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+# 优先级（数值越小越优先）
+PRIORITY_INTERACTIVE = 0  # 用户正在等待的交互操作（图生图编辑）
+PRIORITY_NORMAL = 1       # 单张生成
+PRIORITY_BULK = 2         # 批量生成、后台任务
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_NORMAL: "normal",
+    PRIORITY_BULK: "bulk",
+}
+
+
+class BacklogFullError(RuntimeError):
+    """排队等待的任务数已达上限"""
+    pass
+
+
+class PriorityGate:
+    """按优先级排队的并发闸门：名额释放时交给优先级最高（同优先级先来先得）的等待者"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def waiting_by_priority(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL):
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 名额已交给本等待者但随即被取消：转交给下一个
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # 名额直接转交，active 不变
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+class TokenBucket:
+    """令牌桶：按固定速率补充令牌，取不到令牌时异步等待"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        # 同一时间只有一个等待者等待补充令牌，其余按优先级排队
+        self._turn = PriorityGate(1)
+
+    @property
+    def waiting(self) -> int:
+        return self._turn.waiting
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL):
+        """获取一个令牌"""
+        await self._turn.acquire(priority)
+        try:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+        finally:
+            self._turn.release()
+
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+class _Budget:
+    """一个 req_key 的并发名额和提交令牌"""
+
+    def __init__(self, max_concurrency: int, submit_qps: float):
+        self.max_concurrency = max_concurrency
+        self.submit_qps = submit_qps
+        self.gate = PriorityGate(max_concurrency)
+        self.bucket = TokenBucket(submit_qps)
+        self.admitted = 0
+        self.rejected = 0
+
+
+def parse_budgets(spec: str) -> Dict[str, Tuple[int, float]]:
+    """解析 "req_key:并发数:QPS,..." 格式的配额配置"""
+    budgets = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        req_key, concurrency, qps = item.split(":")
+        budgets[req_key.strip()] = (int(concurrency), float(qps))
+    return budgets
+
+
+class UpstreamLimiter:
+    """
+    上游并发与QPS限流器（按 req_key 分别计算配额）
+    - admit(req_key): 检查排队是否已满（排队已满时拒绝新请求，而不是无限排队）
+    - slot(req_key, priority): 占用一个并发名额，覆盖任务从提交到轮询结束的整个过程
+    - wait_submit(req_key, priority): 提交请求前获取QPS令牌
+    """
+
+    def __init__(self, max_concurrency: int = 10, submit_qps: float = 2.0,
+                 budgets: Optional[Dict[str, Tuple[int, float]]] = None, max_backlog: int = 0):
+        self.max_concurrency = max_concurrency
+        self.submit_qps = submit_qps
+        self.max_backlog = max_backlog
+        self._budget_config = budgets or {}
+        self._budgets: Dict[str, _Budget] = {}
+
+        print(f"🚦 [UpstreamLimiter] 初始化，默认最大并发: {max_concurrency}，提交QPS: {submit_qps}，"
+              f"单独配额: {self._budget_config or '无'}，排队上限: {max_backlog or '不限'}")
+
+    def _budget(self, req_key: str) -> _Budget:
+        budget = self._budgets.get(req_key)
+        if budget is None:
+            max_concurrency, submit_qps = self._budget_config.get(req_key, (self.max_concurrency, self.submit_qps))
+            budget = _Budget(max_concurrency, submit_qps)
+            self._budgets[req_key] = budget
+        return budget
+
+    def admit(self, req_key: str):
+        """
+        准入检查
+
+        Raises:
+            BacklogFullError: 排队任务数已达 JIMENG_MAX_BACKLOG
+        """
+        budget = self._budget(req_key)
+        if self.max_backlog and budget.gate.waiting >= self.max_backlog:
+            budget.rejected += 1
+            raise BacklogFullError(f"上游任务排队已满 ({req_key}: {budget.gate.waiting} 个等待中)，请稍后重试")
+
+    @asynccontextmanager
+    async def slot(self, req_key: str, priority: int = PRIORITY_NORMAL):
+        """占用一个上游并发名额，等待时按优先级排队"""
+        budget = self._budget(req_key)
+        await budget.gate.acquire(priority)
+        budget.admitted += 1
+        try:
+            yield
+        finally:
+            budget.gate.release()
+
+    async def wait_submit(self, req_key: str, priority: int = PRIORITY_NORMAL):
+        """等待提交配额"""
+        await self._budget(req_key).bucket.acquire(priority)
+
+    def get_backlog(self) -> Dict[str, dict]:
+        """获取各 req_key 当前的处理中和排队情况"""
+        return {
+            req_key: {
+                "active": budget.gate.active,
+                "waiting": budget.gate.waiting,
+                "waiting_by_priority": budget.gate.waiting_by_priority(),
+                "waiting_submit": budget.bucket.waiting,
+            }
+            for req_key, budget in self._budgets.items()
+        }
+
+    def get_stats(self) -> dict:
+        """获取限流器状态"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "submit_qps": self.submit_qps,
+            "max_backlog": self.max_backlog,
+            "budgets": {
+                req_key: {
+                    "max_concurrency": budget.max_concurrency,
+                    "submit_qps": budget.submit_qps,
+                    "active": budget.gate.active,
+                    "waiting": budget.gate.waiting,
+                    "tokens": round(budget.bucket.available(), 2),
+                    "admitted": budget.admitted,
+                    "rejected": budget.rejected,
+                }
+                for req_key, budget in self._budgets.items()
+            },
+        }
+
+
+# ============ 工厂函数 ============
+
+_limiter_instance: Optional[UpstreamLimiter] = None
+
+def get_upstream_limiter() -> UpstreamLimiter:
+    """
+    获取上游限流器实例（单例模式）
+    通过环境变量 JIMENG_MAX_CONCURRENCY / JIMENG_SUBMIT_QPS / JIMENG_BUDGETS / JIMENG_MAX_BACKLOG 配置
+    """
+    global _limiter_instance
+
+    if _limiter_instance is not None:
+        return _limiter_instance
+
+    _limiter_instance = UpstreamLimiter(
+        max_concurrency=int(os.getenv('JIMENG_MAX_CONCURRENCY', 10)),
+        submit_qps=float(os.getenv('JIMENG_SUBMIT_QPS', 2)),
+        budgets=parse_budgets(os.getenv('JIMENG_BUDGETS', '')),
+        max_backlog=int(os.getenv('JIMENG_MAX_BACKLOG', 0))
+    )
+    return _limiter_instance
+
+
+def reset_upstream_limiter():
+    """重置限流器实例"""
+    global _limiter_instance
+    _limiter_instance = None
@@ -0,0 +1,197 @@
+"""
+生成结果缓存模块
+以规范化后的即梦提交参数（req_key、prompt、尺寸等）和保存目标（文件夹、文件名）的哈希为键，
+缓存已保存到存储的图片URL，重复生成相同内容时直接返回，不再消耗上游配额。
+保存目标参与计算键：不同分镜页的提示词相同时各自保存到自己的文件，不会返回其他页的（可能被覆盖的）文件。
+
+缓存持久化在SQLite中，按 TTL 过期，超过容量上限时按最近访问时间（LRU）淘汰。
+
+通过环境变量配置：
+- RESULT_CACHE_ENABLED: 是否启用（默认true）
+- RESULT_CACHE_PATH: SQLite文件路径（默认 python-backend/data/result_cache.db）
+- RESULT_CACHE_TTL: 过期秒数（默认7天）
+- RESULT_CACHE_MAX_ENTRIES: 最大条目数（默认5000）
+"""
+
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+
+def make_cache_key(submit_form: dict, folder: str = "", filename: str = "") -> str:
+    """根据提交参数和保存目标生成缓存键（键排序、去除首尾空白后取SHA-256）"""
+    normalized = dict(submit_form)
+    if isinstance(normalized.get('prompt'), str):
+        normalized['prompt'] = normalized['prompt'].strip()
+    payload = json.dumps({"form": normalized, "folder": folder, "filename": filename},
+                         sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """基于SQLite的 LRU + TTL 结果缓存"""
+
+    def __init__(self, db_path: str, ttl: float = 7 * 24 * 3600, max_entries: int = 5000):
+        self.db_path = Path(db_path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS result_cache (
+                cache_key TEXT PRIMARY KEY,
+                image_url TEXT NOT NULL,
+                local_path TEXT,
+                storage_provider TEXT,
+                variants TEXT,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        # 旧版本数据库没有 variants 列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(result_cache)")}
+        if "variants" not in columns:
+            self._conn.execute("ALTER TABLE result_cache ADD COLUMN variants TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_access ON result_cache(last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_path ON result_cache(local_path)")
+        self._conn.commit()
+
+        self._hits = 0
+        self._misses = 0
+
+        print(f"🗃️ [ResultCache] 初始化，路径: {self.db_path}，TTL: {int(ttl)}s，容量: {max_entries}")
+
+    def get(self, cache_key: str) -> Optional[dict]:
+        """查询缓存，过期或本地文件已不存在时视为未命中"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT image_url, local_path, storage_provider, variants, created_at FROM result_cache WHERE cache_key = ?",
+                (cache_key,)
+            ).fetchone()
+
+            if row is None:
+                self._misses += 1
+                return None
+
+            image_url, local_path, storage_provider, variants, created_at = row
+            expired = now - created_at > self.ttl
+            # 本地存储的文件可能被手动删除
+            missing = storage_provider == "LocalStorageProvider" and local_path and not os.path.exists(local_path)
+            if expired or missing:
+                self._conn.execute("DELETE FROM result_cache WHERE cache_key = ?", (cache_key,))
+                self._conn.commit()
+                self._misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE result_cache SET last_access = ?, hits = hits + 1 WHERE cache_key = ?",
+                (now, cache_key)
+            )
+            self._conn.commit()
+            self._hits += 1
+
+        return {
+            "image_url": image_url,
+            "local_path": local_path,
+            "storage_provider": storage_provider,
+            "variants": json.loads(variants) if variants else None,
+            "created_at": created_at,
+        }
+
+    def put(self, cache_key: str, image_url: str, local_path: str = None, storage_provider: str = None,
+            variants: dict = None):
+        """
+        写入缓存（variants 为衍生图 {尺寸名: URL}）
+        同一存储路径会被后续生成覆盖（如 page_1.png），因此先清除指向该路径的旧条目
+        """
+        now = time.time()
+        with self._lock:
+            if local_path:
+                self._conn.execute("DELETE FROM result_cache WHERE local_path = ?", (local_path,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO result_cache "
+                "(cache_key, image_url, local_path, storage_provider, variants, created_at, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (cache_key, image_url, local_path, storage_provider,
+                 json.dumps(variants) if variants else None, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def invalidate_path(self, local_path: str):
+        """存储路径被覆盖时，清除指向该路径的缓存条目"""
+        with self._lock:
+            self._conn.execute("DELETE FROM result_cache WHERE local_path = ?", (local_path,))
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """清除过期条目，并按LRU淘汰超出容量的条目（调用方持有锁）"""
+        self._conn.execute("DELETE FROM result_cache WHERE created_at < ?", (now - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM result_cache").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM result_cache WHERE cache_key IN "
+                "(SELECT cache_key FROM result_cache ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def get_stats(self) -> dict:
+        """获取缓存状态"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM result_cache").fetchone()[0]
+        lookups = self._hits + self._misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ============ 工厂函数 ============
+
+_cache_instance: Optional[ResultCache] = None
+
+def get_result_cache() -> Optional[ResultCache]:
+    """
+    获取结果缓存实例（单例模式）
+    RESULT_CACHE_ENABLED=false 时返回None
+    """
+    global _cache_instance
+
+    if _cache_instance is not None:
+        return _cache_instance
+
+    if os.getenv('RESULT_CACHE_ENABLED', 'true').lower() != 'true':
+        return None
+
+    default_path = Path(__file__).parent / "data" / "result_cache.db"
+    _cache_instance = ResultCache(
+        db_path=os.getenv('RESULT_CACHE_PATH', str(default_path)),
+        ttl=float(os.getenv('RESULT_CACHE_TTL', 7 * 24 * 3600)),
+        max_entries=int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 5000))
+    )
+    return _cache_instance
+
+
+def reset_result_cache():
+    """关闭并重置结果缓存实例"""
+    global _cache_instance
+    if _cache_instance is not None:
+        _cache_instance.close()
+        _cache_instance = None
@@ -0,0 +1,194 @@
+"""
+SDK调用执行器模块
+火山引擎SDK的 cv_sync2async_* 方法都是同步HTTP调用，直接在 async 接口中调用会阻塞整个事件循环。
+本模块提供一个有界线程池，所有SDK调用都通过它执行。
+
+通过环境变量配置：
+- SDK_EXECUTOR_MAX_WORKERS: 线程池大小（默认16）
+- SDK_EXECUTOR_MAX_QUEUE: 允许排队等待线程的最大调用数（默认256），超出后调用方异步等待
+- SDK_CALL_TIMEOUT: 单次SDK调用超时秒数（默认60）
+
+调用超时后调用方立即收到 SDKCallTimeoutError，但已在线程中执行的同步调用无法中断，
+它占用的线程和队列名额要到调用真正结束才释放，因此同时执行的调用数始终不超过上限。
+"""
+
+import os
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class SDKCallTimeoutError(TimeoutError):
+    """SDK调用超时"""
+    pass
+
+
+class SDKExecutor:
+    """
+    有界SDK调用执行器
+    - 线程池大小固定，避免同步调用无限占用线程
+    - 排队深度有上限，超出后调用方在事件循环上等待（不占线程）
+    - 每次调用都有超时控制；超时后仍在执行的调用继续占用名额，直到线程中的调用结束
+    """
+
+    def __init__(self, max_workers: int = 16, max_queue: int = 256, call_timeout: float = 60.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.call_timeout = call_timeout
+
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sdk-call")
+        # 线程池中执行 + 排队的调用总数上限
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        # 统计数据（跨线程更新，需要加锁）
+        self._lock = threading.Lock()
+        self._waiting = 0      # 等待进入队列的调用（在事件循环上等待）
+        self._queued = 0       # 已提交到线程池、尚未开始执行
+        self._active = 0       # 正在线程中执行
+        self._completed = 0
+        self._failed = 0
+        self._timeouts = 0
+        self._abandoned = 0    # 已超时返回、仍在线程中执行的调用
+        self._total_time = 0.0
+
+        print(f"🧵 [SDKExecutor] 初始化，线程数: {max_workers}，最大排队: {max_queue}，调用超时: {call_timeout}s")
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+        return self._slots
+
+    def _wrap(self, func: Callable, args: tuple, kwargs: dict) -> Callable[[], Any]:
+        """包装调用，在线程中统计执行状态"""
+        def runner():
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.time() - start
+                with self._lock:
+                    self._active -= 1
+                    self._total_time += elapsed
+        return runner
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        在线程池中执行同步调用
+
+        Args:
+            func: 同步函数（如 visual_service.cv_sync2async_submit_task）
+            timeout: 本次调用超时秒数，默认使用 SDK_CALL_TIMEOUT
+
+        Raises:
+            SDKCallTimeoutError: 调用超时
+        """
+        timeout = timeout if timeout is not None else self.call_timeout
+        slots = self._get_slots()
+
+        with self._lock:
+            self._waiting += 1
+        try:
+            await slots.acquire()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        loop = asyncio.get_running_loop()
+        # abandoned: 调用方已超时返回，线程中的调用仍在执行
+        state = {"abandoned": False}
+
+        def on_done(_):
+            # 线程中的调用结束（或排队时被取消）才归还名额
+            with self._lock:
+                if state["abandoned"]:
+                    self._abandoned -= 1
+            try:
+                loop.call_soon_threadsafe(slots.release)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+        with self._lock:
+            self._queued += 1
+        future = self._pool.submit(self._wrap(func, args, kwargs))
+        future.add_done_callback(on_done)
+
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            # 尚未开始执行的调用可以直接取消；已在执行的只能等待SDK自身的HTTP超时释放线程
+            if future.cancel():
+                with self._lock:
+                    self._queued -= 1
+            with self._lock:
+                self._timeouts += 1
+                if not future.done():
+                    state["abandoned"] = True
+                    self._abandoned += 1
+            raise SDKCallTimeoutError(f"SDK调用超时 ({timeout}s): {getattr(func, '__name__', func)}")
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+
+        with self._lock:
+            self._completed += 1
+        return result
+
+    def get_stats(self) -> dict:
+        """获取执行器状态（用于健康检查和监控）"""
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "call_timeout": self.call_timeout,
+                "active": self._active,
+                "queued": self._queued,
+                "waiting": self._waiting,
+                "completed": self._completed,
+                "failed": self._failed,
+                "timeouts": self._timeouts,
+                "abandoned": self._abandoned,
+                "avg_call_time": round(self._total_time / finished, 3) if finished else 0.0,
+            }
+
+    def shutdown(self):
+        """关闭线程池"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        print(f"🧵 [SDKExecutor] 已关闭")
+
+
+# ============ 工厂函数 ============
+
+_executor_instance: Optional[SDKExecutor] = None
+
+def get_sdk_executor() -> SDKExecutor:
+    """
+    获取SDK执行器实例（单例模式）
+    通过环境变量 SDK_EXECUTOR_MAX_WORKERS / SDK_EXECUTOR_MAX_QUEUE / SDK_CALL_TIMEOUT 配置
+    """
+    global _executor_instance
+
+    if _executor_instance is not None:
+        return _executor_instance
+
+    _executor_instance = SDKExecutor(
+        max_workers=int(os.getenv('SDK_EXECUTOR_MAX_WORKERS', 16)),
+        max_queue=int(os.getenv('SDK_EXECUTOR_MAX_QUEUE', 256)),
+        call_timeout=float(os.getenv('SDK_CALL_TIMEOUT', 60))
+    )
+    return _executor_instance
+
+
+def shutdown_sdk_executor():
+    """关闭并重置SDK执行器实例"""
+    global _executor_instance
+    if _executor_instance is not None:
+        _executor_instance.shutdown()
+        _executor_instance = None
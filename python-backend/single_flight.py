@@ -0,0 +1,76 @@
+"""
+请求合并模块（single-flight）
+相同的请求并发到达时（前端重试、多个标签页渲染同一项目），只执行一次实际工作，
+其余请求等待同一个结果，避免重复创建即梦任务或TTS会话。
+
+合并情况除 /api/health 外也通过 /metrics 暴露（single_flight_requests_total / single_flight_in_flight）。
+"""
+
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict
+
+from metrics import SINGLE_FLIGHT_REQUESTS
+
+
+def make_request_key(payload: dict) -> str:
+    """根据规范化后的请求参数生成合并键"""
+    normalized = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    """同一键的并发调用共享一次执行结果"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+        self._calls = 0
+        self._coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行 fn，若相同 key 的调用正在进行则等待其结果
+
+        实际工作在独立的Task中运行，某个调用方被取消（如客户端断开）不会影响其他等待者
+        """
+        self._calls += 1
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self._coalesced += 1
+            SINGLE_FLIGHT_REQUESTS.inc(name=self.name, role="coalesced")
+        else:
+            SINGLE_FLIGHT_REQUESTS.inc(name=self.name, role="leader")
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> dict:
+        """获取合并统计"""
+        return {
+            "calls": self._calls,
+            "coalesced": self._coalesced,
+            "coalesce_rate": round(self._coalesced / self._calls, 3) if self._calls else 0.0,
+            "in_flight": len(self._in_flight),
+        }
+
+
+# ============ 工厂函数 ============
+
+_flight_instances: Dict[str, SingleFlight] = {}
+
+def get_single_flight(name: str) -> SingleFlight:
+    """获取指定名称的合并器实例（每类请求一个）"""
+    if name not in _flight_instances:
+        _flight_instances[name] = SingleFlight(name)
+    return _flight_instances[name]
+
+
+def get_single_flight_stats() -> Dict[str, dict]:
+    """获取所有合并器的统计"""
+    return {name: flight.get_stats() for name, flight in _flight_instances.items()}
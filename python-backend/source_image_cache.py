@@ -0,0 +1,230 @@
+"""
+图生图原图缓存模块
+用户通常会对同一页连续编辑多次，每次编辑都要重新下载/读取原图并重新做base64编码。
+本模块缓存编码后的原图（即梦 binary_data_base64 所需格式），按总字节数做LRU淘汰：
+- 本地路径（/generated/...）：以路径为键，文件 mtime + 大小作为校验，文件被覆盖后自动失效
+- HTTP URL：以URL为键，SOURCE_IMAGE_FRESH_TTL 秒内直接命中；之后携带 ETag / Last-Modified
+  发起条件请求，返回304时继续使用缓存。存储按固定文件名写入（page_1、edited_1 ...），
+  同一URL重新生成或编辑后由存储上传时调用 invalidate_source_image 清除，不会在免校验时长内返回旧图
+- data URL：不缓存，仅在启用预处理时解码处理后重新编码
+缓存的是预处理（缩放、重新编码，见 image_preprocess）之后的结果，重复编辑不会重复处理。
+
+通过环境变量配置：
+- SOURCE_IMAGE_CACHE_MAX_BYTES: 缓存总大小上限（默认64MB）
+- SOURCE_IMAGE_FRESH_TTL: HTTP原图免校验时长秒数（默认300）
+"""
+
+import os
+import asyncio
+import base64
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+from http_client import get_http_client
+from image_preprocess import get_image_preprocessor
+from app_logging import get_logger
+
+logger = get_logger("source_image_cache")
+
+
+class SourceImageError(ValueError):
+    """原图无效、不存在或下载失败"""
+    pass
+
+
+@dataclass
+class _SourceEntry:
+    base64_data: str
+    validator: Tuple
+    checked_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+def _encode(data: bytes) -> str:
+    """预处理（如已启用）后编码为base64（CPU密集，应在线程中调用）"""
+    preprocessor = get_image_preprocessor()
+    if preprocessor is not None:
+        try:
+            data = preprocessor.process(data)
+        except Exception as e:
+            logger.warning(f"⚠️ [SourceImageCache] 原图预处理失败，原样提交: {e}")
+    return base64.b64encode(data).decode('ascii')
+
+
+class SourceImageCache:
+    """图生图原图缓存（内存LRU，按编码后的字节数计算容量）"""
+
+    def __init__(self, public_root: Path, max_bytes: int = 64 * 1024 * 1024, fresh_ttl: float = 300.0):
+        self.public_root = Path(public_root).resolve()
+        self.max_bytes = max_bytes
+        self.fresh_ttl = fresh_ttl
+
+        self._entries: "OrderedDict[str, _SourceEntry]" = OrderedDict()
+        self._size = 0
+
+        # 统计数据
+        self._hits = 0
+        self._revalidated = 0
+        self._misses = 0
+        self._invalidated = 0
+
+        print(f"🖼️ [SourceImageCache] 初始化，容量: {max_bytes // 1024 // 1024}MB，HTTP免校验时长: {int(fresh_ttl)}s")
+
+    async def get_base64(self, source: str) -> str:
+        """
+        获取原图的base64数据
+
+        Args:
+            source: data URL、http(s) URL 或 public 目录下的路径（如 /generated/pages/page_1.png）
+
+        Raises:
+            SourceImageError: 格式不支持、文件不存在或下载失败
+        """
+        if source.startswith("data:"):
+            try:
+                base64_data = source.split(",", 1)[1]
+            except IndexError:
+                raise SourceImageError("无效的data URL格式")
+            if get_image_preprocessor() is None:
+                return base64_data
+            return await asyncio.to_thread(lambda: _encode(base64.b64decode(base64_data)))
+        if source.startswith("http"):
+            return await self._get_remote(source)
+        if source.startswith("/"):
+            return await self._get_local(source)
+        raise SourceImageError("不支持的图片URL格式")
+
+    async def _get_local(self, url_path: str) -> str:
+        local_file = (self.public_root / url_path.lstrip("/")).resolve()
+        # 只允许读取 public 目录下的文件
+        if self.public_root not in local_file.parents:
+            raise SourceImageError(f"非法的本地路径: {url_path}")
+
+        try:
+            stat = await asyncio.to_thread(os.stat, local_file)
+        except FileNotFoundError:
+            raise SourceImageError(f"本地文件不存在: {url_path}")
+
+        key = str(local_file)
+        validator = (stat.st_mtime_ns, stat.st_size)
+        entry = self._lookup(key)
+        if entry is not None and entry.validator == validator:
+            self._hits += 1
+            return entry.base64_data
+
+        self._misses += 1
+        base64_data = await asyncio.to_thread(lambda: _encode(local_file.read_bytes()))
+        self._store(key, _SourceEntry(base64_data, validator, time.time()))
+        return base64_data
+
+    async def _get_remote(self, url: str) -> str:
+        import httpx
+
+        now = time.time()
+        entry = self._lookup(url)
+        if entry is not None and now - entry.checked_at < self.fresh_ttl:
+            self._hits += 1
+            return entry.base64_data
+
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        try:
+            resp = await get_http_client().get(url, headers=headers)
+            if resp.status_code == 304 and entry is not None:
+                entry.checked_at = now
+                self._revalidated += 1
+                return entry.base64_data
+            resp.raise_for_status()
+        except httpx.HTTPError as e:
+            raise SourceImageError(f"无法下载原图: {e}") from e
+
+        self._misses += 1
+        base64_data = await asyncio.to_thread(_encode, resp.content)
+        etag = resp.headers.get("etag")
+        last_modified = resp.headers.get("last-modified")
+        # 服务端不支持条件请求时，过期后只能重新下载
+        self._store(url, _SourceEntry(base64_data, (etag, last_modified), now, etag, last_modified))
+        return base64_data
+
+    def invalidate(self, url: str):
+        """URL对应的对象被重新写入时清除缓存"""
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self._size -= len(entry.base64_data)
+            self._invalidated += 1
+
+    def _lookup(self, key: str) -> Optional[_SourceEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: str, entry: _SourceEntry):
+        size = len(entry.base64_data)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old.base64_data)
+        self._entries[key] = entry
+        self._size += size
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted.base64_data)
+
+    def get_stats(self) -> dict:
+        """获取缓存状态"""
+        lookups = self._hits + self._revalidated + self._misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self._hits,
+            "revalidated": self._revalidated,
+            "misses": self._misses,
+            "invalidated": self._invalidated,
+            "hit_rate": round((self._hits + self._revalidated) / lookups, 3) if lookups else 0.0,
+        }
+
+
+# ============ 工厂函数 ============
+
+_cache_instance: Optional[SourceImageCache] = None
+
+def get_source_image_cache() -> SourceImageCache:
+    """
+    获取原图缓存实例（单例模式）
+    通过环境变量 SOURCE_IMAGE_CACHE_MAX_BYTES / SOURCE_IMAGE_FRESH_TTL 配置
+    """
+    global _cache_instance
+
+    if _cache_instance is not None:
+        return _cache_instance
+
+    _cache_instance = SourceImageCache(
+        public_root=Path(__file__).parent.parent / "public",
+        max_bytes=int(os.getenv('SOURCE_IMAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+        fresh_ttl=float(os.getenv('SOURCE_IMAGE_FRESH_TTL', 300))
+    )
+    return _cache_instance
+
+
+def invalidate_source_image(url: str):
+    """存储写入URL后清除其原图缓存（缓存尚未创建时无需处理）"""
+    if _cache_instance is not None:
+        _cache_instance.invalidate(url)
+
+
+def reset_source_image_cache():
+    """重置原图缓存实例"""
+    global _cache_instance
+    _cache_instance = None
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 后端模块以脚本目录为导入根（uvicorn main:app 在 python-backend 下启动）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,75 @@
+import json
+import logging
+
+import pytest
+
+from app_logging import PollSampleFilter, StructuredFormatter, redact
+
+
+def test_redact_summarises_binary_fields():
+    resp = {"data": {"binary_data_base64": ["a" * 5000, "b" * 3000], "status": "done"}}
+    assert redact(resp) == {"data": {"binary_data_base64": "<2 items, 8000 chars base64>", "status": "done"}}
+    assert redact({"binary_data_base64": "x" * 10}) == {"binary_data_base64": "<10 chars base64>"}
+
+
+def test_redact_truncates_long_strings():
+    assert redact("x" * 250, max_length=200) == "x" * 200 + "...<+50 chars>"
+    assert redact("short", max_length=200) == "short"
+
+
+def test_redact_caps_lists():
+    redacted = redact(list(range(25)))
+    assert redacted[:20] == list(range(20))
+    assert redacted[20] == "<+5 items>"
+
+
+def test_redact_bytes_and_scalars():
+    assert redact(b"\x00" * 1024) == "<1024 bytes>"
+    assert redact({"ok": True, "n": 3, "f": 1.5, "none": None}) == {"ok": True, "n": 3, "f": 1.5, "none": None}
+    assert redact(ValueError("boom")) == "boom"
+
+
+def test_redact_limits_depth():
+    nested = {}
+    node = nested
+    for _ in range(10):
+        node["child"] = {}
+        node = node["child"]
+    assert "<...>" in json.dumps(redact(nested))
+
+
+def test_redact_does_not_mutate_input():
+    resp = {"binary_data_base64": ["a" * 10]}
+    redact(resp)
+    assert resp == {"binary_data_base64": ["a" * 10]}
+
+
+def make_record(level=logging.INFO, poll=None, fields=None):
+    record = logging.LogRecord("scripttoframe.test", level, __file__, 1, "查询结果", None, None)
+    if poll is not None:
+        record.poll = poll
+    if fields is not None:
+        record.fields = fields
+    return record
+
+
+def test_formatter_redacts_fields():
+    record = make_record(fields={"binary_data_base64": ["a" * 100000]})
+    assert StructuredFormatter("text").format(record) == '查询结果 {"binary_data_base64": "<1 items, 100000 chars base64>"}'
+    entry = json.loads(StructuredFormatter("json").format(record))
+    assert entry["msg"] == "查询结果"
+    assert entry["binary_data_base64"] == "<1 items, 100000 chars base64>"
+
+
+@pytest.mark.parametrize("poll, passed", [
+    (None, True), (1, True), (3, True), (4, False), (9, False), (10, True), (20, True), (21, False),
+])
+def test_poll_sample_filter(poll, passed):
+    assert PollSampleFilter(first=3, every=10).filter(make_record(poll=poll)) is passed
+
+
+def test_poll_sample_filter_keeps_warnings():
+    sampler = PollSampleFilter(first=3, every=10)
+    assert sampler.filter(make_record(logging.WARNING, poll=7))
+    assert not sampler.filter(make_record(poll=7))
+    assert sampler.sampled_out == 1
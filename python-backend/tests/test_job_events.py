@@ -0,0 +1,51 @@
+import asyncio
+
+from job_events import JobEventBus
+
+
+def replay(bus, job_ids=None, last_event_id=None, terminal_lookup=None):
+    """收集订阅时补发的事件（遇到第一次心跳为止）"""
+    async def collect():
+        events = []
+        async for event in bus.subscribe(job_ids, last_event_id, keepalive=0.01,
+                                         terminal_lookup=terminal_lookup):
+            if event is None:
+                return events
+            events.append(event)
+    return asyncio.run(collect())
+
+
+def test_polling_events_do_not_evict_terminal_events():
+    bus = JobEventBus(history_size=10)
+    bus.publish("submitted", "job_a", "image", taskId="t1")
+    bus.publish("stored", "job_a", "image", data={"imageUrl": "/generated/pages/page_1.png"})
+    for poll in range(100):
+        bus.publish("polling", "job_b", "image", taskId="t2", poll=poll)
+
+    events = replay(bus, {"job_a", "job_b"})
+    assert [event["type"] for event in events] == ["submitted", "stored"]
+
+
+def test_terminal_state_loaded_when_evicted_from_history():
+    bus = JobEventBus(history_size=2)
+    bus.publish("failed", "job_a", "image", error="审核未通过")
+    bus.publish("queued", "job_b", "image")
+    bus.publish("queued", "job_c", "image")
+
+    def lookup(job_id):
+        if job_id == "job_a":
+            return {"type": "failed", "jobId": "job_a", "kind": "image", "timestamp": 0, "error": "审核未通过"}
+        return None
+
+    events = replay(bus, {"job_a", "job_b"}, terminal_lookup=lookup)
+    assert [(event["type"], event["jobId"]) for event in events] == [("queued", "job_b"), ("failed", "job_a")]
+    assert events[-1]["snapshot"] is True
+
+
+def test_no_snapshot_when_terminal_event_still_in_history():
+    bus = JobEventBus()
+    bus.publish("stored", "job_a", "image", data={})
+    calls = []
+    events = replay(bus, {"job_a"}, last_event_id=bus._last_id, terminal_lookup=calls.append)
+    assert events == []
+    assert calls == []
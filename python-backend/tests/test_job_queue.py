@@ -0,0 +1,65 @@
+import asyncio
+import threading
+
+import pytest
+
+from job_queue import JobManager, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), retention=60)
+    yield store
+    store.close()
+
+
+def test_finished_filters_use_bound_statuses(store):
+    running = store.create("image", {})
+    succeeded = store.create("image", {})
+    failed = store.create("image", {})
+    store.update(succeeded, status="succeeded", result={"imageUrl": "/a.png"})
+    store.update(failed, status="failed", error="boom")
+
+    assert [job["job_id"] for job in store.list_unfinished()] == [running]
+
+    # 超过保留期的已结束任务在下次创建时清理，未结束的保留
+    with store._lock:
+        store._conn.execute("UPDATE jobs SET updated_at = 0")
+        store._conn.commit()
+    store.create("image", {})
+    assert store.get(succeeded) is None
+    assert store.get(failed) is None
+    assert store.get(running) is not None
+
+
+def test_store_calls_run_off_the_event_loop(store):
+    manager = JobManager(store)
+    loop_thread = threading.get_ident()
+    store_threads = set()
+    update = store.update
+
+    def recording_update(*args, **kwargs):
+        store_threads.add(threading.get_ident())
+        return update(*args, **kwargs)
+
+    store.update = recording_update
+
+    async def runner(request, context):
+        await context.mark_submitted("task-1", "t2i")
+        await context.mark_upstream_done()
+        return {"imageUrl": request["url"]}
+
+    manager.register("image", runner)
+
+    async def run():
+        job_id = await manager.submit("image", {"url": "/a.png"})
+        while manager.running:
+            await asyncio.sleep(0.01)
+        return job_id, await manager.get(job_id), await manager.terminal_events({job_id, "job_missing"})
+
+    job_id, job, terminal = asyncio.run(run())
+    assert job["status"] == "succeeded"
+    assert job["task_id"] == "task-1"
+    assert terminal == {job_id: manager.terminal_event(job_id)}
+    assert terminal[job_id]["type"] == "stored"
+    assert store_threads and loop_thread not in store_threads
@@ -0,0 +1,183 @@
+import asyncio
+import math
+import time
+
+import pytest
+
+from poll_scheduler import MIN_HISTORY_SAMPLES, PollScheduler, _PollEntry
+
+# 原固定轮询间隔
+BASELINE_INTERVAL = 2.0
+
+
+def make_entry(submitted_at: float = 0.0) -> _PollEntry:
+    return _PollEntry(
+        task_id="task",
+        category="t2i",
+        query=None,
+        handler=None,
+        future=None,
+        submitted_at=submitted_at,
+        deadline=submitted_at + 300,
+        next_poll_at=submitted_at,
+    )
+
+
+def make_scheduler(samples, **kwargs) -> PollScheduler:
+    scheduler = PollScheduler(**kwargs)
+    for duration in samples:
+        scheduler._record_completion("t2i", duration)
+    return scheduler
+
+
+def count_polls(scheduler: PollScheduler, finish_at: float) -> int:
+    """模拟调度器对一个在 finish_at 秒完成的任务的查询次数"""
+    entry = make_entry()
+    now = scheduler._next_delay(entry, 0.0)
+    polls = 1
+    while now < finish_at:
+        now += scheduler._next_delay(entry, now)
+        polls += 1
+    return polls
+
+
+UNIFORM_10_60 = [10 + 50 * i / 199 for i in range(200)]
+
+
+def detection_lag(scheduler: PollScheduler, finish_at: float) -> float:
+    """模拟调度器发现一个在 finish_at 秒完成的任务的延迟"""
+    entry = make_entry()
+    now = scheduler._next_delay(entry, 0.0)
+    while now < finish_at:
+        now += scheduler._next_delay(entry, now)
+    return now - finish_at
+
+
+# 大部分任务在8~14秒完成
+CONCENTRATED = [8 + 6 * i / 199 for i in range(200)]
+
+
+@pytest.mark.parametrize("finish_at", [9, 10.5, 12, 13.5])
+def test_window_polls_faster_than_fixed_loop(finish_at):
+    scheduler = make_scheduler(CONCENTRATED)
+    entry = make_entry()
+    assert scheduler._next_delay(entry, finish_at) < BASELINE_INTERVAL
+    # 原固定轮询平均在完成后1秒才发现，最坏2秒
+    assert detection_lag(scheduler, finish_at) < BASELINE_INTERVAL / 2
+
+
+@pytest.mark.parametrize("finish_at", [20, 35, 50, 58])
+def test_uniform_history_polls_no_more_than_fixed_loop(finish_at):
+    scheduler = make_scheduler(UNIFORM_10_60)
+    assert count_polls(scheduler, finish_at) <= math.ceil(finish_at / BASELINE_INTERVAL)
+
+
+def test_delay_never_below_min_interval():
+    # 所有历史任务集中在同一时间完成时，按概率步进的间隔为0，需被下限截住
+    scheduler = make_scheduler([30.0] * 50)
+    entry = make_entry()
+    for now in [0.0, 10.0, 29.0, 30.0, 31.0, 100.0]:
+        delay = scheduler._next_delay(entry, now)
+        assert scheduler.min_interval <= delay <= scheduler.max_interval
+
+
+def test_window_steps_follow_completion_density():
+    # 一半任务集中在20~21秒完成，其余分散在21~121秒：密集处间隔应小于稀疏处
+    samples = [20 + i * 0.01 for i in range(100)] + [21 + i for i in range(100)]
+    scheduler = make_scheduler(samples, min_interval=0.1, max_interval=30)
+    dense = scheduler._next_delay(make_entry(), 20.5)
+    sparse = scheduler._next_delay(make_entry(), 50.0)
+    assert dense < sparse
+
+
+def test_jumps_to_p10_before_window():
+    scheduler = make_scheduler(UNIFORM_10_60, max_interval=30)
+    p10, _ = scheduler._quantiles("t2i")
+    assert scheduler._next_delay(make_entry(), 0.0) == pytest.approx(p10)
+
+
+def test_backoff_without_history():
+    scheduler = make_scheduler([10.0] * (MIN_HISTORY_SAMPLES - 1))
+    entry = make_entry()
+    delays = [scheduler._next_delay(entry, 0.0) for _ in range(6)]
+    assert delays[0] == scheduler.initial_interval
+    assert delays == sorted(delays)
+    assert delays[-1] == scheduler.max_interval
+
+
+def run_waiters(scheduler, waiters):
+    async def run():
+        tasks = [asyncio.create_task(waiter(scheduler)) for waiter in waiters]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+    try:
+        return asyncio.run(run())
+    finally:
+        scheduler.shutdown()
+
+
+def test_cancelled_waiter_does_not_cancel_others():
+    scheduler = PollScheduler(min_interval=0.01, initial_interval=0.01, max_interval=0.01, max_qps=0)
+    polls = []
+
+    async def query():
+        polls.append(time.time())
+        return {"done": len(polls) >= 5}
+
+    def handler(resp, poll):
+        return "ok" if resp["done"] else None
+
+    async def leaving(scheduler):
+        waiter = asyncio.ensure_future(scheduler.wait_for("task", "t2i", query, handler))
+        await asyncio.sleep(0.02)
+        waiter.cancel()
+        return await waiter
+
+    async def staying(scheduler):
+        await asyncio.sleep(0.005)
+        return await scheduler.wait_for("task", "t2i", query, handler)
+
+    leaving_result, staying_result = run_waiters(scheduler, [leaving, staying])
+    assert isinstance(leaving_result, asyncio.CancelledError)
+    assert staying_result == "ok"
+    assert len(polls) == 5
+    assert scheduler.get_stats()["outstanding"] == 0
+
+
+def test_last_waiter_leaving_stops_polling():
+    scheduler = PollScheduler(min_interval=0.01, initial_interval=0.01, max_interval=0.01, max_qps=0)
+    polls = []
+
+    async def query():
+        polls.append(time.time())
+        return {}
+
+    async def leaving(scheduler):
+        waiter = asyncio.ensure_future(scheduler.wait_for("task", "t2i", query, lambda resp, poll: None))
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        await asyncio.sleep(0.05)
+        return len(polls)
+
+    polls_at_cancel, = run_waiters(scheduler, [leaving])
+    assert polls_at_cancel == len(polls)
+    assert scheduler.get_stats()["outstanding"] == 0
+
+
+def test_poll_budget_limits_total_query_rate():
+    scheduler = PollScheduler(min_interval=0.01, initial_interval=0.01, max_interval=0.01, max_qps=50)
+    polls = []
+
+    async def query():
+        polls.append(time.time())
+        return {}
+
+    def waiter(index):
+        async def run(scheduler):
+            return await scheduler.wait_for(f"task-{index}", "t2i", query, lambda resp, poll: "ok")
+        return run
+
+    start = time.time()
+    results = run_waiters(scheduler, [waiter(i) for i in range(75)])
+    assert results == ["ok"] * 75
+    # 桶容量50，其余25次按50 QPS顺延
+    assert time.time() - start >= 0.45
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from result_cache import ResultCache, make_cache_key
+
+FORM = {"req_key": "jimeng_t2i_v40", "prompt": "雨夜街道", "width": 1664, "height": 936}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResultCache(str(tmp_path / "result_cache.db"), ttl=3600, max_entries=3)
+    yield cache
+    cache.close()
+
+
+def test_key_normalizes_prompt_and_key_order():
+    reordered = dict(reversed(list(FORM.items())))
+    reordered["prompt"] = "  雨夜街道\n"
+    assert make_cache_key(reordered, "pages", "page_1") == make_cache_key(FORM, "pages", "page_1")
+
+
+def test_key_includes_storage_target():
+    page_1 = make_cache_key(FORM, "pages", "page_1")
+    assert make_cache_key(FORM, "pages", "page_2") != page_1
+    assert make_cache_key(FORM, "characters", "page_1") != page_1
+    assert make_cache_key({**FORM, "width": 1024}, "pages", "page_1") != page_1
+
+
+def test_same_prompt_on_another_page_misses(cache):
+    cache.put(make_cache_key(FORM, "pages", "page_1"), "/generated/pages/page_1.png",
+              "/data/pages/page_1.png", "TOSStorageProvider")
+    assert cache.get(make_cache_key(FORM, "pages", "page_2")) is None
+    assert cache.get(make_cache_key(FORM, "pages", "page_1"))["image_url"] == "/generated/pages/page_1.png"
+
+
+def test_put_replaces_entries_for_overwritten_path(cache):
+    old_key = make_cache_key(FORM, "pages", "page_1")
+    new_key = make_cache_key({**FORM, "prompt": "晴天街道"}, "pages", "page_1")
+    cache.put(old_key, "/generated/pages/page_1.png", "/data/pages/page_1.png", "TOSStorageProvider")
+    cache.put(new_key, "/generated/pages/page_1.png", "/data/pages/page_1.png", "TOSStorageProvider")
+    assert cache.get(old_key) is None
+    assert cache.get(new_key) is not None
+
+
+def test_invalidate_path(cache):
+    key = make_cache_key(FORM, "pages", "page_1")
+    cache.put(key, "/generated/pages/page_1.png", "/data/pages/page_1.png", "TOSStorageProvider")
+    cache.invalidate_path("/data/pages/page_1.png")
+    assert cache.get(key) is None
+
+
+def test_missing_local_file_misses(cache, tmp_path):
+    image = tmp_path / "page_1.png"
+    image.write_bytes(b"png")
+    key = make_cache_key(FORM, "pages", "page_1")
+    cache.put(key, "/generated/pages/page_1.png", str(image), "LocalStorageProvider")
+    assert cache.get(key) is not None
+    image.unlink()
+    assert cache.get(key) is None
+
+
+def test_expired_entry_misses(cache):
+    key = make_cache_key(FORM, "pages", "page_1")
+    cache.put(key, "/generated/pages/page_1.png", None, "TOSStorageProvider")
+    cache.ttl = 0
+    time.sleep(0.01)
+    assert cache.get(key) is None
+
+
+def test_lru_eviction(cache):
+    keys = [make_cache_key(FORM, "pages", f"page_{i}") for i in range(4)]
+    for index, key in enumerate(keys[:3]):
+        cache.put(key, f"/generated/pages/page_{index}.png", None, "TOSStorageProvider")
+        time.sleep(0.01)
+    cache.get(keys[0])
+    cache.put(keys[3], "/generated/pages/page_3.png", None, "TOSStorageProvider")
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
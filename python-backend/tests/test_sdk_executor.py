@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from sdk_executor import SDKCallTimeoutError, SDKExecutor
+
+
+class BlockingCall:
+    """记录同时在线程中执行的调用数"""
+
+    def __init__(self, duration):
+        self.duration = duration
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.calls = 0
+
+    def __call__(self):
+        with self.lock:
+            self.active += 1
+            self.calls += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.duration)
+        with self.lock:
+            self.active -= 1
+        return "ok"
+
+
+@pytest.fixture
+def executor():
+    executor = SDKExecutor(max_workers=1, max_queue=0, call_timeout=0.05)
+    yield executor
+    executor.shutdown()
+
+
+def test_timed_out_call_keeps_its_slot_until_it_finishes(executor):
+    call = BlockingCall(0.2)
+
+    async def run():
+        with pytest.raises(SDKCallTimeoutError):
+            await executor.run(call)
+        assert executor.get_stats()["abandoned"] == 1
+        # 超时的调用仍在执行：下一个调用要等它结束才能进入线程池
+        second = asyncio.ensure_future(executor.run(call, timeout=1))
+        await asyncio.sleep(0.05)
+        assert executor.get_stats()["waiting"] == 1
+        return await second
+
+    assert asyncio.run(run()) == "ok"
+    assert call.calls == 2
+    assert call.max_active == 1
+    stats = executor.get_stats()
+    assert stats["abandoned"] == 0
+    assert stats["timeouts"] == 1
+    assert stats["completed"] == 1
+
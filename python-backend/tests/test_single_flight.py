@@ -0,0 +1,24 @@
+import asyncio
+
+from metrics import SINGLE_FLIGHT_REQUESTS
+from single_flight import SingleFlight
+
+
+def test_coalesced_calls_are_counted_in_metrics():
+    flight = SingleFlight("test-image")
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def run():
+        return await asyncio.gather(*[flight.do("key", work) for _ in range(3)])
+
+    assert asyncio.run(run()) == ["ok"] * 3
+    assert len(calls) == 1
+    lines = SINGLE_FLIGHT_REQUESTS.render()
+    assert 'single_flight_requests_total{name="test-image",role="leader"} 1' in lines
+    assert 'single_flight_requests_total{name="test-image",role="coalesced"} 2' in lines
+    assert "# TYPE single_flight_requests_total counter" in lines
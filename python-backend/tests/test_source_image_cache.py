@@ -0,0 +1,66 @@
+import asyncio
+import base64
+
+import httpx
+import pytest
+
+import source_image_cache
+from source_image_cache import SourceImageCache
+
+URL = "https://bucket.tos-cn-beijing.volces.com/pages/page_1.png"
+
+
+class FakeHttpClient:
+    def __init__(self):
+        self.body = b"v1"
+        self.requests = 0
+
+    async def get(self, url, headers=None):
+        self.requests += 1
+        return httpx.Response(200, content=self.body, headers={"etag": f'"{self.body.decode()}"'},
+                              request=httpx.Request("GET", url))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = FakeHttpClient()
+    monkeypatch.setattr(source_image_cache, "get_http_client", lambda: fake)
+    monkeypatch.setattr(source_image_cache, "get_image_preprocessor", lambda: None)
+    return fake
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = SourceImageCache(tmp_path, fresh_ttl=300)
+    monkeypatch.setattr(source_image_cache, "_cache_instance", cache)
+    return cache
+
+
+def fetch(cache, url=URL):
+    return base64.b64decode(asyncio.run(cache.get_base64(url)))
+
+
+def test_fresh_remote_entry_served_from_cache(cache, client):
+    assert fetch(cache) == b"v1"
+    client.body = b"v2"
+    assert fetch(cache) == b"v1"
+    assert client.requests == 1
+
+
+def test_rewritten_url_is_refetched_after_invalidation(cache, client):
+    assert fetch(cache) == b"v1"
+    client.body = b"v2"
+    source_image_cache.invalidate_source_image(URL)
+    assert fetch(cache) == b"v2"
+    stats = cache.get_stats()
+    assert stats["invalidated"] == 1
+    assert stats["bytes"] == len(base64.b64encode(b"v2"))
+
+
+def test_local_file_revalidated_by_mtime_and_size(cache, tmp_path):
+    image = tmp_path / "generated" / "pages" / "page_1.png"
+    image.parent.mkdir(parents=True)
+    image.write_bytes(b"v1")
+    assert fetch(cache, "/generated/pages/page_1.png") == b"v1"
+    image.write_bytes(b"v22")
+    assert fetch(cache, "/generated/pages/page_1.png") == b"v22"
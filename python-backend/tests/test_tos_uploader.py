@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+import types
+
+import pytest
+import requests
+
+from tos_uploader import MIN_PART_SIZE, TOSUploader, is_retryable_error
+
+
+class FakeTosClientError(Exception):
+    """与 TosClientError 相同：底层异常放在 cause 中，没有状态码"""
+
+    def __init__(self, message, cause=None):
+        super().__init__(message)
+        self.message = message
+        self.cause = cause
+
+
+class FakeTosServerError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"http status {status_code}")
+        self.status_code = status_code
+
+
+@pytest.mark.parametrize("status_code, expected", [
+    (500, True), (503, True), (429, True),
+    (400, False), (403, False), (404, False),
+])
+def test_server_errors_by_status(status_code, expected):
+    assert is_retryable_error(FakeTosServerError(status_code)) is expected
+
+
+@pytest.mark.parametrize("cause", [
+    requests.exceptions.ConnectionError("Connection reset by peer"),
+    requests.exceptions.ReadTimeout("Read timed out"),
+    ConnectionResetError(104, "Connection reset by peer"),
+    TimeoutError("timed out"),
+])
+def test_network_client_errors_are_retryable(cause):
+    assert is_retryable_error(FakeTosClientError("http request failed", cause))
+
+
+def test_chained_network_error_is_retryable():
+    try:
+        try:
+            raise requests.exceptions.ConnectTimeout("connect timeout")
+        except requests.exceptions.ConnectTimeout as e:
+            raise RuntimeError("upload failed") from e
+    except RuntimeError as e:
+        assert is_retryable_error(e)
+
+
+@pytest.mark.parametrize("error", [
+    FakeTosClientError("invalid bucket name"),
+    FakeTosClientError("invalid credentials", ValueError("bad ak")),
+    TypeError("put_object() got an unexpected keyword argument"),
+    KeyError("TOS_BUCKET"),
+    FileNotFoundError("missing.png"),
+])
+def test_programming_auth_and_config_errors_are_not_retried(error):
+    assert not is_retryable_error(error)
+
+
+class FakeUploadClient:
+    """upload_part 在线程中阻塞一段时间，记录同时上传中的分片数"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.parts = {}
+
+    def create_multipart_upload(self, bucket, key, content_type=None):
+        return types.SimpleNamespace(upload_id="upload")
+
+    def upload_part(self, bucket, key, upload_id, part_number, content):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+            self.parts[part_number] = len(content)
+        return part_number
+
+    def complete_multipart_upload(self, bucket, key, upload_id, parts):
+        self.completed = parts
+
+    def abort_multipart_upload(self, bucket, key, upload_id):
+        self.aborted = True
+
+
+def test_upload_stream_bounds_parts_in_flight():
+    client = FakeUploadClient()
+    uploader = TOSUploader(client, "bucket", max_workers=2, multipart_threshold=MIN_PART_SIZE,
+                           part_size=MIN_PART_SIZE)
+    # 已切出但未上传完的分片（包括在线程池中排队的）
+    pending = {"now": 0, "max": 0}
+    call = uploader._call
+
+    async def counting_call(func, **kwargs):
+        if func != client.upload_part:
+            return await call(func, **kwargs)
+        pending["now"] += 1
+        pending["max"] = max(pending["max"], pending["now"])
+        try:
+            return await call(func, **kwargs)
+        finally:
+            pending["now"] -= 1
+
+    uploader._call = counting_call
+
+    async def chunks():
+        # 接收快于上传
+        for _ in range(12):
+            yield b"x" * (MIN_PART_SIZE // 2)
+
+    size = asyncio.run(uploader.upload_stream("key", chunks()))
+    assert size == 6 * MIN_PART_SIZE
+    assert pending["max"] == 2
+    assert client.max_active <= 2
+    assert client.completed == [1, 2, 3, 4, 5, 6]
+    assert sum(client.parts.values()) == size
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import types
+
+import pytest
+
+from audio_service import WebSocketTTSProvider
+
+OPEN = types.SimpleNamespace(name="OPEN")
+CLOSED = types.SimpleNamespace(name="CLOSED")
+
+
+class FakeWebSocket:
+    """按会话应答的TTS连接；hang 时初始化之后不再回复（半关闭）"""
+
+    def __init__(self, hang_after_sessions=None):
+        self.state = OPEN
+        self.sessions = 0
+        self.hang_after_sessions = hang_after_sessions
+        self._replies = asyncio.Queue()
+
+    async def send(self, message):
+        data = json.loads(message)
+        if data["type"] == "init_session":
+            self.sessions += 1
+            self._replies.put_nowait(json.dumps({"message": "ok"}))
+        elif data["type"] == "end":
+            if self.hang_after_sessions is not None and self.sessions > self.hang_after_sessions:
+                return
+            self._replies.put_nowait(b"\x00\x01" * 4)
+            self._replies.put_nowait(json.dumps({"type": "end_response"}))
+
+    async def recv(self):
+        return await self._replies.get()
+
+    async def close(self):
+        self.state = CLOSED
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    monkeypatch.setenv("TTS_WS_RECV_TIMEOUT", "0.05")
+    return WebSocketTTSProvider()
+
+
+def use_connections(provider, sockets):
+    pool = provider.connection_pool
+    remaining = list(sockets)
+
+    async def connect():
+        pool._connects += 1
+        return remaining.pop(0)
+
+    pool._connect = connect
+
+
+def test_reused_connection_timeout_retries_once_on_fresh_connection(provider):
+    stale = FakeWebSocket(hang_after_sessions=1)
+    fresh = FakeWebSocket()
+    use_connections(provider, [stale, fresh])
+
+    async def run():
+        first = await provider.synthesize("你好")
+        second = await provider.synthesize("你好")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second == b"\x00\x01" * 4
+    # 超时的连接被关闭而不是归还，重试使用新连接
+    assert stale.state is CLOSED
+    assert stale.sessions == 2
+    assert fresh.sessions == 1
+    stats = provider.connection_pool.get_stats()
+    assert stats["connects"] == 2
+    assert stats["reuses"] == 1
+    assert stats["idle"] == 1
+
+
+def test_fresh_connection_timeout_is_not_retried(provider):
+    stale = FakeWebSocket(hang_after_sessions=1)
+    hanging = FakeWebSocket(hang_after_sessions=0)
+    spare = FakeWebSocket()
+    use_connections(provider, [stale, hanging, spare])
+
+    async def run():
+        await provider.synthesize("你好")
+        await provider.synthesize("你好")
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run())
+    assert stale.state is CLOSED
+    assert hanging.state is CLOSED
+    assert provider.connection_pool.get_stats()["connects"] == 2
+    assert provider.connection_pool.get_stats()["idle"] == 0
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+import upstream_retry
+from upstream_retry import RetryPolicy, classify_exception, classify_response, is_retryable
+
+
+@pytest.mark.parametrize("message, category", [
+    ('{"code": 50429, "message": "Request Has Reached API Limit"}', "throttle"),
+    ('{"code": 50430, "message": "Request Has Reached API Concurrent Limit"}', "throttle"),
+    ('{"code": 50500, "message": "Internal Error"}', "server"),
+    ('{"status": 50511, "message": "Post Img Risk Not Pass"}', "server"),
+    ('{"code": 50413, "message": "Post Text Risk Not Pass"}', "business"),
+    ("InternalError: service busy", "server"),
+    ("HTTPSConnectionPool: Max retries exceeded (Caused by NewConnectionError('Failed to establish'))",
+     "network"),
+    ("HTTPSConnectionPool: Read timed out. (read timeout=60)", "network"),
+    ("invalid req_key", "business"),
+])
+def test_classify_exception_message(message, category):
+    assert classify_exception(Exception(message)) == category
+
+
+def test_classify_builtin_network_errors():
+    assert classify_exception(ConnectionResetError()) == "network"
+    assert classify_exception(TimeoutError()) == "network"
+
+
+@pytest.mark.parametrize("resp, category", [
+    ({"code": 10000, "data": {}}, None),
+    ({"code": 50429}, "throttle"),
+    ({"code": 50501}, "server"),
+    ({"code": 50411}, "business"),
+    ({"code": "50429"}, "throttle"),
+    ({"code": "10000"}, None),
+    ({"code": None, "message": "unknown"}, "business"),
+    ({"code": "InternalError"}, "business"),
+    ({"code": [50500]}, "business"),
+    ({"ResponseMetadata": {"Error": {"Code": "InternalError"}}}, "server"),
+    ({"ResponseMetadata": {"Error": {"Code": "FlowLimitExceeded"}}}, "throttle"),
+    ({"ResponseMetadata": {"Error": {"Code": "InvalidParameter"}}}, "business"),
+])
+def test_classify_response(resp, category):
+    assert classify_response(resp) == category
+
+
+CONNECT_ERROR = Exception("Max retries exceeded (Caused by NewConnectionError('Failed to establish a new connection'))")
+READ_TIMEOUT = Exception("Read timed out. (read timeout=60)")
+
+
+@pytest.mark.parametrize("category, error, idempotent, expected", [
+    ("throttle", None, False, True),
+    ("throttle", None, True, True),
+    ("server", None, True, True),
+    ("server", Exception("50500"), False, False),
+    ("network", READ_TIMEOUT, True, True),
+    ("network", READ_TIMEOUT, False, False),
+    ("network", CONNECT_ERROR, False, True),
+    ("network", ConnectionRefusedError(), False, True),
+    ("business", None, True, False),
+])
+def test_is_retryable(category, error, idempotent, expected):
+    assert is_retryable(category, error, idempotent) is expected
+
+
+def run_policy(responses, idempotent):
+    """依次返回/抛出 responses 中的结果，返回 (最终结果或异常, 调用次数)"""
+    calls = []
+
+    async def fn():
+        item = responses[len(calls)]
+        calls.append(item)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    policy = RetryPolicy(max_attempts=4, base_delay=0, max_delay=0)
+    try:
+        result = asyncio.run(policy.run("submit", fn, idempotent=idempotent))
+    except Exception as e:
+        result = e
+    return result, len(calls)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    async def sleep(delay):
+        return None
+    monkeypatch.setattr(upstream_retry.asyncio, "sleep", sleep)
+
+
+def test_non_idempotent_submit_not_retried_on_server_error():
+    resp, calls = run_policy([{"code": 50500}, {"code": 10000}], idempotent=False)
+    assert resp == {"code": 50500}
+    assert calls == 1
+
+
+def test_non_idempotent_submit_retried_on_throttle():
+    resp, calls = run_policy([{"code": 50429}, {"code": 10000}], idempotent=False)
+    assert resp == {"code": 10000}
+    assert calls == 2
+
+
+def test_non_idempotent_submit_retried_only_on_connect_error():
+    result, calls = run_policy([CONNECT_ERROR, {"code": 10000}], idempotent=False)
+    assert result == {"code": 10000} and calls == 2
+    result, calls = run_policy([READ_TIMEOUT, {"code": 10000}], idempotent=False)
+    assert result is READ_TIMEOUT and calls == 1
+
+
+def test_idempotent_query_retried_until_attempts_exhausted():
+    resp, calls = run_policy([{"code": 50500}] * 4, idempotent=True)
+    assert resp == {"code": 50500}
+    assert calls == 4
@@ -0,0 +1,286 @@
+"""
+TOS异步上传模块
+TOS SDK（TosClientV2）只提供同步接口，直接在 async 方法中调用会在整个上传过程中阻塞事件循环。
+本模块把上传放到独立线程池中执行，并提供：
+- 连接复用：所有上传共享一个客户端（内部为 requests 连接池）
+- 分片上传：超过 TOS_MULTIPART_THRESHOLD 的对象按 TOS_PART_SIZE 切片并行上传；
+  流式上传时单个对象同时上传中的分片不超过上传线程数，分片上传跟不上接收速度时暂停接收（背压）
+- 失败重试：网络/超时错误、5xx、429 按指数退避（带随机抖动）重试，
+  其余错误（参数、鉴权、配置错误以及代码异常）直接抛出
+- 有界上传队列：同时排队/上传的对象数超过 TOS_UPLOAD_QUEUE_SIZE 时，新的上传等待空位（背压）
+
+通过环境变量配置：
+- TOS_UPLOAD_WORKERS: 上传线程数（默认8）
+- TOS_UPLOAD_QUEUE_SIZE: 上传队列容量（默认32）
+- TOS_MULTIPART_THRESHOLD: 分片上传阈值字节数（默认8MB）
+- TOS_PART_SIZE: 分片大小字节数（默认5MB，TOS要求除最后一片外不小于5MB）
+- TOS_UPLOAD_MAX_RETRIES: 单次请求最大重试次数（默认3）
+"""
+
+import os
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Optional
+
+from app_logging import get_logger
+
+logger = get_logger("tos_uploader")
+
+# 重试退避的基础等待秒数和上限
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
+# TOS要求的最小分片大小（最后一片除外）
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def _network_error_types() -> tuple:
+    types = [ConnectionError, TimeoutError]
+    try:
+        import requests
+        types += [requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                  requests.exceptions.ChunkedEncodingError]
+    except ImportError:
+        pass
+    try:
+        import urllib3
+        types += [urllib3.exceptions.ProtocolError, urllib3.exceptions.TimeoutError]
+    except ImportError:
+        pass
+    return tuple(types)
+
+
+NETWORK_ERROR_TYPES = _network_error_types()
+
+
+def is_network_error(error: Optional[BaseException]) -> bool:
+    """网络或超时错误；TosClientError 把底层异常放在 cause 中，沿异常链查找"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, NETWORK_ERROR_TYPES):
+            return True
+        error = getattr(error, "cause", None) or error.__cause__ or error.__context__
+    return False
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """HTTP状态码为 5xx / 429，或网络、超时错误可重试"""
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code >= 500 or status_code == 429
+    return is_network_error(error)
+
+
+class TOSUploader:
+    """基于线程池的TOS异步上传器"""
+
+    def __init__(self, client, bucket: str, max_workers: int = 8, max_queue: int = 32,
+                 multipart_threshold: int = 8 * 1024 * 1024, part_size: int = MIN_PART_SIZE,
+                 max_retries: int = 3):
+        self.client = client
+        self.bucket = bucket
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.multipart_threshold = multipart_threshold
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.max_retries = max_retries
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tos-upload")
+        self._queue_slots: Optional[asyncio.Semaphore] = None
+
+        # 统计数据
+        self._queued = 0
+        self._active = 0
+        self._uploaded = 0
+        self._multipart = 0
+        self._failed = 0
+        self._retries = 0
+        self._bytes = 0
+        self._total_time = 0.0
+
+        print(f"☁️ [TOSUploader] 初始化，上传线程: {max_workers}，队列容量: {max_queue}，"
+              f"分片阈值: {multipart_threshold // 1024 // 1024}MB")
+
+    @asynccontextmanager
+    async def _slot(self):
+        """占用一个上传队列位置，队列已满时等待空位"""
+        if self._queue_slots is None:
+            self._queue_slots = asyncio.Semaphore(self.max_queue)
+
+        self._queued += 1
+        try:
+            await self._queue_slots.acquire()
+        finally:
+            self._queued -= 1
+
+        self._active += 1
+        start_time = time.time()
+        try:
+            yield
+        except BaseException:
+            self._failed += 1
+            raise
+        finally:
+            self._active -= 1
+            self._queue_slots.release()
+
+        self._uploaded += 1
+        self._total_time += time.time() - start_time
+
+    async def upload(self, key: str, data: bytes, content_type: Optional[str] = None):
+        """上传对象"""
+        async with self._slot():
+            if len(data) > self.multipart_threshold:
+                await self._multipart_upload(key, data, content_type)
+                self._multipart += 1
+            else:
+                await self._call(self.client.put_object, bucket=self.bucket, key=key,
+                                 content=data, content_type=content_type)
+            self._bytes += len(data)
+
+    async def upload_stream(self, key: str, chunks: AsyncIterator[bytes],
+                            content_type: Optional[str] = None) -> int:
+        """
+        流式上传对象，不缓冲完整内容
+        不超过分片阈值的对象接收完后整体上传；更大的对象边接收边按分片并行上传，
+        同时上传中的分片数达到 max_workers 时先等待空位再切下一片，内存中最多保留 max_workers 个分片
+
+        Returns:
+            int: 上传的字节数
+        """
+        async with self._slot():
+            buffer = bytearray()
+            size = 0
+            upload_id = None
+            part_tasks = []
+            part_slots = asyncio.Semaphore(self.max_workers)
+
+            async def submit_part(end: int):
+                # 等到有分片上传完成后再切片，避免接收快于上传时分片堆积在内存中
+                await part_slots.acquire()
+                for task in part_tasks:
+                    if task.done() and not task.cancelled() and task.exception() is not None:
+                        part_slots.release()
+                        raise task.exception()
+                content = bytes(buffer[:end])
+                del buffer[:end]
+                task = asyncio.ensure_future(self._call(
+                    self.client.upload_part, bucket=self.bucket, key=key, upload_id=upload_id,
+                    part_number=len(part_tasks) + 1, content=content
+                ))
+                task.add_done_callback(lambda _: part_slots.release())
+                part_tasks.append(task)
+
+            try:
+                async for chunk in chunks:
+                    buffer += chunk
+                    size += len(chunk)
+                    if upload_id is None:
+                        if len(buffer) <= self.multipart_threshold:
+                            continue
+                        created = await self._call(self.client.create_multipart_upload, bucket=self.bucket,
+                                                   key=key, content_type=content_type)
+                        upload_id = created.upload_id
+                    while len(buffer) >= self.part_size:
+                        await submit_part(self.part_size)
+
+                if upload_id is None:
+                    await self._call(self.client.put_object, bucket=self.bucket, key=key,
+                                     content=bytes(buffer), content_type=content_type)
+                else:
+                    if buffer:
+                        await submit_part(len(buffer))
+                    parts = await asyncio.gather(*part_tasks)
+                    await self._call(self.client.complete_multipart_upload, bucket=self.bucket, key=key,
+                                     upload_id=upload_id, parts=parts)
+                    self._multipart += 1
+            except BaseException:
+                for task in part_tasks:
+                    task.cancel()
+                if upload_id is not None:
+                    await self._abort(key, upload_id)
+                raise
+
+            self._bytes += size
+            return size
+
+    async def _multipart_upload(self, key: str, data: bytes, content_type: Optional[str]):
+        """分片并行上传，失败时中止分片任务，避免残留未合并的分片"""
+        created = await self._call(self.client.create_multipart_upload, bucket=self.bucket, key=key,
+                                   content_type=content_type)
+        upload_id = created.upload_id
+
+        view = memoryview(data)
+        offsets = range(0, len(data), self.part_size)
+        try:
+            parts = await asyncio.gather(*[
+                self._call(self.client.upload_part, bucket=self.bucket, key=key, upload_id=upload_id,
+                           part_number=index + 1, content=bytes(view[offset:offset + self.part_size]))
+                for index, offset in enumerate(offsets)
+            ])
+            await self._call(self.client.complete_multipart_upload, bucket=self.bucket, key=key,
+                             upload_id=upload_id, parts=parts)
+        except BaseException:
+            await self._abort(key, upload_id)
+            raise
+
+    async def _abort(self, key: str, upload_id: str):
+        """中止分片上传任务"""
+        try:
+            await self._call(self.client.abort_multipart_upload, bucket=self.bucket, key=key,
+                             upload_id=upload_id)
+        except Exception as e:
+            logger.warning(f"⚠️ [TOSUploader] 中止分片上传失败: {key} ({e})")
+
+    async def _call(self, func: Callable[..., Any], **kwargs) -> Any:
+        """在上传线程池中执行一次SDK调用，可重试的错误按指数退避重试"""
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            try:
+                return await loop.run_in_executor(self._executor, lambda: func(**kwargs))
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                delay = min(RETRY_BASE_DELAY * (2 ** attempt), RETRY_MAX_DELAY)
+                delay *= random.uniform(0.5, 1.0)
+                attempt += 1
+                self._retries += 1
+                logger.warning(f"🔁 [TOSUploader] {func.__name__} 失败，{delay:.2f}s 后第 {attempt} 次重试: {e}")
+                await asyncio.sleep(delay)
+
+    def get_stats(self) -> dict:
+        """获取上传器状态"""
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "queued": self._queued,
+            "active": self._active,
+            "uploaded": self._uploaded,
+            "multipart": self._multipart,
+            "failed": self._failed,
+            "retries": self._retries,
+            "bytes": self._bytes,
+            "avg_upload_time": round(self._total_time / self._uploaded, 3) if self._uploaded else 0.0,
+        }
+
+    def shutdown(self):
+        """关闭上传线程池（等待进行中的上传完成）"""
+        self._executor.shutdown(wait=True)
+
+
+def create_tos_uploader(client, bucket: str) -> TOSUploader:
+    """根据环境变量创建上传器"""
+    return TOSUploader(
+        client,
+        bucket,
+        max_workers=int(os.getenv('TOS_UPLOAD_WORKERS', 8)),
+        max_queue=int(os.getenv('TOS_UPLOAD_QUEUE_SIZE', 32)),
+        multipart_threshold=int(os.getenv('TOS_MULTIPART_THRESHOLD', 8 * 1024 * 1024)),
+        part_size=int(os.getenv('TOS_PART_SIZE', MIN_PART_SIZE)),
+        max_retries=int(os.getenv('TOS_UPLOAD_MAX_RETRIES', 3)),
+    )
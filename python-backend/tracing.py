@@ -0,0 +1,267 @@
+"""
+请求追踪模块
+请求ID原先为 f"api_{int(time.time())}"，同一秒内的请求共用一个ID，并发生成时日志无法区分。本模块提供：
+- new_request_id(prefix): 不重复的请求ID（前缀_秒级时间戳_随机串）
+- 请求ID和当前span通过 contextvars 在协程间传递：存储、TTS等下游模块无需增加参数即可取得请求ID
+- 各阶段的span（提交、每次轮询、下载、解码、写入/上传、TTS合成、编码），
+  字段沿用 OpenTelemetry span 数据模型（traceId / spanId / parentSpanId / startTimeUnixNano / status ...）
+- 本地导出：启用后span在后台线程中以JSON Lines追加写入文件，用于离线分析各阶段耗时
+
+通过环境变量配置：
+- TRACE_EXPORT_ENABLED: 是否导出span（默认false；请求ID与上下文传递始终生效）
+- TRACE_EXPORT_PATH: 导出文件路径（默认 python-backend/data/traces.jsonl）
+- TRACE_EXPORT_MAX_BYTES: 导出文件超过该大小时轮转为 .1（默认100MB）
+- TRACE_QUEUE_SIZE: 待导出span的队列长度，满时丢弃（默认10000）
+"""
+
+import os
+import json
+import queue
+import secrets
+import threading
+import time
+import functools
+import inspect
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Iterator, Optional
+
+SERVICE_NAME = "scripttoframe-backend"
+
+_request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_span_var: ContextVar[Optional["Span"]] = ContextVar("span", default=None)
+
+
+def new_request_id(prefix: str) -> str:
+    """生成不重复的请求ID，如 api_1792197714_3f9a2b1c4d5e"""
+    return f"{prefix}_{int(time.time())}_{uuid.uuid4().hex[:12]}"
+
+
+def get_request_id() -> Optional[str]:
+    """当前协程所属请求的ID"""
+    return _request_id_var.get()
+
+
+def current_span() -> Optional["Span"]:
+    return _span_var.get()
+
+
+def log_tag(name: str) -> str:
+    """日志前缀：在请求中时附带请求ID，如 LocalStorage-api_1792197714_3f9a2b1c4d5e"""
+    request_id = _request_id_var.get()
+    return f"{name}-{request_id}" if request_id else name
+
+
+class Span:
+    """一个阶段的耗时记录（OpenTelemetry span 数据模型的子集）"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "request_id",
+                 "attributes", "start_ns", "end_ns", "status", "status_message")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None,
+                 request_id: Optional[str] = None, attributes: Optional[dict] = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.request_id = request_id or (parent.request_id if parent else None)
+        self.attributes = {key: value for key, value in (attributes or {}).items() if value is not None}
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = "UNSET"
+        self.status_message = None
+
+    def set_attribute(self, key: str, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status = "ERROR"
+        # HTTPException 的信息在 detail 中
+        self.status_message = str(getattr(error, "detail", None) or error)[:500]
+        self.attributes["exception.type"] = type(error).__name__
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        if self.status == "UNSET":
+            self.status = "OK"
+
+    def to_dict(self) -> dict:
+        attributes = dict(self.attributes)
+        if self.request_id:
+            attributes["request.id"] = self.request_id
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "name": self.name,
+            "kind": "INTERNAL",
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            "attributes": attributes,
+            "status": {"code": self.status, "message": self.status_message},
+            "resource": {"service.name": SERVICE_NAME},
+        }
+
+
+@contextmanager
+def start_span(name: str, parent: Optional[Span] = None, request_id: Optional[str] = None,
+               **attributes) -> Iterator[Span]:
+    """
+    开始一个span，退出时结束并导出
+
+    Args:
+        parent: 父span；默认为当前上下文中的span（在其他任务中执行时需显式传入，如轮询调度器）
+        request_id: 请求ID；默认沿用父span的请求ID，指定时在span内绑定为当前请求
+    """
+    if parent is None:
+        parent = _span_var.get()
+        request_id = request_id or _request_id_var.get()
+    span = Span(name, parent, request_id, attributes)
+    span_token = _span_var.set(span)
+    request_token = _request_id_var.set(span.request_id)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _request_id_var.reset(request_token)
+        _span_var.reset(span_token)
+        span.end()
+        exporter = get_span_exporter()
+        if exporter is not None:
+            exporter.export(span)
+
+
+def set_span_attributes(**attributes):
+    """为当前span补充属性（不在span中时忽略）"""
+    span = _span_var.get()
+    if span is not None:
+        for key, value in attributes.items():
+            span.set_attribute(key, value)
+
+
+def traced(name: str):
+    """
+    将异步函数的执行记录为span；函数有 request_id 参数且传入了值时，绑定为当前请求ID
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        has_request_id = "request_id" in signature.parameters
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            request_id = None
+            if has_request_id:
+                request_id = signature.bind_partial(*args, **kwargs).arguments.get("request_id")
+            with start_span(name, request_id=request_id):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class JsonlSpanExporter:
+    """在后台线程中把span以JSON Lines追加写入本地文件"""
+
+    def __init__(self, path: str, max_bytes: int = 100 * 1024 * 1024, queue_size: int = 10000):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._exported = 0
+        self._dropped = 0
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+        print(f"🧭 [SpanExporter] 初始化，路径: {self.path}")
+
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self._dropped += 1
+
+    def _run(self):
+        output = open(self.path, "a", encoding="utf-8")
+        try:
+            stopping = False
+            while not stopping:
+                # 一次取完队列中的span后再刷新，减少写入次数
+                batch = [self._queue.get()]
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if None in batch:
+                    # 收到停止信号：写出信号之前的span后退出
+                    batch = batch[:batch.index(None)]
+                    stopping = True
+                for item in batch:
+                    output.write(json.dumps(item.to_dict(), ensure_ascii=False, default=str) + "\n")
+                output.flush()
+                self._exported += len(batch)
+
+                if self.max_bytes and output.tell() > self.max_bytes:
+                    output.close()
+                    os.replace(self.path, self.path.with_name(self.path.name + ".1"))
+                    output = open(self.path, "a", encoding="utf-8")
+        finally:
+            output.close()
+
+    def get_stats(self) -> dict:
+        """获取导出状态"""
+        return {
+            "path": str(self.path),
+            "exported": self._exported,
+            "queued": self._queue.qsize(),
+            "dropped": self._dropped,
+        }
+
+    def shutdown(self):
+        """写出队列中剩余的span并停止后台线程"""
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        print(f"🧭 [SpanExporter] 已关闭，共导出 {self._exported} 个span")
+
+
+# ============ 工厂函数 ============
+
+_exporter_instance: Optional[JsonlSpanExporter] = None
+_exporter_checked = False
+
+def get_span_exporter() -> Optional[JsonlSpanExporter]:
+    """
+    获取span导出器实例（单例模式）
+    TRACE_EXPORT_ENABLED=false（默认）时返回None
+    """
+    global _exporter_instance, _exporter_checked
+
+    if _exporter_checked:
+        return _exporter_instance
+    _exporter_checked = True
+
+    if os.getenv('TRACE_EXPORT_ENABLED', 'false').lower() != 'true':
+        return None
+
+    default_path = Path(__file__).parent / "data" / "traces.jsonl"
+    _exporter_instance = JsonlSpanExporter(
+        path=os.getenv('TRACE_EXPORT_PATH', str(default_path)),
+        max_bytes=int(os.getenv('TRACE_EXPORT_MAX_BYTES', 100 * 1024 * 1024)),
+        queue_size=int(os.getenv('TRACE_QUEUE_SIZE', 10000))
+    )
+    return _exporter_instance
+
+
+def shutdown_span_exporter():
+    """写出剩余span并重置导出器实例"""
+    global _exporter_instance, _exporter_checked
+    if _exporter_instance is not None:
+        _exporter_instance.shutdown()
+    _exporter_instance = None
+    _exporter_checked = False
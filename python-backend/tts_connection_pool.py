@@ -0,0 +1,178 @@
+"""
+TTS WebSocket连接池
+WebSocketTTSProvider 每次合成都新建连接，需要TLS握手 + init_session 往返。
+本模块维护一组预热的连接，合成完成后归还复用：
+- 借出前对空闲较久的连接做 ping 健康检查，失败则丢弃重连
+- 空闲超过 idle_timeout 的连接自动关闭
+- 会话中途出错（包括接收超时）的连接直接关闭，不再归还：连接上可能还有该会话未读完的数据
+
+TTS协议的会话没有会话ID，无法在一条连接上并行多个会话，
+因此每条连接同一时间只承载一个会话，会话结束后由下一个会话顺序复用。
+
+max_size 只限制保留的空闲连接数：并发会话超过池大小时临时新建连接（溢出连接），
+用完后池满则关闭。同时打开的连接总数由 max_connections 限制，
+达到上限时等待其他会话归还，超过 acquire_timeout 抛出 TTSPoolExhaustedError。
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+# 空闲超过该秒数的连接在借出前先 ping 检查
+HEALTH_CHECK_AFTER = 15
+
+
+@dataclass
+class _IdleConnection:
+    websocket: Any
+    idle_since: float
+
+
+class TTSPoolExhaustedError(TimeoutError):
+    """等待TTS连接超时（同时打开的连接数已达上限）"""
+    pass
+
+
+def _is_open(websocket) -> bool:
+    state = getattr(websocket, "state", None)
+    return state is not None and state.name == "OPEN"
+
+
+class TTSConnectionPool:
+    """WebSocket连接池"""
+
+    def __init__(self, server_url: str, max_size: int = 4, idle_timeout: float = 60.0,
+                 connect_timeout: float = 10.0, ping_timeout: float = 5.0,
+                 max_connections: int = 32, acquire_timeout: float = 30.0):
+        self.server_url = server_url
+        self.max_size = max_size
+        self.max_connections = max(max_connections, max_size)
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.ping_timeout = ping_timeout
+        self.acquire_timeout = acquire_timeout
+
+        self._idle: List[_IdleConnection] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_use = 0
+        self._waiting = 0
+
+        # 统计数据
+        self._connects = 0
+        self._reuses = 0
+        self._discards = 0
+        self._overflow_connects = 0
+        self._acquire_timeouts = 0
+
+    async def _connect(self):
+        import websockets
+        websocket = await asyncio.wait_for(websockets.connect(self.server_url), timeout=self.connect_timeout)
+        self._connects += 1
+        return websocket
+
+    async def _healthy(self, idle: _IdleConnection) -> bool:
+        """检查空闲连接是否仍可用"""
+        if not _is_open(idle.websocket):
+            return False
+        if time.time() - idle.idle_since < HEALTH_CHECK_AFTER:
+            return True
+        try:
+            pong = await idle.websocket.ping()
+            await asyncio.wait_for(pong, timeout=self.ping_timeout)
+            return True
+        except Exception:
+            return False
+
+    async def _close(self, websocket):
+        self._discards += 1
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    async def _evict_idle(self):
+        """关闭空闲超时的连接"""
+        now = time.time()
+        expired = [idle for idle in self._idle if now - idle.idle_since > self.idle_timeout]
+        self._idle = [idle for idle in self._idle if now - idle.idle_since <= self.idle_timeout]
+        for idle in expired:
+            await self._close(idle.websocket)
+
+    async def _acquire(self, fresh: bool = False):
+        await self._evict_idle()
+        # 优先使用最近归还的连接（fresh 时跳过，直接新建）
+        while self._idle and not fresh:
+            idle = self._idle.pop()
+            if await self._healthy(idle):
+                self._reuses += 1
+                return idle.websocket, True
+            await self._close(idle.websocket)
+        if self._in_use > self.max_size:
+            # 超出池大小的并发会话使用临时连接
+            self._overflow_connects += 1
+        return await self._connect(), False
+
+    @asynccontextmanager
+    async def connection(self, fresh: bool = False):
+        """
+        借出一条连接，yield (websocket, reused)
+        正常退出时归还连接（空闲连接已满时关闭），异常退出时关闭连接
+
+        Args:
+            fresh: 不复用空闲连接，新建一条（复用的连接出错后重试时使用）
+
+        Raises:
+            TTSPoolExhaustedError: 连接数已达 max_connections 且 acquire_timeout 内无连接归还
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_connections)
+
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._acquire_timeouts += 1
+            raise TTSPoolExhaustedError(
+                f"TTS连接数已达上限 {self.max_connections}，等待 {self.acquire_timeout} 秒仍无可用连接"
+            )
+        finally:
+            self._waiting -= 1
+
+        self._in_use += 1
+        try:
+            websocket, reused = await self._acquire(fresh)
+            try:
+                yield websocket, reused
+            except BaseException:
+                await self._close(websocket)
+                raise
+            if _is_open(websocket) and len(self._idle) < self.max_size:
+                self._idle.append(_IdleConnection(websocket, time.time()))
+            else:
+                await self._close(websocket)
+        finally:
+            self._in_use -= 1
+            self._slots.release()
+
+    async def close_all(self):
+        """关闭所有空闲连接"""
+        idle, self._idle = self._idle, []
+        for item in idle:
+            await self._close(item.websocket)
+
+    def get_stats(self) -> dict:
+        """获取连接池状态"""
+        return {
+            "max_size": self.max_size,
+            "max_connections": self.max_connections,
+            "idle": len(self._idle),
+            "in_use": self._in_use,
+            "waiting": self._waiting,
+            "connects": self._connects,
+            "overflow_connects": self._overflow_connects,
+            "acquire_timeouts": self._acquire_timeouts,
+            "reuses": self._reuses,
+            "discards": self._discards,
+        }
@@ -0,0 +1,221 @@
+"""
+上游调用重试模块
+即梦SDK的任何异常或非10000的业务码都会让整个生成请求失败，调用方只能从头重来，
+而上游可能已经接受了任务。本模块对错误分类，只重试失败的那一步（提交或查询），
+查询失败时继续使用已有的 task_id，不会因为一次查询抖动丢掉已经生成了几十秒的任务。
+
+错误分类：
+- throttle: 上游限流（50429 QPS超限 / 50430 并发超限），请求被拒绝，退避后重试
+- server: 上游5xx / 内部错误（505xx），只重试查询；提交时上游可能已接受任务，重试会重复创建并计费
+- network: 网络错误；查询可直接重试，提交只在连接未建立时重试（已发出的提交可能已被接受）
+- business: 参数错误、内容审核不通过等，不重试
+
+非幂等的调用（提交任务）只重试 throttle 和确认连接未建立的 network 错误。
+
+SDK把所有错误都包装成 Exception(str)（非200响应时消息为响应体），因此按异常消息中的错误码和关键字分类。
+
+通过环境变量配置：
+- UPSTREAM_RETRY_MAX_ATTEMPTS: 每一步最多尝试次数（默认4）
+- UPSTREAM_RETRY_BASE_DELAY: 退避基础秒数（默认0.5，限流错误加倍）
+- UPSTREAM_RETRY_MAX_DELAY: 单次退避最长秒数（默认8）
+"""
+
+import os
+import asyncio
+import random
+import re
+from typing import Awaitable, Callable, Dict, Optional
+
+from app_logging import get_logger
+
+logger = get_logger("upstream_retry")
+
+# 即梦限流错误码
+THROTTLE_CODES = {50429, 50430}
+
+# 可重试的错误在重试耗尽后返回给前端的HTTP状态码（业务错误沿用调用方原有的状态码）
+ERROR_HTTP_STATUS = {
+    "throttle": 429,
+    "server": 502,
+    "network": 502,
+}
+
+_CODE_PATTERN = re.compile(r'"(?:code|status)"\s*:\s*(\d{5})')
+_SERVER_ERROR_PATTERN = re.compile(r'InternalError|ServiceUnavailable|Bad Gateway|Service Unavailable|Gateway Time-?out')
+_NETWORK_ERROR_PATTERN = re.compile(
+    r'Max retries exceeded|Connection aborted|Connection reset|RemoteDisconnected|Read timed out|'
+    r'timed out|ConnectTimeout|NewConnectionError|Failed to establish|NameResolutionError|SSLError'
+)
+# 连接尚未建立的网络错误：请求没有发出，提交也可以安全重试
+_CONNECT_ERROR_PATTERN = re.compile(
+    r'NewConnectionError|ConnectTimeout|Failed to establish|NameResolutionError|Name or service not known'
+)
+
+
+def classify_code(code: int) -> str:
+    """根据即梦错误码分类"""
+    if code in THROTTLE_CODES:
+        return "throttle"
+    if 50500 <= code < 50600:
+        return "server"
+    return "business"
+
+
+def classify_response(resp: dict) -> Optional[str]:
+    """分类上游响应，成功时返回None"""
+    metadata_error = resp.get('ResponseMetadata', {}).get('Error')
+    if metadata_error:
+        if _SERVER_ERROR_PATTERN.search(str(metadata_error.get('Code', ''))):
+            return "server"
+        if 'Limit' in str(metadata_error.get('Code', '')):
+            return "throttle"
+        return "business"
+
+    if 'code' not in resp:
+        return None
+    try:
+        code = int(resp['code'])
+    except (TypeError, ValueError):
+        # 无法解析的错误码（null、非数字）按业务错误处理，不重试
+        return "business"
+    if code and code != 10000:
+        return classify_code(code)
+    return None
+
+
+def classify_exception(error: BaseException) -> str:
+    """分类SDK调用抛出的异常"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return "network"
+    message = str(error)
+    match = _CODE_PATTERN.search(message)
+    if match:
+        return classify_code(int(match.group(1)))
+    if _SERVER_ERROR_PATTERN.search(message):
+        return "server"
+    if _NETWORK_ERROR_PATTERN.search(message):
+        return "network"
+    return "business"
+
+
+def is_connect_error(error: BaseException) -> bool:
+    """连接未建立（请求未发出）的网络错误"""
+    return isinstance(error, ConnectionRefusedError) or bool(_CONNECT_ERROR_PATTERN.search(str(error)))
+
+
+def is_retryable(category: str, error: Optional[BaseException], idempotent: bool = True) -> bool:
+    """该分类的错误是否可重试；非幂等调用只重试限流和连接未建立的网络错误"""
+    if category == "throttle":
+        return True
+    if idempotent:
+        return category in ("server", "network")
+    return category == "network" and error is not None and is_connect_error(error)
+
+
+class RetryPolicy:
+    """按错误分类、带随机抖动的指数退避重试"""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        # 统计数据（按步骤）
+        self._calls: Dict[str, int] = {}
+        self._retries: Dict[str, Dict[str, int]] = {}
+        self._recovered: Dict[str, int] = {}
+        self._gave_up: Dict[str, int] = {}
+
+        print(f"🔁 [RetryPolicy] 初始化，最多尝试: {max_attempts} 次，退避: {base_delay}s ~ {max_delay}s")
+
+    def backoff(self, attempt: int, category: str) -> float:
+        """第 attempt 次失败后的等待时间（full jitter）"""
+        base = self.base_delay * (2 if category == "throttle" else 1)
+        return random.uniform(0, min(self.max_delay, base * (2 ** (attempt - 1))))
+
+    async def run(self, step: str, fn: Callable[[], Awaitable[dict]],
+                  request_id: str = "", idempotent: bool = True) -> dict:
+        """
+        执行一步上游调用，可重试的错误退避后重试
+
+        Args:
+            step: 步骤名称（submit / query），用于统计和日志
+            fn: 发起一次调用的协程函数
+            idempotent: 重复调用是否安全；提交任务不是幂等的，只重试限流和确定请求未发出的网络错误
+
+        Returns:
+            上游响应；业务错误或重试耗尽时返回最后一次的响应，由调用方按原逻辑处理
+
+        Raises:
+            最后一次调用抛出的异常（不可重试或重试耗尽）
+        """
+        self._calls[step] = self._calls.get(step, 0) + 1
+        attempt = 0
+        while True:
+            attempt += 1
+            error = None
+            resp = None
+            try:
+                resp = await fn()
+                category = classify_response(resp)
+            except Exception as e:
+                error = e
+                category = classify_exception(e)
+
+            if category is None:
+                if attempt > 1:
+                    self._recovered[step] = self._recovered.get(step, 0) + 1
+                return resp
+
+            retryable = is_retryable(category, error, idempotent)
+            if not retryable or attempt >= self.max_attempts:
+                if retryable:
+                    self._gave_up[step] = self._gave_up.get(step, 0) + 1
+                if error is not None:
+                    raise error
+                return resp
+
+            step_retries = self._retries.setdefault(step, {})
+            step_retries[category] = step_retries.get(category, 0) + 1
+            delay = self.backoff(attempt, category)
+            logger.warning(f"🔁 [RetryPolicy-{request_id}] {step} 第 {attempt} 次失败 ({category})，{delay:.2f}s 后重试: "
+                           f"{str(error)[:200] if error else resp.get('message')}")
+            await asyncio.sleep(delay)
+
+    def get_stats(self) -> dict:
+        """获取重试统计"""
+        return {
+            "max_attempts": self.max_attempts,
+            "calls": self._calls,
+            "retries": self._retries,
+            "recovered": self._recovered,
+            "gave_up": self._gave_up,
+        }
+
+
+# ============ 工厂函数 ============
+
+_policy_instance: Optional[RetryPolicy] = None
+
+def get_retry_policy() -> RetryPolicy:
+    """
+    获取重试策略实例（单例模式）
+    通过环境变量 UPSTREAM_RETRY_MAX_ATTEMPTS / UPSTREAM_RETRY_BASE_DELAY / UPSTREAM_RETRY_MAX_DELAY 配置
+    """
+    global _policy_instance
+
+    if _policy_instance is not None:
+        return _policy_instance
+
+    _policy_instance = RetryPolicy(
+        max_attempts=int(os.getenv('UPSTREAM_RETRY_MAX_ATTEMPTS', 4)),
+        base_delay=float(os.getenv('UPSTREAM_RETRY_BASE_DELAY', 0.5)),
+        max_delay=float(os.getenv('UPSTREAM_RETRY_MAX_DELAY', 8))
+    )
+    return _policy_instance
+
+
+def reset_retry_policy():
+    """重置重试策略实例"""
+    global _policy_instance
+    _policy_instance = None
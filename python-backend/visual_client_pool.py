@@ -0,0 +1,173 @@
+"""
+火山引擎视觉服务客户端池
+服务启动时一次性读取并解码AK/SK，创建固定数量的 VisualService 实例并长期复用，
+每个实例持有自己的 requests.Session（keep-alive），避免每张图片都重新建立TCP/TLS连接。
+
+通过环境变量配置：
+- VOLCENGINE_ACCESS_KEY_ID / VOLCENGINE_SECRET_ACCESS_KEY: 密钥（支持Base64编码）
+- VISUAL_CLIENT_POOL_SIZE: 客户端数量（默认与 SDK_EXECUTOR_MAX_WORKERS 相同）
+- VISUAL_CLIENT_CHECKOUT_TIMEOUT: 借出客户端的最长等待秒数（默认30）
+"""
+
+import os
+import base64
+import binascii
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+
+class VisualCredentialsError(RuntimeError):
+    """密钥未配置"""
+    pass
+
+
+def load_visual_credentials() -> Tuple[str, str]:
+    """
+    读取火山引擎密钥
+    密钥可能是Base64编码的，能完整解码为UTF-8文本时使用解码结果，否则使用原始值
+    """
+    access_key = os.getenv('VOLCENGINE_ACCESS_KEY_ID')
+    secret_key = os.getenv('VOLCENGINE_SECRET_ACCESS_KEY')
+
+    if not access_key or not secret_key:
+        raise VisualCredentialsError("未配置VOLCENGINE_ACCESS_KEY_ID或VOLCENGINE_SECRET_ACCESS_KEY")
+
+    try:
+        decoded_access_key = base64.b64decode(access_key, validate=True).decode('utf-8')
+        decoded_secret_key = base64.b64decode(secret_key, validate=True).decode('utf-8')
+        print(f"🔑 [密钥解码] 使用解码后的密钥")
+        access_key = decoded_access_key
+        secret_key = decoded_secret_key
+    except (binascii.Error, UnicodeDecodeError):
+        print(f"🔑 [密钥直接] 使用原始密钥")
+
+    return access_key.strip(), secret_key.strip()
+
+
+def _create_client(access_key: str, secret_key: str):
+    """创建独立的 VisualService 实例"""
+    from volcengine.visual.VisualService import VisualService
+    from requests.adapters import HTTPAdapter
+
+    # VisualService.__new__ 是进程级单例，且每次 __init__ 都会替换 session；
+    # 池中每个客户端需要独立的 session，因此绕过单例直接构造
+    client = object.__new__(VisualService)
+    VisualService.__init__(client)
+    client.set_ak(access_key)
+    client.set_sk(secret_key)
+
+    # 每个客户端同一时间只被一个线程使用，保留少量keep-alive连接即可
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+    client.session.mount("https://", adapter)
+    client.session.mount("http://", adapter)
+    return client
+
+
+class VisualClientPool:
+    """
+    线程安全的 VisualService 客户端池
+    requests.Session 不保证线程安全，因此客户端以独占方式借出，用完归还
+    """
+
+    def __init__(self, size: int, access_key: str, secret_key: str, checkout_timeout: float = 30.0):
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+
+        # LIFO：优先复用最近用过的客户端，其连接更可能仍然存活
+        self._clients: "queue.LifoQueue" = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            self._clients.put(_create_client(access_key, secret_key))
+
+        self._lock = threading.Lock()
+        self._checkouts = 0
+        self._waits = 0
+
+        print(f"🔌 [VisualClientPool] 初始化，客户端数: {size}")
+
+    @contextmanager
+    def checkout(self):
+        """借出一个客户端（在SDK执行器线程中调用）"""
+        try:
+            client = self._clients.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self._waits += 1
+            try:
+                client = self._clients.get(timeout=self.checkout_timeout)
+            except queue.Empty:
+                raise TimeoutError(f"等待VisualService客户端超时 ({self.checkout_timeout}s)")
+
+        with self._lock:
+            self._checkouts += 1
+        try:
+            yield client
+        finally:
+            self._clients.put(client)
+
+    def get_stats(self) -> dict:
+        """获取客户端池状态"""
+        with self._lock:
+            return {
+                "size": self.size,
+                "available": self._clients.qsize(),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+            }
+
+    def close(self):
+        """关闭所有客户端的连接"""
+        while True:
+            try:
+                client = self._clients.get_nowait()
+            except queue.Empty:
+                break
+            client.session.close()
+        print(f"🔌 [VisualClientPool] 已关闭")
+
+
+# ============ 工厂函数 ============
+
+_pool_instance: Optional[VisualClientPool] = None
+_pool_lock = threading.Lock()
+
+def get_visual_client_pool() -> VisualClientPool:
+    """
+    获取客户端池实例（单例模式）
+    首次调用时读取密钥并创建所有客户端，之后直接复用
+
+    Raises:
+        VisualCredentialsError: 密钥未配置
+    """
+    global _pool_instance
+
+    if _pool_instance is not None:
+        return _pool_instance
+
+    with _pool_lock:
+        if _pool_instance is None:
+            access_key, secret_key = load_visual_credentials()
+            default_size = os.getenv('SDK_EXECUTOR_MAX_WORKERS', 16)
+            _pool_instance = VisualClientPool(
+                size=int(os.getenv('VISUAL_CLIENT_POOL_SIZE', default_size)),
+                access_key=access_key,
+                secret_key=secret_key,
+                checkout_timeout=float(os.getenv('VISUAL_CLIENT_CHECKOUT_TIMEOUT', 30))
+            )
+
+    return _pool_instance
+
+
+def get_visual_client_pool_stats() -> Optional[dict]:
+    """获取客户端池状态，尚未创建时返回None"""
+    return _pool_instance.get_stats() if _pool_instance is not None else None
+
+
+def reset_visual_client_pool():
+    """关闭并重置客户端池（用于密钥轮换）"""
+    global _pool_instance
+    with _pool_lock:
+        if _pool_instance is not None:
+            _pool_instance.close()
+            _pool_instance = None